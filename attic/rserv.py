@@ -25,39 +25,81 @@ basic search functionality for JSON documents.
 
 import os
 import json
-import time
 import argparse
+import atexit
 import fcntl
+import heapq
+import importlib.util
 import logging
-import subprocess
+import queue
+import stat
 import sys
-from functools import cmp_to_key
-from datetime import datetime
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+from operator import itemgetter
 
 # Version constant
 VERSION = "0.2.1"
 
-# Check and install required dependencies
-required_packages = ['flask', 'python-dotenv']
-installed_packages = subprocess.check_output([sys.executable, '-m', 'pip', 'freeze']).decode('utf-8').split('\n')
-installed_packages = [package.split('==')[0].lower() for package in installed_packages if package]
-
-for package in required_packages:
-    if package.lower() not in installed_packages:
-        print(f"Installing required package: {package}")
-        subprocess.check_call([sys.executable, '-m', 'pip', 'install', package])
-
-from flask import Flask, request, jsonify
-from dotenv import load_dotenv
-
-# Set up logging with custom timestamp format
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
+try:
+    from flask import Flask, request
+    from dotenv import load_dotenv
+    from cachetools import TTLCache
+except ImportError as e:
+    sys.exit(f"Missing dependency: {e.name}. Install with: pip install flask python-dotenv cachetools")
+
+# Prefer orjson for parsing and serializing documents; fall back to the stdlib
+try:
+    import orjson
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except ImportError:
+    orjson = None
+    _loads = json.loads
+
+    def _dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+
+# ciso8601 parses ISO 8601 timestamps considerably faster when it is available
+try:
+    from ciso8601 import parse_datetime
+except ImportError:
+    parse_datetime = datetime.fromisoformat
+
+# Set up logging with custom timestamp format. Records are handed to a queue
+# and written by a listener thread so request handlers never block on output.
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(logging.Formatter(
+    '%(asctime)s - %(levelname)s - %(message)s',
     datefmt='%Y-%m-%d %H:%M:%S'  # Custom date format
-)
+))
+log_queue = queue.Queue(-1)
+log_queue_handler = QueueHandler(log_queue)
+log_listener = QueueListener(log_queue, log_handler)
+logging.basicConfig(level=logging.INFO, handlers=[log_queue_handler])
+log_listener.start()
+atexit.register(log_listener.stop)
+
+def restart_log_listener(server=None, worker=None):
+    # The listener thread does not survive a fork, and the queue's lock may
+    # have been held by it at the time; a forked worker gets a fresh queue
+    # and listener of its own. Used as gunicorn's post_fork hook.
+    global log_queue, log_listener
+    atexit.unregister(log_listener.stop)
+    log_queue = queue.Queue(-1)
+    log_queue_handler.queue = log_queue
+    log_listener = QueueListener(log_queue, log_handler)
+    log_listener.start()
+    atexit.register(log_listener.stop)
 logger = logging.getLogger(__name__)
 
+# Werkzeug's per-request access log is only useful while debugging
+logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
 app = Flask(__name__)
 
 BASE_DIR = 'data'
@@ -74,11 +116,86 @@ DEFAULT_CONFIG = {
     'cache_ttl': 300,
     'default_page_size': 10,
     'schema_name': DEFAULT_SCHEMA,
-    'cascading_delete': False
+    'cascading_delete': False,
+    'server': 'flask',
+    'threads': 32,
+    'workers': 1,
+    'quiet': False,
+    'fsync_writes': True
 }
 
-# Simple in-memory cache
-cache = {}
+class ResultCache(TTLCache):
+    # Evicted and expired entries leave cache_keys too, so the per-entity key
+    # sets never outgrow the cache. Runs inside cache operations, which are
+    # made with cache_lock held.
+    def popitem(self):
+        key, value = super().popitem()
+        forget_cache_key(key)
+        return key, value
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        for key, _ in expired:
+            forget_cache_key(key)
+        return expired
+
+def forget_cache_key(key):
+    keys = cache_keys.get(key[0])
+    if keys is not None:
+        keys.discard(key)
+        if not keys:
+            del cache_keys[key[0]]
+
+# Bounded in-memory cache; expired and least recently used entries are evicted
+CACHE_MAXSIZE = 10000
+cache = ResultCache(maxsize=CACHE_MAXSIZE, ttl=DEFAULT_CONFIG['cache_ttl'])
+# TTLCache is not thread-safe (a get may expire entries), so it and
+# cache_keys are only touched under this lock
+cache_lock = threading.Lock()
+
+# Settings read on every request, bound once from config at startup
+DATA_DIR = os.path.join(BASE_DIR, DEFAULT_CONFIG['schema_name'])
+PATCH_NULL = DEFAULT_CONFIG['patch_null']
+DEFAULT_PAGE_SIZE = DEFAULT_CONFIG['default_page_size']
+CASCADING_DELETE = DEFAULT_CONFIG['cascading_delete']
+FSYNC_WRITES = DEFAULT_CONFIG['fsync_writes']
+
+# In-memory entity index (entity -> {id: document}), loaded lazily from disk
+# and kept in step with every write. The version counter is bumped on each
+# mutation so cached list/search pages of the entity stop matching.
+entity_index = {}
+entity_versions = {}
+
+# Keys of the cached results of each entity (entity -> set of cache keys)
+cache_keys = {}
+
+# Foreign key relations taken from the loaded schemas, plus a secondary index
+# over the indexed documents' foreign key values (entity -> field -> value -> ids)
+reverse_fk = {}
+fk_fields = {}
+fk_index = {}
+
+# Search indexes (entity -> field -> FieldIndex), built on the first search of
+# a field and maintained alongside the entity index afterwards
+field_indexes = {}
+
+# Guards building and mutating entity_index, fk_index and field_indexes, and
+# reads that iterate over them. Reentrant, since index_entity and
+# cascade_delete reach ensure_loaded and unindex_entity while holding it.
+index_lock = threading.RLock()
+
+# IDs are handed out from blocks reserved in _next_id.txt, so only one create
+# in ID_BLOCK_SIZE touches the file. Blocks never overlap, even across
+# processes, but unused IDs of a block are skipped after a restart.
+ID_BLOCK_SIZE = 100
+id_blocks = {}
+id_lock = threading.Lock()
+
+# Pages ending at or below this position are served from a partial sort
+TOP_K_THRESHOLD = 1000
+
+# Worker pool for directory scans; file reads and orjson parsing release the GIL
+SCAN_POOL = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4))
 
 def print_startup_notice():
     notice = f"""
@@ -100,6 +217,18 @@ def print_startup_notice():
     """
     print(notice)
 
+def print_configuration(config):
+    print(f"Server configuration:")
+    print(f"  Host: {config['host']}")
+    print(f"  Port: {config['port']}")
+    print(f"  PATCH null handling: {config['patch_null']}")
+    print(f"  Cache TTL: {config['cache_ttl']} seconds")
+    print(f"  Default page size: {config['default_page_size']}")
+    print(f"  Schema: {config['schema_name']} {'(default)' if config['schema_name'] == DEFAULT_SCHEMA else ''}")
+    print(f"  Cascading Delete: {'Enabled' if config['cascading_delete'] else 'Disabled'}")
+    print(f"  Fsync writes: {'Enabled' if config['fsync_writes'] else 'Disabled'}")
+    print(f"  Server: {config['server']} ({config['workers']} workers, {config['threads']} threads)")
+
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Entity Management System')
     parser.add_argument('--config', help='Path to the configuration file')
@@ -113,20 +242,28 @@ def parse_arguments():
     parser.add_argument('--list-schemas', action='store_true', help='List available schemas')
     parser.add_argument('--cascading-delete', action='store_true',
                         help='Enable cascading deletes for referential integrity')
+    parser.add_argument('--server', choices=['flask', 'waitress', 'gunicorn'],
+                        help='WSGI server to run the application with')
+    parser.add_argument('--threads', type=int, help='Number of request handling threads')
+    parser.add_argument('--workers', type=int, help='Number of worker processes (gunicorn only; capped at 1, as the indexes are per process)')
+    parser.add_argument('--no-fsync', action='store_true',
+                        help='Do not fsync entity files after writing them')
+    parser.add_argument('--quiet', action='store_true',
+                        help='Skip the startup banner and configuration summary')
     return parser.parse_args()
 
 def load_config_file(config_file_path=None):
     if config_file_path and os.path.exists(config_file_path):
         # Load the specified configuration file
         load_dotenv(config_file_path, override=True)
-        logger.info(f"Loaded configuration from: {config_file_path}")
+        logger.info("Loaded configuration from: %s", config_file_path)
     else:
         # Check for fallback configuration files in order
         fallback_files = ['.env', '.rserv.conf', 'rserv.conf']
         for file in fallback_files:
             if os.path.exists(file):
                 load_dotenv(file, override=True)
-                logger.info(f"Loaded configuration from: {file}")
+                logger.info("Loaded configuration from: %s", file)
                 break
         else:
             logger.info("No configuration file found. Using default values.")
@@ -148,6 +285,11 @@ def get_config():
     config['default_page_size'] = int(os.getenv('DEFAULT_PAGE_SIZE', config['default_page_size']))
     config['schema_name'] = os.getenv('SCHEMA', config['schema_name'])
     config['cascading_delete'] = os.getenv('CASCADING_DELETE', '').lower() == 'true'
+    config['server'] = os.getenv('SERVER', config['server'])
+    config['threads'] = int(os.getenv('THREADS', config['threads']))
+    config['workers'] = int(os.getenv('WORKERS', config['workers']))
+    config['quiet'] = os.getenv('QUIET', '').lower() == 'true'
+    config['fsync_writes'] = os.getenv('FSYNC_WRITES', 'true').lower() != 'false'
 
     # Update config with command line arguments (if provided)
     if args.patch_null:
@@ -164,78 +306,157 @@ def get_config():
         config['schema_name'] = args.schema
     if args.cascading_delete:
         config['cascading_delete'] = True
+    if args.server:
+        config['server'] = args.server
+    if args.threads:
+        config['threads'] = args.threads
+    if args.workers:
+        config['workers'] = args.workers
+    if args.quiet:
+        config['quiet'] = True
+    if args.no_fsync:
+        config['fsync_writes'] = False
     
     # Add the list_schemas option
     config['list_schemas'] = args.list_schemas
 
     return config
 
+# Entity directories already created by this process
+ready_dirs = set()
+
 def get_entity_dir(entity):
-    entity_dir = os.path.join(BASE_DIR, config['schema_name'], entity)
-    os.makedirs(entity_dir, exist_ok=True)
+    entity_dir = os.path.join(DATA_DIR, entity)
+    if entity_dir not in ready_dirs:
+        os.makedirs(entity_dir, exist_ok=True)
+        ready_dirs.add(entity_dir)
     return entity_dir
 
+@lru_cache(maxsize=1024)
+def safe_entity_name(entity):
+    return ''.join(c for c in entity if c.isalnum() or c in ('_', '-'))
+
 def get_entity_file(entity, id):
     # Sanitize entity and id to prevent path traversal
-    safe_entity = ''.join(c for c in entity if c.isalnum() or c in ('_', '-'))
+    safe_entity = safe_entity_name(entity)
     safe_id = str(id).replace('/', '').replace('\\', '')
     return os.path.join(get_entity_dir(safe_entity), f"{safe_id}.json")
 
-def get_next_id(entity):
+def reserve_id_block(entity):
     entity_dir = get_entity_dir(entity)
     id_file = os.path.join(entity_dir, '_next_id.txt')
+    # Never hand out an id below one already on disk (e.g. stored via /save/<id>)
+    documents = ensure_loaded(entity)
+    with index_lock:
+        max_indexed_id = max((i for i in documents if isinstance(i, int)), default=0)
     
     with open(id_file, 'a+') as f:
         fcntl.flock(f, fcntl.LOCK_EX)  # Exclusive lock
         try:
             f.seek(0)
             content = f.read().strip()
-            if content:
-                next_id = int(content) + 1
-            else:
-                next_id = 1
+            first_id = max(int(content) if content else 0, max_indexed_id) + 1
+            last_id = first_id + ID_BLOCK_SIZE - 1
             f.seek(0)
             f.truncate()
-            f.write(str(next_id))
-            return next_id
+            f.write(str(last_id))
+            return first_id, last_id
         finally:
             fcntl.flock(f, fcntl.LOCK_UN)  # Release the lock
 
+def get_next_id(entity):
+    documents = ensure_loaded(entity)
+    with id_lock:
+        while True:
+            block = id_blocks.get(entity)
+            if block is None or block[0] > block[1]:
+                block = id_blocks[entity] = list(reserve_id_block(entity))
+            next_id = block[0]
+            block[0] += 1
+            if next_id not in documents:
+                return next_id
+
+def release_id_blocks():
+    # Hand the unused tail of each block back, unless another process has
+    # reserved past it in the meantime
+    with id_lock:
+        for entity, (next_id, last_id) in id_blocks.items():
+            if next_id > last_id:
+                continue
+            id_file = os.path.join(get_entity_dir(entity), '_next_id.txt')
+            with open(id_file, 'a+') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    if f.read().strip() == str(last_id):
+                        f.seek(0)
+                        f.truncate()
+                        f.write(str(next_id - 1))
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        id_blocks.clear()
+
 def get_pagination_params():
     page = max(1, request.args.get('page', 1, type=int))
-    per_page = max(1, min(100, request.args.get('per_page', config['default_page_size'], type=int)))
+    per_page = max(1, min(100, request.args.get('per_page', DEFAULT_PAGE_SIZE, type=int)))
     return page, per_page
 
 def get_sorting_params():
     sort_params = request.args.get('sort', 'id:asc')
-    return [param.split(':') for param in sort_params.split(',')]
+    return tuple(tuple(param.split(':')) for param in sort_params.split(','))
+
+class Reversor:
+    # Inverts the ordering of the wrapped key for descending sort fields
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
 
-def type_aware_compare(a, b):
-    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
-        return (a > b) - (a < b)
-    elif isinstance(a, str) and isinstance(b, str):
-        return (a.lower() > b.lower()) - (a.lower() < b.lower())
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+def type_aware_key(value):
+    # Numbers sort numerically, strings case-insensitively, anything else by its string form
+    if isinstance(value, (int, float)):
+        return (0, value)
+    elif isinstance(value, str):
+        return (1, value.lower())
     else:
-        # Handle mixed types by converting to strings
-        return (str(a) > str(b)) - (str(a) < str(b))
-
-def multi_field_comparator(sort_fields):
-    def compare(a, b):
-        for field, order in sort_fields:
-            a_val = a.get(field)
-            b_val = b.get(field)
-            comp = type_aware_compare(a_val, b_val)
-            if comp != 0:
-                return comp if order == 'asc' else -comp
-        return 0
-    return compare
-
-def sort_entities(entities, sort_params):
-    comparator = multi_field_comparator(sort_params)
-    return sorted(entities, key=cmp_to_key(comparator))
-
-def paginate_results(results, page, per_page):
-    total = len(results)
+        return (2, str(value))
+
+def multi_field_key(sort_fields):
+    fields = [field for field, _ in sort_fields]
+    descending = [order != 'asc' for _, order in sort_fields]
+    # itemgetter fetches all sort fields in one C call; entities missing a
+    # field fall back to dict.get so they sort as None like before
+    getter = itemgetter(*fields)
+    single_field = len(fields) == 1
+
+    def key(entity):
+        try:
+            values = getter(entity)
+            if single_field:
+                values = (values,)
+        except KeyError:
+            values = [entity.get(field) for field in fields]
+        return tuple(Reversor(type_aware_key(value)) if desc else type_aware_key(value)
+                     for value, desc in zip(values, descending))
+    return key
+
+def sort_entities(entities, sort_params, limit=None):
+    key = multi_field_key(sort_params)
+    if limit is not None and limit <= TOP_K_THRESHOLD and limit * 4 < len(entities):
+        # Only the first `limit` entries are needed, so avoid sorting the rest.
+        # Close to the full length a plain sort is cheaper than the heap.
+        return heapq.nsmallest(limit, entities, key=key)
+    return sorted(entities, key=key)
+
+def paginate_results(results, page, per_page, total=None):
+    if total is None:
+        total = len(results)
     total_pages = max(1, (total + per_page - 1) // per_page)
     start = (page - 1) * per_page
     end = start + per_page
@@ -247,15 +468,88 @@ def paginate_results(results, page, per_page):
         "total_pages": total_pages
     }
 
+def json_response(obj):
+    return app.response_class(_dumps(obj), mimetype='application/json')
+
+def get_request_data():
+    return get_request_body()[1]
+
+def get_request_body():
+    # Returns the raw request bytes alongside the parsed document
+    raw = request.get_data(cache=False)
+    if not raw:
+        return raw, None
+    try:
+        return raw, _loads(raw)
+    except ValueError:
+        return raw, None
+
+def with_id(raw, data, id):
+    # Splice the id into the request bytes instead of re-serializing the
+    # document. Only done when orjson parsed it, so the bytes are known to be
+    # strict JSON, and when the object has no id of its own to replace.
+    if orjson is not None and 'id' not in data:
+        body = raw.strip()
+        if body[:1] == b'{' and body[-1:] == b'}':
+            head = b'{"id":%d' % id
+            return head + b'}' if not data else head + b',' + body[1:]
+    data['id'] = id
+    return _dumps(data)
+
+def read_file_bytes(file_path):
+    # Unbuffered read sized from fstat: open, fstat, read, close and nothing
+    # else. Files are only ever replaced by rename, so the size fstat reports
+    # holds for the open file and one read that returns it is complete.
+    fd = os.open(file_path, os.O_RDONLY)
+    try:
+        size = os.fstat(fd).st_size
+        data = os.read(fd, size or 4096)
+        if size and len(data) >= size:
+            return data
+        # Short read, or a file that reports no size: read until EOF
+        chunks = [data]
+        while data:
+            data = os.read(fd, 65536)
+            chunks.append(data)
+        return b''.join(chunks)
+    finally:
+        os.close(fd)
+
+# mkstemp creates files as 0600; written files get the mode open() would give
+# them instead. The umask can only be read by setting it, so it is read once.
+_umask = os.umask(0)
+os.umask(_umask)
+DEFAULT_FILE_MODE = 0o666 & ~_umask
+
+def atomic_write(file_path, data_bytes):
+    # Write to a temporary file in the same directory, then swap it into place.
+    # A replaced file keeps its mode.
+    try:
+        mode = stat.S_IMODE(os.stat(file_path).st_mode)
+    except FileNotFoundError:
+        mode = DEFAULT_FILE_MODE
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            os.fchmod(f.fileno(), mode)
+            f.write(data_bytes)
+            if FSYNC_WRITES:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
 def load_entity(file_path):
     try:
-        with open(file_path, 'r') as f:
-            return json.load(f)
+        return _loads(read_file_bytes(file_path))
     except json.JSONDecodeError as e:
-        logger.error(f"Failed to decode JSON from file: {file_path}. Error: {str(e)}")
+        logger.error("Failed to decode JSON from file: %s. Error: %s", file_path, e)
         raise ValueError(f"Invalid JSON in file: {file_path}")
     except IOError as e:
-        logger.error(f"Failed to read file: {file_path}. Error: {str(e)}")
+        logger.error("Failed to read file: %s. Error: %s", file_path, e)
         raise IOError(f"Failed to read file: {file_path}")
 
 def field_matches(entity_value, query_value):
@@ -270,55 +564,236 @@ def field_matches(entity_value, query_value):
             return False
     return False
 
+def scan_entities(entity):
+    with os.scandir(get_entity_dir(entity)) as it:
+        entries = [de for de in it if de.name.endswith('.json') and de.is_file(follow_symlinks=False)]
+    futures = [SCAN_POOL.submit(load_entity, de.path) for de in entries]
+    entities = {}
+    for de, future in zip(entries, futures):
+        try:
+            data = future.result()
+            if data:
+                stem = de.name[:-len('.json')]
+                entities[int(stem) if stem.isdigit() else stem] = data
+        except (ValueError, IOError) as e:
+            logger.error("Error loading entity from %s: %s", de.path, e)
+    return entities
+
+def update_fk_index(entity, id, old_data, new_data):
+    fields = fk_fields.get(entity)
+    if not fields:
+        return
+    entity_fk_index = fk_index.setdefault(entity, {})
+    for field in fields:
+        values = entity_fk_index.setdefault(field, {})
+        if old_data is not None and isinstance(old_data.get(field), (int, float, str)):
+            ids = values.get(old_data[field])
+            if ids is not None:
+                ids.discard(id)
+        if new_data is not None and isinstance(new_data.get(field), (int, float, str)):
+            values.setdefault(new_data[field], set()).add(id)
+
+def ensure_loaded(entity):
+    documents = entity_index.get(entity)
+    if documents is not None:
+        return documents
+    with index_lock:
+        # Another request may have built it while this one waited
+        documents = entity_index.get(entity)
+        if documents is None:
+            documents = scan_entities(entity)
+            for id, data in documents.items():
+                update_fk_index(entity, id, None, data)
+            entity_index[entity] = documents
+        return documents
+
+def index_entity(entity, id, data):
+    with index_lock:
+        documents = ensure_loaded(entity)
+        update_fk_index(entity, id, documents.get(id), data)
+        update_field_indexes(entity, id, documents.get(id), data)
+        documents[id] = data
+    invalidate_cache(entity)
+
+def unindex_entity(entity, id):
+    with index_lock:
+        old_data = ensure_loaded(entity).pop(id, None)
+        update_fk_index(entity, id, old_data, None)
+        update_field_indexes(entity, id, old_data, None)
+    invalidate_cache(entity)
+
+def load_entity_index():
+    # Index every entity directory of the active schema up front, so that
+    # the first list/search of each entity does not pay for the scan
+    with os.scandir(DATA_DIR) as it:
+        entities = [de.name for de in it if de.is_dir()]
+    for entity in entities:
+        ensure_loaded(entity)
+    logger.info("Indexed %s entities from %s", len(entities), DATA_DIR)
+
+def entity_exists(entity, id):
+    # Match the id the way its file name would: 5 and "5" refer to the same document
+    key = format(id)
+    return (int(key) if key.isdigit() else key) in ensure_loaded(entity)
+
 def get_all_entities(entity, filter_func=None):
-    entity_dir = get_entity_dir(entity)
-    entities = []
-    for filename in os.listdir(entity_dir):
-        if filename.endswith('.json'):
-            file_path = os.path.join(entity_dir, filename)
+    documents = ensure_loaded(entity)
+    with index_lock:
+        documents = list(documents.values())
+    if filter_func is None:
+        return documents
+    return [data for data in documents if filter_func(data)]
+
+class FieldIndex:
+    # Trigram postings over lowercased string values plus an exact-value map for
+    # numbers; narrows a search to candidates that are then confirmed against
+    # the cached lowercased value (strings) or field_matches (numbers)
+    __slots__ = ('trigrams', 'lowered', 'numbers')
+
+    def __init__(self):
+        self.trigrams = {}
+        self.lowered = {}
+        self.numbers = {}
+
+    @staticmethod
+    def value_trigrams(value):
+        return {value[i:i + 3] for i in range(len(value) - 2)}
+
+    def add(self, id, value):
+        if isinstance(value, str):
+            value_lower = value.lower()
+            self.lowered[id] = value_lower
+            for trigram in self.value_trigrams(value_lower):
+                self.trigrams.setdefault(trigram, set()).add(id)
+        elif isinstance(value, (int, float)):
             try:
-                data = load_entity(file_path)
-                if data and (filter_func is None or filter_func(data)):
-                    entities.append(data)
-            except (ValueError, IOError) as e:
-                logger.error(f"Error loading entity from {file_path}: {str(e)}")
-    return entities
+                self.numbers.setdefault(float(value), set()).add(id)
+            except OverflowError:
+                pass
+
+    def remove(self, id, value):
+        if isinstance(value, str):
+            self.lowered.pop(id, None)
+            for trigram in self.value_trigrams(value.lower()):
+                ids = self.trigrams.get(trigram)
+                if ids is not None:
+                    ids.discard(id)
+        elif isinstance(value, (int, float)):
+            try:
+                ids = self.numbers.get(float(value))
+            except OverflowError:
+                return
+            if ids is not None:
+                ids.discard(id)
+
+    def candidates(self, query, query_lower):
+        if len(query_lower) >= 3:
+            postings = [self.trigrams.get(trigram, set()) for trigram in self.value_trigrams(query_lower)]
+            postings.sort(key=len)
+            ids = set(postings[0]).intersection(*postings[1:])
+        else:
+            ids = set(self.lowered)
+        try:
+            ids |= self.numbers.get(float(query), set())
+        except ValueError:
+            pass
+        return ids
+
+def get_field_index(entity, field):
+    index = field_indexes.get(entity, {}).get(field)
+    if index is not None:
+        return index
+    with index_lock:
+        entity_field_indexes = field_indexes.setdefault(entity, {})
+        index = entity_field_indexes.get(field)
+        if index is None:
+            index = FieldIndex()
+            for id, data in ensure_loaded(entity).items():
+                if field in data:
+                    index.add(id, data[field])
+            # Published only once complete, so updates never miss it
+            entity_field_indexes[field] = index
+        return index
+
+def update_field_indexes(entity, id, old_data, new_data):
+    for field, index in field_indexes.get(entity, {}).items():
+        if old_data is not None and field in old_data:
+            index.remove(id, old_data[field])
+        if new_data is not None and field in new_data:
+            index.add(id, new_data[field])
+
+def search_entity_field(entity, field, query):
+    documents = ensure_loaded(entity)
+    index = get_field_index(entity, field)
+    lowered = index.lowered
+    query_lower = query.lower()
+    matches = []
+    with index_lock:
+        candidates = index.candidates(query, query_lower)
+    for id in candidates:
+        data = documents.get(id)
+        if data is None or field not in data:
+            continue
+        value_lower = lowered.get(id)
+        if value_lower is not None:
+            if query_lower in value_lower:
+                matches.append(data)
+        elif field_matches(data[field], query):
+            matches.append(data)
+    return matches
 
 def get_cached_result(cache_key):
-    if cache_key in cache:
-        result, timestamp = cache[cache_key]
-        if time.time() - timestamp < config['cache_ttl']:
-            return result
-    return None
+    with cache_lock:
+        return cache.get(cache_key)
 
 def set_cached_result(cache_key, result):
-    cache[cache_key] = (result, time.time())
+    with cache_lock:
+        cache[cache_key] = result
+        cache_keys.setdefault(cache_key[0], set()).add(cache_key)
+
+def invalidate_cache(entity):
+    # Bumping the version makes in-flight results unreachable; dropping the
+    # entity's entries frees their slots for other entities straight away.
+    # A key added to the set while it is being popped carries the old
+    # version, so missing it here leaves nothing reachable behind
+    entity_versions[entity] = entity_versions.get(entity, 0) + 1
+    with cache_lock:
+        for key in cache_keys.pop(entity, ()):
+            cache.pop(key, None)
 
 def handle_null_values(data):
-    if config['patch_null'] == 'delete':
+    if PATCH_NULL == 'delete':
         return {k: v for k, v in data.items() if v is not None}
     return data  # 'store' behavior: keep null values
 
 def cascade_delete(entity, id):
     deleted_docs = []
+    for dependent_entity, field in reverse_fk.get(entity, []):
+        ensure_loaded(dependent_entity)
+        with index_lock:
+            dependent_ids = list(fk_index.get(dependent_entity, {}).get(field, {}).get(id, ()))
+        for dependent_id in dependent_ids:
+            file_path = get_entity_file(dependent_entity, dependent_id)
+            try:
+                os.remove(file_path)
+            except IOError as e:
+                logger.error("Error processing file %s: %s", file_path, e)
+                continue
+            unindex_entity(dependent_entity, dependent_id)
+            deleted_docs.append(f"{dependent_entity}/{dependent_id}")
+            # Recursively delete documents that depend on this one
+            deleted_docs.extend(cascade_delete(dependent_entity, dependent_id))
+    return deleted_docs
+
+def build_fk_relations(schemas):
+    reverse_fk.clear()
+    fk_fields.clear()
+    fk_index.clear()
     for dependent_entity, schema in schemas.items():
         for field, rules in schema.items():
-            if "foreign_key" in rules and rules["foreign_key"]["entity"] == entity:
-                dependent_dir = os.path.join(BASE_DIR, config['schema_name'], dependent_entity)
-                for filename in os.listdir(dependent_dir):
-                    if filename.endswith('.json'):
-                        file_path = os.path.join(dependent_dir, filename)
-                        try:
-                            with open(file_path, 'r') as f:
-                                data = json.load(f)
-                            if data.get(field) == id:
-                                os.remove(file_path)
-                                deleted_docs.append(f"{dependent_entity}/{data['id']}")
-                                # Recursively delete documents that depend on this one
-                                deleted_docs.extend(cascade_delete(dependent_entity, data['id']))
-                        except (json.JSONDecodeError, IOError) as e:
-                            logger.error(f"Error processing file {file_path}: {str(e)}")
-    return deleted_docs
+            if "foreign_key" in rules:
+                reverse_fk.setdefault(rules["foreign_key"]["entity"], []).append((dependent_entity, field))
+                fk_fields.setdefault(dependent_entity, []).append(field)
 
 # Integrated schema loading functions
 def load_schemas(schema_name, base_dir=SCHEMA_DIR):
@@ -329,22 +804,23 @@ def load_schemas(schema_name, base_dir=SCHEMA_DIR):
         if schema_name == DEFAULT_SCHEMA:
             logger.info("No 'default' schema found. Running in schema-less mode.")
         else:
-            logger.warning(f"Schema directory {schema_dir} does not exist.")
+            logger.warning("Schema directory %s does not exist.", schema_dir)
         return schemas
 
-    for filename in os.listdir(schema_dir):
-        if filename.endswith('.json'):
-            entity_name = os.path.splitext(filename)[0]
-            file_path = os.path.join(schema_dir, filename)
+    with os.scandir(schema_dir) as it:
+        for de in it:
+            if not (de.name.endswith('.json') and de.is_file()):
+                continue
+            entity_name = os.path.splitext(de.name)[0]
+            file_path = de.path
             try:
-                with open(file_path, 'r') as f:
-                    schema = json.load(f)
+                schema = _loads(read_file_bytes(file_path))
                 schemas[entity_name] = schema
-                logger.info(f"Loaded schema for entity {entity_name}")
+                logger.info("Loaded schema for entity %s", entity_name)
             except json.JSONDecodeError:
-                logger.error(f"Failed to parse JSON in {file_path}. Skipping this file.")
+                logger.error("Failed to parse JSON in %s. Skipping this file.", file_path)
             except Exception as e:
-                logger.error(f"Error reading {file_path}: {str(e)}")
+                logger.error("Error reading %s: %s", file_path, e)
 
     if schema_name == DEFAULT_SCHEMA and schemas:
         logger.info("'default' schema found and loaded. Schema validation will be enforced.")
@@ -353,10 +829,11 @@ def load_schemas(schema_name, base_dir=SCHEMA_DIR):
 
 def list_available_schemas(base_dir=SCHEMA_DIR):
     if not os.path.exists(base_dir):
-        logger.warning(f"Base schema directory {base_dir} does not exist.")
+        logger.warning("Base schema directory %s does not exist.", base_dir)
         return []
     
-    return [d for d in os.listdir(base_dir) if os.path.isdir(os.path.join(base_dir, d))]
+    with os.scandir(base_dir) as it:
+        return [de.name for de in it if de.is_dir()]
 
 def validate_schema(schema):
     errors = []
@@ -394,150 +871,172 @@ def load_and_validate_schemas(schema_name, base_dir=SCHEMA_DIR):
         is_valid, errors = validate_schema(schema)
         if is_valid:
             validated_schemas[entity] = schema
-            logger.info(f"Schema for entity '{entity}' is valid")
+            logger.info("Schema for entity '%s' is valid", entity)
         else:
-            logger.error(f"Schema for entity '{entity}' is invalid:")
+            logger.error("Schema for entity '%s' is invalid:", entity)
             for error in errors:
-                logger.error(f"  - {error}")
+                logger.error("  - %s", error)
     
     return validated_schemas
 
+def parse_date(value):
+    # Fast path for the canonical YYYY-MM-DD shape; anything else goes through strptime
+    if (isinstance(value, str) and len(value) == 10 and value[4] == '-' and value[7] == '-'
+            and value[:4].isdigit() and value[5:7].isdigit() and value[8:].isdigit()):
+        return date(int(value[:4]), int(value[5:7]), int(value[8:]))
+    return datetime.strptime(value, "%Y-%m-%d")
+
 class DynamicValidator:
+    __slots__ = ('schemas', 'schema_name', 'compiled')
+
     def __init__(self, schemas, schema_name):
         self.schemas = schemas
         self.schema_name = schema_name
+        self.compiled = {entity: self.compile_schema(entity, schema) for entity, schema in schemas.items()}
 
-    def validate(self, entity, data):
-        if entity not in self.schemas:
-            return True, []  # No schema defined, so no validation needed
+    def compile_schema(self, entity, schema):
+        # Generate a straight-line validation function for the schema, so the
+        # rules are interpreted once at load time instead of on every request
+        lines = ["def validate(data):", "    errors = []"]
+        for field, rules in schema.items():
+            lines.append(f"    if {field!r} in data:")
+            lines.append(f"        value = data[{field!r}]")
+            lines.extend("        " + line for line in self.compile_field(field, rules))
+            if rules.get("required", False):
+                lines.append("    else:")
+                lines.append(f"        errors.append({f'Missing required field: {field}'!r})")
+        lines.append("    return errors")
+
+        namespace = {'parse_datetime': parse_datetime, 'parse_date': parse_date,
+                     'entity_exists': entity_exists}
+        exec(compile("\n".join(lines), f"<validator:{entity}>", "exec"), namespace)
+        return namespace['validate']
+
+    def compile_field(self, field, rules):
+        def error(message):
+            return f"    errors.append({message!r})"
+
+        field_type = rules.get("type")
+        lines = []
+        if field_type == "string":
+            lines += ["if not isinstance(value, str):", error(f"Field {field} must be a string")]
+            if "max_length" in rules:
+                lines += [f"elif len(value) > {rules['max_length']!r}:",
+                          error(f"Field {field} exceeds maximum length of {rules['max_length']}")]
+        elif field_type == "integer":
+            lines += ["if not isinstance(value, int):", error(f"Field {field} must be an integer")]
+        elif field_type == "float":
+            lines += ["if not isinstance(value, (int, float)):", error(f"Field {field} must be a number")]
+        elif field_type == "boolean":
+            lines += ["if not isinstance(value, bool):", error(f"Field {field} must be a boolean")]
+        elif field_type == "datetime":
+            lines += ["try:", "    parse_datetime(value)", "except (ValueError, TypeError):",
+                      error(f"Field {field} must be a valid ISO format datetime string")]
+        elif field_type == "date":
+            lines += ["try:", "    parse_date(value)", "except (ValueError, TypeError):",
+                      error(f"Field {field} must be a valid date string in YYYY-MM-DD format")]
+        elif field_type == "json":
+            lines += ["if not isinstance(value, (dict, list)):",
+                      error(f"Field {field} must be a valid JSON object or array")]
 
-        schema = self.schemas[entity]
-        errors = []
+        if "foreign_key" in rules:
+            fk_entity = rules["foreign_key"]["entity"]
+            fk_field = rules["foreign_key"]["field"]
+            message = f"Foreign key constraint failed: {fk_entity} with {fk_field}="
+            lines += [f"if not entity_exists({fk_entity!r}, value):",
+                      f"    errors.append({message!r} + format(value) + ' does not exist')"]
+        return lines or ["pass"]
 
-        for field, rules in schema.items():
-            if rules.get("required", False) and field not in data:
-                errors.append(f"Missing required field: {field}")
-            elif field in data:
-                value = data[field]
-                field_type = rules["type"]
-
-                if field_type == "string":
-                    if not isinstance(value, str):
-                        errors.append(f"Field {field} must be a string")
-                    elif "max_length" in rules and len(value) > rules["max_length"]:
-                        errors.append(f"Field {field} exceeds maximum length of {rules['max_length']}")
-                elif field_type == "integer":
-                    if not isinstance(value, int):
-                        errors.append(f"Field {field} must be an integer")
-                elif field_type == "float":
-                    if not isinstance(value, (int, float)):
-                        errors.append(f"Field {field} must be a number")
-                elif field_type == "boolean":
-                    if not isinstance(value, bool):
-                        errors.append(f"Field {field} must be a boolean")
-                elif field_type == "datetime":
-                    try:
-                        datetime.fromisoformat(value)
-                    except (ValueError, TypeError):
-                        errors.append(f"Field {field} must be a valid ISO format datetime string")
-                elif field_type == "date":
-                    try:
-                        datetime.strptime(value, "%Y-%m-%d")
-                    except (ValueError, TypeError):
-                        errors.append(f"Field {field} must be a valid date string in YYYY-MM-DD format")
-                elif field_type == "json":
-                    if not isinstance(value, (dict, list)):
-                        errors.append(f"Field {field} must be a valid JSON object or array")
-                
-                if "foreign_key" in rules:
-                    fk_entity = rules["foreign_key"]["entity"]
-                    fk_field = rules["foreign_key"]["field"]
-                    fk_file = os.path.join(BASE_DIR, self.schema_name, fk_entity, f"{value}.json")
-                    if not os.path.exists(fk_file):
-                        errors.append(f"Foreign key constraint failed: {fk_entity} with {fk_field}={value} does not exist")
+    def validate(self, entity, data):
+        if entity not in self.compiled:
+            return True, []  # No schema defined, so no validation needed
 
+        errors = self.compiled[entity](data)
         return len(errors) == 0, errors
 
 @app.route('/api/v1/<entity>', methods=['POST'])
 def create_entity(entity):
-    data = request.json
+    raw, data = get_request_body()
+    if not isinstance(data, dict):
+        return json_response({"error": "Request body must be a JSON object"}), 400
     is_valid, errors = validator.validate(entity, data)
     if not is_valid:
-        return jsonify({"error": "Validation failed", "details": errors}), 400
+        return json_response({"error": "Validation failed", "details": errors}), 400
     
     new_id = get_next_id(entity)
+    body = with_id(raw, data, new_id)
     data['id'] = new_id
     file_path = get_entity_file(entity, new_id)
     
-    with open(file_path, 'w') as f:
-        json.dump(data, f)
-    logger.info(f"Created resource of entity {entity} with id {new_id}")
-    return jsonify({"message": f"New resource of entity {entity} created successfully with id {new_id}", "id": new_id}), 201
+    atomic_write(file_path, body)
+    index_entity(entity, new_id, data)
+    logger.info("Created resource of entity %s with id %s", entity, new_id)
+    return json_response({"message": f"New resource of entity {entity} created successfully with id {new_id}", "id": new_id}), 201
 
 @app.route('/api/v1/<entity>/<int:id>', methods=['GET'])
 def get_entity(entity, id):
     file_path = get_entity_file(entity, id)
-    if os.path.exists(file_path):
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        logger.info(f"Retrieved resource of entity {entity} with id {id}")
-        return jsonify(data), 200
-    else:
-        logger.warning(f"Resource of entity {entity} with id {id} not found")
-        return jsonify({"error": f"Resource of entity {entity} with id {id} not found"}), 404
+    try:
+        # Stored documents are already serialized JSON, so serve the bytes as-is
+        body = read_file_bytes(file_path)
+    except FileNotFoundError:
+        logger.warning("Resource of entity %s with id %s not found", entity, id)
+        return json_response({"error": f"Resource of entity {entity} with id {id} not found"}), 404
+    logger.info("Retrieved resource of entity %s with id %s", entity, id)
+    return app.response_class(body, mimetype='application/json'), 200
 
 @app.route('/api/v1/<entity>/<int:id>', methods=['PUT'])
 def update_entity(entity, id):
     file_path = get_entity_file(entity, id)
     if not os.path.exists(file_path):
-        logger.warning(f"Attempted to update non-existent resource of entity {entity} with id {id}")
-        return jsonify({"error": f"Resource of entity {entity} with id {id} not found"}), 404
+        logger.warning("Attempted to update non-existent resource of entity %s with id %s", entity, id)
+        return json_response({"error": f"Resource of entity {entity} with id {id} not found"}), 404
     
-    data = request.json
+    data = get_request_data()
+    if not isinstance(data, dict):
+        return json_response({"error": "Request body must be a JSON object"}), 400
     is_valid, errors = validator.validate(entity, data)
     if not is_valid:
-        return jsonify({"error": "Validation failed", "details": errors}), 400
+        return json_response({"error": "Validation failed", "details": errors}), 400
     
     data['id'] = id  # Ensure the ID in the data matches the URL
     
-    with open(file_path, 'w') as f:
-        json.dump(data, f)
-    logger.info(f"Updated resource of entity {entity} with id {id}")
-    return jsonify({"message": f"Resource of entity {entity} with id {id} updated successfully"}), 200
+    atomic_write(file_path, _dumps(data))
+    index_entity(entity, id, data)
+    logger.info("Updated resource of entity %s with id %s", entity, id)
+    return json_response({"message": f"Resource of entity {entity} with id {id} updated successfully"}), 200
 
 @app.route('/api/v1/<entity>/<int:id>', methods=['PATCH'])
 def patch_entity(entity, id):
     file_path = get_entity_file(entity, id)
     if not os.path.exists(file_path):
-        logger.warning(f"Attempted to patch non-existent {entity} with id {id}")
-        return jsonify({"error": f"{entity} with id {id} not found"}), 404
+        logger.warning("Attempted to patch non-existent %s with id %s", entity, id)
+        return json_response({"error": f"{entity} with id {id} not found"}), 404
 
-    with open(file_path, 'r') as f:
-        existing_data = json.load(f)
+    # Start from the indexed copy rather than re-reading the file
+    existing_data = ensure_loaded(entity).get(id)
+    if existing_data is None:
+        existing_data = load_entity(file_path)
 
-    patch_data = request.json
+    patch_data = get_request_data()
+    if not isinstance(patch_data, dict):
+        return json_response({"error": "Request body must be a JSON object"}), 400
     patch_data = handle_null_values(patch_data)
 
-    # Merge patch data with existing data
-    merged_data = {**existing_data, **patch_data}
-    
-    # Validate the merged data
+    # Merge once; the same dict is validated, written and indexed.
+    # Nulls were already dropped above when patch_null is 'delete', and the
+    # id can't be patched.
+    merged_data = {**existing_data, **patch_data, 'id': id}
+
     is_valid, errors = validator.validate(entity, merged_data)
     if not is_valid:
-        return jsonify({"error": "Validation failed", "details": errors}), 400
+        return json_response({"error": "Validation failed", "details": errors}), 400
 
-    for key, value in patch_data.items():
-        if key != 'id':  # Prevent changing the ID
-            if value is None and config['patch_null'] == 'delete':
-                existing_data.pop(key, None)
-            else:
-                existing_data[key] = value
+    atomic_write(file_path, _dumps(merged_data))
+    index_entity(entity, id, merged_data)
 
-    with open(file_path, 'w') as f:
-        json.dump(existing_data, f)
-
-    logger.info(f"Patched {entity} with id {id}")
-    return jsonify({
+    logger.info("Patched %s with id %s", entity, id)
+    return json_response({
         "message": f"{entity} with id {id} patched successfully",
         "updated_fields": list(patch_data.keys())
     }), 200
@@ -546,41 +1045,42 @@ def patch_entity(entity, id):
 def delete_entity(entity, id):
     file_path = get_entity_file(entity, id)
     if not os.path.exists(file_path):
-        logger.warning(f"Attempted to delete non-existent {entity} with id {id}")
-        return jsonify({"error": f"{entity} with id {id} not found"}), 404
+        logger.warning("Attempted to delete non-existent %s with id %s", entity, id)
+        return json_response({"error": f"{entity} with id {id} not found"}), 404
     
     cascaded_deletes = []
-    if config['cascading_delete']:
+    if CASCADING_DELETE:
         cascaded_deletes = cascade_delete(entity, id)
     
     os.remove(file_path)
-    logger.info(f"Deleted {entity} with id {id}")
+    unindex_entity(entity, id)
+    logger.info("Deleted %s with id %s", entity, id)
     
     response = {"message": f"{entity} with id {id} deleted successfully"}
     if cascaded_deletes:
         response["cascaded_deletes"] = cascaded_deletes
     
-    return jsonify(response), 200
+    return json_response(response), 200
 
 @app.route('/api/v1/<entity>/list', methods=['GET'])
 def list_entities(entity):
     page, per_page = get_pagination_params()
     sort_params = get_sorting_params()
     
-    cache_key = f"{entity}:list:{sort_params}:{page}:{per_page}"
+    cache_key = (entity, 'list', entity_versions.get(entity, 0), sort_params, page, per_page)
     cached_result = get_cached_result(cache_key)
     if cached_result:
-        logger.info(f"Retrieved cached list for {entity}")
-        return jsonify(cached_result), 200
+        logger.info("Retrieved cached list for %s", entity)
+        return json_response(cached_result), 200
 
     all_entities = get_all_entities(entity)
-    sorted_entities = sort_entities(all_entities, sort_params)
-    paginated_results = paginate_results(sorted_entities, page, per_page)
+    sorted_entities = sort_entities(all_entities, sort_params, limit=page * per_page)
+    paginated_results = paginate_results(sorted_entities, page, per_page, total=len(all_entities))
     paginated_results['sort'] = ','.join([f"{field}:{order}" for field, order in sort_params])
 
     set_cached_result(cache_key, paginated_results)
-    logger.info(f"Listed {entity} (page {page}, {per_page} per page)")
-    return jsonify(paginated_results), 200
+    logger.info("Listed %s (page %s, %s per page)", entity, page, per_page)
+    return json_response(paginated_results), 200
 
 @app.route('/api/v1/<entity>/search', methods=['GET'])
 def search_entities(entity):
@@ -590,56 +1090,99 @@ def search_entities(entity):
     sort_params = get_sorting_params()
 
     if not query:
-        logger.warning(f"Search attempted for {entity} without a query")
-        return jsonify({"error": "Query parameter is required"}), 400
+        logger.warning("Search attempted for %s without a query", entity)
+        return json_response({"error": "Query parameter is required"}), 400
 
-    cache_key = f"{entity}:search:{query}:{field}:{sort_params}:{page}:{per_page}"
+    cache_key = (entity, 'search', entity_versions.get(entity, 0), query, field,
+                 sort_params, page, per_page)
     cached_result = get_cached_result(cache_key)
     if cached_result:
-        logger.info(f"Retrieved cached search results for {entity}")
-        return jsonify(cached_result), 200
-
-    def search_filter(data):
-        return field in data and field_matches(data[field], query)
+        logger.info("Retrieved cached search results for %s", entity)
+        return json_response(cached_result), 200
 
-    matching_entities = get_all_entities(entity, search_filter)
-    sorted_entities = sort_entities(matching_entities, sort_params)
-    paginated_results = paginate_results(sorted_entities, page, per_page)
+    matching_entities = search_entity_field(entity, field, query)
+    sorted_entities = sort_entities(matching_entities, sort_params, limit=page * per_page)
+    paginated_results = paginate_results(sorted_entities, page, per_page, total=len(matching_entities))
     paginated_results['search_field'] = field
     paginated_results['sort'] = ','.join([f"{field}:{order}" for field, order in sort_params])
 
     set_cached_result(cache_key, paginated_results)
-    logger.info(f"Searched {entity} for '{query}' in field '{field}' (page {page}, {per_page} per page)")
-    return jsonify(paginated_results), 200
+    logger.info("Searched %s for '%s' in field '%s' (page %s, %s per page)", entity, query, field, page, per_page)
+    return json_response(paginated_results), 200
 
 @app.route('/api/v1/<entity>/save/<int:id>', methods=['POST'])
 def save_entity(entity, id):
     file_path = get_entity_file(entity, id)
     
     if os.path.exists(file_path):
-        logger.warning(f"Attempted to save existing {entity} with id {id}")
-        return jsonify({
+        logger.warning("Attempted to save existing %s with id %s", entity, id)
+        return json_response({
             "error": f"{entity} with id {id} already exists. Use PUT /api/v1/{entity}/{id} to update."
         }), 409  # 409 Conflict
     
-    data = request.json
+    data = get_request_data()
+    if not isinstance(data, dict):
+        return json_response({"error": "Request body must be a JSON object"}), 400
     is_valid, errors = validator.validate(entity, data)
     if not is_valid:
-        return jsonify({"error": "Validation failed", "details": errors}), 400
+        return json_response({"error": "Validation failed", "details": errors}), 400
     
     data['id'] = id
     
-    with open(file_path, 'w') as f:
-        json.dump(data, f)
+    atomic_write(file_path, _dumps(data))
+    index_entity(entity, id, data)
     
-    logger.info(f"Saved new {entity} with id {id}")
-    return jsonify({"message": f"{entity} with id {id} created successfully"}), 201
-
-
+    logger.info("Saved new %s with id %s", entity, id)
+    return json_response({"message": f"{entity} with id {id} created successfully"}), 201
+
+
+def run_gunicorn(config):
+    from gunicorn.app.base import BaseApplication
+
+    class RservApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f"{config['host']}:{config['port']}")
+            self.cfg.set('workers', 1)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('threads', config['threads'])
+            self.cfg.set('post_fork', restart_log_listener)
+
+        def load(self):
+            return app
+
+    # The entity index, id blocks and cache live in the worker process, so a
+    # second worker would serve stale lists and searches; scale with threads
+    if config['workers'] > 1:
+        logger.warning("rserv keeps its indexes in process; running 1 gunicorn worker instead of %s. "
+                       "Use --threads to handle more concurrent requests.", config['workers'])
+        config['workers'] = 1
+    RservApplication().run()
+
+def run_server(config):
+    if config['server'] == 'gunicorn':
+        if importlib.util.find_spec('gunicorn') is not None:
+            run_gunicorn(config)
+            return
+        logger.warning("gunicorn is not installed. Falling back to the Flask development server.")
+    if config['server'] == 'waitress':
+        try:
+            from waitress import serve
+        except ImportError:
+            logger.warning("waitress is not installed. Falling back to the Flask development server.")
+        else:
+            serve(app, host=config['host'], port=config['port'], threads=config['threads'])
+            return
+    app.run(host=config['host'], port=config['port'], threaded=True)
 
 if __name__ == '__main__':
-    print_startup_notice()
     config = get_config()
+    DATA_DIR = os.path.join(BASE_DIR, config['schema_name'])
+    PATCH_NULL = config['patch_null']
+    DEFAULT_PAGE_SIZE = config['default_page_size']
+    CASCADING_DELETE = config['cascading_delete']
+    FSYNC_WRITES = config['fsync_writes']
+    if not config['quiet']:
+        print_startup_notice()
 
     if config['list_schemas']:
         available_schemas = list_available_schemas()
@@ -651,14 +1194,8 @@ if __name__ == '__main__':
             print("No schemas available.")
         sys.exit(0)
 
-    print(f"Server configuration:")
-    print(f"  Host: {config['host']}")
-    print(f"  Port: {config['port']}")
-    print(f"  PATCH null handling: {config['patch_null']}")
-    print(f"  Cache TTL: {config['cache_ttl']} seconds")
-    print(f"  Default page size: {config['default_page_size']}")
-    print(f"  Schema: {config['schema_name']} {'(default)' if config['schema_name'] == DEFAULT_SCHEMA else ''}")
-    print(f"  Cascading Delete: {'Enabled' if config['cascading_delete'] else 'Disabled'}")
+    if not config['quiet']:
+        print_configuration(config)
     
     schemas = load_and_validate_schemas(config['schema_name'])
     if not schemas:
@@ -672,9 +1209,13 @@ if __name__ == '__main__':
         print(f"Loaded and validated schemas for {len(schemas)} entities")
     
     # Ensure the data directory for this schema exists
-    os.makedirs(os.path.join(BASE_DIR, config['schema_name']), exist_ok=True)
+    os.makedirs(DATA_DIR, exist_ok=True)
     
     validator = DynamicValidator(schemas, config['schema_name'])
+    cache = ResultCache(maxsize=CACHE_MAXSIZE, ttl=config['cache_ttl'])
+    build_fk_relations(schemas)
+    load_entity_index()
+    atexit.register(release_id_blocks)
        
-    logger.info(f"Starting rserv {VERSION} on {config['host']}:{config['port']} with schema '{config['schema_name']}'")
-    app.run(host=config['host'], port=config['port'])
+    logger.info("Starting rserv %s on %s:%s with schema '%s'", VERSION, config['host'], config['port'], config['schema_name'])
+    run_server(config)
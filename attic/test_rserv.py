@@ -0,0 +1,259 @@
+import atexit
+import importlib.util
+import logging
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+SERVER_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rserv.py')
+
+
+def load_server():
+    # The server keeps its state in module globals and paths relative to the
+    # working directory, so each test loads a fresh copy inside a temp dir
+    spec = importlib.util.spec_from_file_location('rserv_attic', SERVER_FILE)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class ServerTestCase(unittest.TestCase):
+    schemas = {}
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.mkdtemp()
+        os.chdir(self.tmp)
+        self.rserv = load_server()
+        logging.disable(logging.CRITICAL)
+        os.makedirs(self.rserv.DATA_DIR, exist_ok=True)
+        # What __main__ sets up before serving
+        self.rserv.validator = self.rserv.DynamicValidator(self.schemas, self.rserv.DEFAULT_SCHEMA)
+        self.rserv.build_fk_relations(self.schemas)
+        self.client = self.rserv.app.test_client()
+
+    def tearDown(self):
+        self.rserv.release_id_blocks()
+        atexit.unregister(self.rserv.log_listener.stop)
+        self.rserv.log_listener.stop()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp)
+
+    def create(self, entity, data):
+        response = self.client.post(f'/api/v1/{entity}', json=data)
+        self.assertEqual(response.status_code, 201, response.get_data(as_text=True))
+        return response.get_json()['id']
+
+
+class RequestBodyTest(ServerTestCase):
+
+    def test_missing_or_malformed_body_is_rejected(self):
+        for body in (b'', b'{not json', b'[1, 2]'):
+            response = self.client.post('/api/v1/person', data=body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+        self.client.post('/api/v1/person', json={'name': 'Ann'})
+        self.assertEqual(self.create('person', {'name': 'Bob'}), 2)
+
+    def test_update_with_bad_body_is_rejected(self):
+        id = self.create('person', {'name': 'Ann'})
+        for method in (self.client.put, self.client.patch):
+            response = method(f'/api/v1/person/{id}', data=b'', content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/v1/person/save/7', data=b'nope', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(f'/api/v1/person/{id}').get_json()['name'], 'Ann')
+
+
+class AtomicWriteTest(ServerTestCase):
+
+    def test_file_modes(self):
+        path = os.path.join(self.tmp, 'doc.json')
+        self.rserv.atomic_write(path, b'{}')
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), self.rserv.DEFAULT_FILE_MODE)
+        os.chmod(path, 0o640)
+        self.rserv.atomic_write(path, b'{"a": 1}')
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o640)
+
+
+class ReadFileTest(ServerTestCase):
+
+    def test_whole_file_in_one_read(self):
+        path = os.path.join(self.tmp, 'doc.json')
+        payload = b'{"name": "%s"}' % (b'x' * 10000)
+        self.rserv.atomic_write(path, payload)
+        with mock.patch('os.read', wraps=os.read) as read:
+            self.assertEqual(self.rserv.read_file_bytes(path), payload)
+        self.assertEqual(read.call_count, 1)
+
+    def test_empty_file(self):
+        path = os.path.join(self.tmp, 'empty.json')
+        self.rserv.atomic_write(path, b'')
+        self.assertEqual(self.rserv.read_file_bytes(path), b'')
+
+
+class IndexTest(ServerTestCase):
+    schemas = {
+        'person': {'name': {'type': 'string', 'required': True}},
+        'pet': {
+            'name': {'type': 'string', 'required': True},
+            'owner': {'type': 'integer', 'required': True, 'foreign_key': {'entity': 'person', 'field': 'id'}},
+        },
+    }
+
+    def test_concurrent_first_loads_build_one_index(self):
+        for n in range(1, 51):
+            self.rserv.atomic_write(self.rserv.get_entity_file('person', n), b'{"id": %d, "name": "p%d"}' % (n, n))
+
+        barrier = threading.Barrier(8)
+        loaded = []
+
+        def load():
+            barrier.wait()
+            loaded.append(self.rserv.ensure_loaded('person'))
+
+        threads = [threading.Thread(target=load) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len({id(documents) for documents in loaded}), 1)
+        self.assertEqual(len(loaded[0]), 50)
+
+    def test_concurrent_writes_keep_field_and_fk_indexes_consistent(self):
+        owner = self.create('person', {'name': 'Ann'})
+        self.rserv.get_field_index('pet', 'name')
+
+        def write(start):
+            for n in range(start, start + 25):
+                self.rserv.index_entity('pet', n, {'id': n, 'name': f'pet{n}', 'owner': owner})
+
+        threads = [threading.Thread(target=write, args=(start,)) for start in range(1, 101, 25)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.rserv.fk_index['pet']['owner'][owner]), 100)
+        self.assertEqual(len(self.rserv.get_field_index('pet', 'name').lowered), 100)
+        self.assertEqual(len(self.rserv.search_entity_field('pet', 'name', 'pet1')), 12)
+
+    def test_cascade_follows_the_fk_index(self):
+        self.rserv.CASCADING_DELETE = True
+        ann = self.create('person', {'name': 'Ann'})
+        bob = self.create('person', {'name': 'Bob'})
+        rex = self.create('pet', {'name': 'Rex', 'owner': ann})
+        tom = self.create('pet', {'name': 'Tom', 'owner': bob})
+        # Moving a pet between owners moves it in the fk index too
+        self.client.put(f'/api/v1/pet/{tom}', json={'name': 'Tom', 'owner': ann})
+
+        response = self.client.delete(f'/api/v1/person/{ann}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(response.get_json()['cascaded_deletes']), [f'pet/{rex}', f'pet/{tom}'])
+        self.assertEqual(self.client.get(f'/api/v1/pet/{tom}').status_code, 404)
+        self.assertEqual(self.rserv.fk_index['pet']['owner'].get(ann, set()), set())
+        self.assertEqual(self.client.get(f'/api/v1/person/{bob}').status_code, 200)
+
+    def test_search_uses_and_maintains_the_field_index(self):
+        owner = self.create('person', {'name': 'Ann'})
+        for name in ('Rex', 'Rexy', 'Max'):
+            self.create('pet', {'name': name, 'owner': owner})
+
+        def search(query):
+            response = self.client.get(f'/api/v1/pet/search?field=name&query={query}&sort=name:asc')
+            self.assertEqual(response.status_code, 200)
+            return [item['name'] for item in response.get_json()['items']]
+
+        self.assertEqual(search('rex'), ['Rex', 'Rexy'])
+        self.assertEqual(search('x'), ['Max', 'Rex', 'Rexy'])
+        self.client.patch('/api/v1/pet/2', json={'name': 'Spot'})
+        self.client.delete('/api/v1/pet/1')
+        self.assertEqual(search('rex'), [])
+        self.assertEqual(search('spo'), ['Spot'])
+        self.assertEqual(set(self.rserv.field_indexes['pet']['name'].lowered), {2, 3})
+
+
+class ResultCacheTest(ServerTestCase):
+
+    def test_list_pages_are_cached_until_a_write(self):
+        self.create('person', {'name': 'Ann'})
+        self.assertEqual(self.client.get('/api/v1/person/list').get_json()['total'], 1)
+        self.assertEqual(len(self.rserv.cache), 1)
+        self.create('person', {'name': 'Bob'})
+        self.assertEqual(len(self.rserv.cache), 0)
+        self.assertEqual(self.client.get('/api/v1/person/list').get_json()['total'], 2)
+
+    def test_writes_only_invalidate_their_own_entity(self):
+        self.create('person', {'name': 'Ann'})
+        self.create('pet', {'name': 'Rex'})
+        self.client.get('/api/v1/person/list')
+        self.client.get('/api/v1/pet/list')
+        self.client.get('/api/v1/pet/search?query=rex')
+        self.assertEqual(len(self.rserv.cache_keys['pet']), 2)
+
+        self.create('person', {'name': 'Bob'})
+        self.assertNotIn('person', self.rserv.cache_keys)
+        self.assertEqual(len(self.rserv.cache_keys['pet']), 2)
+        self.assertEqual(len(self.rserv.cache), 2)
+
+    def test_concurrent_lists_and_writes(self):
+        errors = []
+
+        def work(n):
+            client = self.rserv.app.test_client()
+            for i in range(20):
+                response = client.post('/api/v1/person', json={'name': f'p{n}-{i}'})
+                if response.status_code != 201:
+                    errors.append(response.status_code)
+                response = client.get(f'/api/v1/person/list?page={i % 3 + 1}')
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.client.get('/api/v1/person/list').get_json()['total'], 120)
+
+    def test_evicted_and_expired_keys_leave_cache_keys(self):
+        now = [0]
+        self.rserv.cache = self.rserv.ResultCache(maxsize=3, ttl=10, timer=lambda: now[0])
+        self.create('person', {'name': 'Ann'})
+        for page in range(1, 7):
+            self.client.get(f'/api/v1/person/list?page={page}')
+        self.assertEqual(self.rserv.cache_keys['person'], set(self.rserv.cache))
+        self.assertEqual(len(self.rserv.cache_keys['person']), 3)
+
+        now[0] = 20
+        self.rserv.set_cached_result(('pet', 'list'), [])
+        self.assertNotIn('person', self.rserv.cache_keys)
+
+
+class LogListenerTest(ServerTestCase):
+
+    def test_forked_worker_gets_a_working_listener(self):
+        read_fd, write_fd = os.pipe()
+        with os.fdopen(write_fd, 'w') as stream:
+            self.rserv.log_handler.setStream(stream)
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    # basicConfig only took effect for the first copy loaded
+                    logging.disable(logging.NOTSET)
+                    logging.getLogger().handlers = [self.rserv.log_queue_handler]
+                    self.rserv.restart_log_listener()
+                    self.rserv.logger.warning('from the worker')
+                    self.rserv.log_listener.stop()
+                finally:
+                    os._exit(0)
+        os.waitpid(pid, 0)
+        with os.fdopen(read_fd) as output:
+            self.assertIn('from the worker', output.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,19 +1,49 @@
 
 import os
+import sys
 import json
 import time
 import uuid
-import asyncio
 import logging
-from typing import Dict, Any, List, Tuple, Optional
-from collections import defaultdict, deque
-from flask import Flask, request, jsonify, Response, abort, url_for
+import operator
+from typing import Dict, Any, Iterable, List, Tuple, Optional
+from collections import Counter, defaultdict, deque
+from flask import Flask, request, Response, abort, url_for
 import re
 from datetime import datetime, timedelta
-import functools
+from array import array
+from bisect import bisect_left, insort
+from functools import lru_cache
 import fcntl
+import heapq
+import mmap
+import stat
+import tempfile
+import atexit
+import threading
 import multiprocessing
-from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import LRUCache, TTLCache
+
+# orjson parses and serializes considerably faster than the stdlib encoder;
+# fall back to json when it is not installed
+try:
+    import orjson
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except ImportError:
+    orjson = None
+    _loads = json.loads
+
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj).encode('utf-8')
+
+# msgpack, when installed, is used to persist the graph and its index; it is
+# faster to write than text or JSON and keeps tuple node ids and edge labels
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -21,6 +51,18 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+def json_response(data: Any) -> Response:
+    return app.response_class(_dumps(data), mimetype='application/json')
+
+def get_request_data() -> Any:
+    raw = request.get_data(cache=False)
+    if not raw:
+        return None
+    try:
+        return _loads(raw)
+    except ValueError:
+        return None
+
 # Constants and configurations
 BASE_DIR = 'data'
 SCHEMA_DIR = 'schema'
@@ -43,11 +85,16 @@ DEFAULT_CONFIG = {
     'graph_query_ttl': 86400,  # 24 hours
     'graph_result_ttl': 3600,  # 1 hour
     'fulltext_enabled': False,
+    'graph_enabled': False,
     'ref_embed_depth': 3,
     'max_query_depth': 10,
+    'graph_cycle_detection': 'ignore',  # 'error', 'warn', 'ignore' or 'disable'
     'cache_type': 'ttlcache',  # 'ttlcache' or 'redis'
     'redis_host': 'localhost',  # Redis host if using Redis cache
-    'redis_port': 6379  # Redis port if using Redis cache
+    'redis_port': 6379,  # Redis port if using Redis cache
+    'redis_scan_count': 500,  # Keys per SCAN page and pipeline when sweeping Redis
+    'server': 'flask',  # 'flask' or 'waitress'
+    'server_threads': 32  # Worker threads when serving with waitress
 }
 
 config = DEFAULT_CONFIG.copy()
@@ -60,6 +107,31 @@ for key, value in os.environ.items():
         else:
             config[key.lower()] = value
 
+class ResultCache(TTLCache):
+    """TTLCache that also forgets evicted and expired list pages in list_cache_keys.
+
+    Runs inside cache operations, so cache_lock is already held.
+    """
+    def popitem(self) -> Tuple[str, Any]:
+        key, value = super().popitem()
+        forget_list_key(key)
+        return key, value
+
+    def expire(self, time: Optional[float] = None) -> List[Tuple[str, Any]]:
+        expired = super().expire(time)
+        for key, _ in expired:
+            forget_list_key(key)
+        return expired
+
+def forget_list_key(key: str) -> None:
+    entity, _, rest = key.partition(':')
+    if rest.startswith('list:'):
+        keys = list_cache_keys.get(entity)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del list_cache_keys[entity]
+
 # Initialize cache
 try:
     import redis
@@ -67,18 +139,88 @@ try:
         cache = redis.Redis(host=config['redis_host'], port=config['redis_port'])
         logger.info(f"Using Redis cache at {config['redis_host']}:{config['redis_port']}")
     else:
-        cache = TTLCache(maxsize=1024, ttl=config['cache_ttl'])
+        cache = ResultCache(maxsize=1024, ttl=config['cache_ttl'])
         logger.info(f"Using in-memory TTLCache with TTL {config['cache_ttl']} seconds")
 except ImportError:
-    cache = TTLCache(maxsize=1024, ttl=config['cache_ttl'])
+    cache = ResultCache(maxsize=1024, ttl=config['cache_ttl'])
     logger.info("Redis module not available. Using in-memory TTLCache.")
 
+# cachetools caches are not thread-safe (even a get may evict), so every
+# access to the in-memory cache is made under this lock
+cache_lock = threading.Lock()
+
+def cache_get(key: str) -> Any:
+    """Returns the cached value for key, or None; a single GET round trip with Redis."""
+    if isinstance(cache, TTLCache):
+        with cache_lock:
+            return cache.get(key)
+    value = cache.get(key)
+    return _loads(value) if value is not None else None
+
+def cache_set(key: str, value: Any, ttl: Optional[int] = None) -> None:
+    """Caches value under key; Redis entries are serialized and expire after ttl seconds."""
+    if isinstance(cache, TTLCache):
+        with cache_lock:
+            cache[key] = value
+    else:
+        cache.set(key, _dumps(value), ex=ttl or config['cache_ttl'])
+
+def remember_list_key(entity: str, key: str) -> None:
+    """Records a cached list page of entity so that invalidate_cache can drop it."""
+    if isinstance(cache, TTLCache):
+        with cache_lock:
+            # Only while the page is still cached; otherwise nothing would
+            # ever take the key out of the set again
+            if key in cache:
+                list_cache_keys[entity].add(key)
+    else:
+        # Kept in Redis so pages cached by other processes are dropped too.
+        # The set expires a full cache TTL after its newest page was added,
+        # so it outlives every page in it and is never left without an expiry
+        list_keys_key = f"{entity}:list_keys"
+        cache.pipeline(transaction=False).sadd(list_keys_key, key).expire(list_keys_key, config['cache_ttl']).execute()
+
 
 # Global variables
 graph = defaultdict(dict)
-fulltext_index = defaultdict(set)
+fulltext_index = defaultdict(dict)  # token -> entity -> set of int doc ids
+doc_tokens = {}  # (entity, doc id) -> tokens currently indexed for it
 query_storage = {}
+# (end time, query id) of every finished stored query, oldest first, so the
+# cleanup pops just the expired ones instead of scanning query_storage
+query_expiry_heap = []
+query_expiry_lock = threading.Lock()
+# Held to add queries while cleanup may be swapping in a rebuilt query_storage
+query_storage_lock = threading.Lock()
 index = {}
+node_index_keys = {}  # (entity, id) -> index keys the node is currently filed under
+
+# Bumped on every graph mutation; traversals rebuild their CSR view of the
+# graph when it no longer matches
+graph_version = 0
+csr_view = None
+csr_lock = threading.Lock()
+
+# Ids are handed out from blocks reserved in each entity's id file, so a
+# create only touches the file once every ID_BLOCK_SIZE ids
+ID_BLOCK_SIZE = 64
+id_blocks = {}
+id_lock = threading.Lock()
+
+# Entity files are small and reads are I/O bound, so listings load them in parallel
+scan_pool = ThreadPoolExecutor(max_workers=16)
+
+# Graph queries submitted through the API run here, off the request thread
+query_pool = ThreadPoolExecutor(max_workers=4)
+
+# Cache keys of the list pages stored per entity, so a write to one entity
+# drops exactly its own pages
+list_cache_keys = defaultdict(set)
+
+# Parsed entity documents keyed by file path, each stored with the
+# (mtime, size) stamp it was read at so that a changed file is re-read
+doc_cache = LRUCache(maxsize=10000)
+doc_cache_lock = threading.Lock()  # LRUCache reorders itself even on get
 
 # Error handling
 class RServError(Exception):
@@ -94,7 +236,7 @@ class RServError(Exception):
 
 @app.errorhandler(RServError)
 def handle_rserv_error(error: RServError) -> Tuple[Response, int]:
-    response = jsonify(error.to_dict())
+    response = json_response(error.to_dict())
     response.status_code = error.status_code
     return response
 
@@ -111,7 +253,7 @@ def create_error_response(message: str, status_code: int, details: Optional[Dict
     }
     if details:
         response['error']['details'] = details
-    return jsonify(response), status_code
+    return json_response(response), status_code
 
 def create_resource_response(resource_type: str, data: Any, links: Dict[str, str] = None) -> Dict[str, Any]:
     response = {
@@ -145,8 +287,8 @@ def load_schemas(schema_name: str) -> Dict[str, Any]:
         for filename in os.listdir(schema_dir):
             if filename.endswith('.json'):
                 entity_name = os.path.splitext(filename)[0]
-                with open(os.path.join(schema_dir, filename), 'r') as f:
-                    schemas[entity_name] = json.load(f)
+                with open(os.path.join(schema_dir, filename), 'rb') as f:
+                    schemas[entity_name] = _loads(f.read())
     return schemas
 
 schemas = load_schemas(config['schema_name'])
@@ -160,28 +302,129 @@ def get_entity_dir(entity: str) -> str:
 def get_entity_file(entity: str, id: int) -> str:
     return os.path.join(get_entity_dir(entity), f"{id}.json")
 
+def read_doc(file_path: str) -> Dict[str, Any]:
+    """Reads an entity file, reusing the parsed document while the file is unchanged."""
+    with open(file_path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        stamp = (st.st_mtime_ns, st.st_size)
+        with doc_cache_lock:
+            hit = doc_cache.get(file_path)
+        if hit is not None and hit[0] == stamp:
+            return dict(hit[1])
+        data = _loads(f.read())
+    with doc_cache_lock:
+        doc_cache[file_path] = (stamp, data)
+    return dict(data)
+
+# mkstemp creates files as 0600; written files get the mode a plain open()
+# would give them. The umask can only be read by setting it, so that is done
+# once here rather than on every write
+_umask = os.umask(0)
+os.umask(_umask)
+DEFAULT_FILE_MODE = 0o666 & ~_umask
+
+def atomic_write(file_path: str, payload: bytes) -> os.stat_result:
+    """Writes to a temporary file in the same directory and swaps it into place."""
+    try:
+        mode = stat.S_IMODE(os.stat(file_path).st_mode)
+    except FileNotFoundError:
+        mode = DEFAULT_FILE_MODE
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            os.fchmod(f.fileno(), mode)
+            f.write(payload)
+            f.flush()
+            st = os.fstat(f.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return st
+
+def write_doc(file_path: str, data: Dict[str, Any]) -> None:
+    """Writes an entity file and primes the document cache with what was written."""
+    st = atomic_write(file_path, _dumps(data))
+    with doc_cache_lock:
+        doc_cache[file_path] = ((st.st_mtime_ns, st.st_size), dict(data))
+
+def get_entity_data(entity: str, id: int) -> Optional[Dict[str, Any]]:
+    """Loads a stored resource, or returns None if it does not exist."""
+    try:
+        return read_doc(get_entity_file(entity, id))
+    except FileNotFoundError:
+        return None
+
+def remove_doc(file_path: str) -> None:
+    os.remove(file_path)
+    with doc_cache_lock:
+        doc_cache.pop(file_path, None)
+
+def get_id_file(entity: str) -> str:
+    return os.path.join(get_entity_dir(entity), f"{entity}_next_id.json")
+
+def reserve_id_block(entity: str) -> List[int]:
+    """Reserves the next ID_BLOCK_SIZE ids in the id file, locked against other processes."""
+    with open(get_id_file(entity), 'a+b') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.seek(0)
+            content = f.read().strip()
+            first_id = (_loads(content) if content else 0) + 1
+            last_id = first_id + ID_BLOCK_SIZE - 1
+            f.seek(0)
+            f.truncate()
+            f.write(_dumps(last_id))
+            return [first_id, last_id]
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
 def get_next_id(entity: str) -> int:
-    entity_dir = get_entity_dir(entity)
-    id_file = os.path.join(entity_dir, f"{entity}_next_id.json")
+    return get_next_ids(entity, 1)[0]
 
+def get_next_ids(entity: str, count: int) -> List[int]:
     try:
-        if os.path.exists(id_file):
-            with open(id_file, 'r') as f:
-                next_id = json.load(f) + 1
-        else:
-            next_id = 1
-        with open(id_file, 'w') as f:
-            json.dump(next_id, f)
-        return next_id
+        with id_lock:
+            ids = []
+            while len(ids) < count:
+                block = id_blocks.get(entity)
+                if block is None or block[0] > block[1]:
+                    block = id_blocks[entity] = reserve_id_block(entity)
+                take = min(count - len(ids), block[1] - block[0] + 1)
+                ids.extend(range(block[0], block[0] + take))
+                block[0] += take
+            return ids
     except Exception as e:
         logger.error(f"Error updating next ID for entity {entity}: {str(e)}")
         raise RServError(f"Error generating ID for entity {entity}", status_code=500)
 
+def release_id_blocks() -> None:
+    """Hands the unused tail of each block back, unless another process reserved past it."""
+    with id_lock:
+        for entity, (next_id, last_id) in id_blocks.items():
+            if next_id > last_id:
+                continue
+            with open(get_id_file(entity), 'a+b') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    content = f.read().strip()
+                    if content and _loads(content) == last_id:
+                        f.seek(0)
+                        f.truncate()
+                        f.write(_dumps(next_id - 1))
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        id_blocks.clear()
+
+atexit.register(release_id_blocks)
+
 @app.route('/api/v1/<entity>', methods=['POST'])
 def create_entity(entity: str) -> Tuple[Response, int]:
     try:
         validate_entity_name(entity)
-        data = request.json
+        data = get_request_data()
         if not data:
             raise RServError("No input data provided", status_code=400)
         
@@ -189,8 +432,10 @@ def create_entity(entity: str) -> Tuple[Response, int]:
         data['id'] = new_id
         file_path = get_entity_file(entity, new_id)
         
-        with open(file_path, 'w') as f:
-            json.dump(data, f)
+        write_doc(file_path, data)
+        update_sort_indexes(entity, new_id, data)
+        update_unique_indexes(entity, new_id, data)
+        track_existing_id(entity, new_id, True)
         
         if config['fulltext_enabled']:
             index_document(entity, new_id, data)
@@ -198,20 +443,85 @@ def create_entity(entity: str) -> Tuple[Response, int]:
         if config['rserv_graph'] == 'indexed':
             update_graph_index(entity, new_id, data, 'create')
             update_graph(entity, new_id, data)
-            save_graph_index(config['adjacency_index_file'])
-            save_graph_to_file(config['adjacency_list_file'])
+            schedule_graph_flush()
         
         # Invalidate cache for this entity after creation
         invalidate_cache(entity)
         
         logger.info(f"Created resource of entity {entity} with id {new_id}")
-        return jsonify({"message": f"New resource of entity {entity} created successfully with id {new_id}", "id": new_id}), 201
+        return json_response({"message": f"New resource of entity {entity} created successfully with id {new_id}", "id": new_id}), 201
     except RServError as e:
         raise e
     except Exception as e:
         logger.error(f"Unexpected error in create_entity: {str(e)}")
         raise RServError("An unexpected error occurred", status_code=500)
 
+@app.route('/api/v1/<entity>/bulk', methods=['POST'])
+def create_entities_bulk(entity: str) -> Tuple[Response, int]:
+    try:
+        validate_entity_name(entity)
+        items = get_request_data()
+        if not items:
+            raise RServError("No input data provided", status_code=400)
+        if not isinstance(items, list) or not all(isinstance(item, dict) and item for item in items):
+            raise RServError("Bulk input must be a list of non-empty objects", status_code=400)
+        
+        new_ids = get_next_ids(entity, len(items))
+        written = []
+        try:
+            for new_id, data in zip(new_ids, items):
+                data['id'] = new_id
+                write_doc(get_entity_file(entity, new_id), data)
+                written.append(new_id)
+                update_sort_indexes(entity, new_id, data)
+                update_unique_indexes(entity, new_id, data)
+                track_existing_id(entity, new_id, True)
+                
+                if config['fulltext_enabled']:
+                    index_document(entity, new_id, data)
+                
+                if config['rserv_graph'] == 'indexed':
+                    update_graph_index(entity, new_id, data, 'create')
+                    update_graph(entity, new_id, data)
+        except Exception:
+            # All or nothing: undo whatever part of the batch made it in
+            rollback_bulk_create(entity, written)
+            raise
+        
+        # One graph flush and one invalidation for the whole batch
+        if config['rserv_graph'] == 'indexed':
+            schedule_graph_flush()
+        invalidate_cache(entity)
+        
+        logger.info(f"Created {len(new_ids)} resources of entity {entity}")
+        return json_response({"message": f"{len(new_ids)} new resources of entity {entity} created successfully", "ids": new_ids}), 201
+    except RServError as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Unexpected error in create_entities_bulk: {str(e)}")
+        raise RServError("An unexpected error occurred", status_code=500)
+
+def rollback_bulk_create(entity: str, ids: List[int]) -> None:
+    """Removes the documents of a failed bulk create and their index entries."""
+    for id in ids:
+        try:
+            file_path = get_entity_file(entity, id)
+            if os.path.exists(file_path):
+                remove_doc(file_path)
+            update_sort_indexes(entity, id, None)
+            update_unique_indexes(entity, id, None)
+            track_existing_id(entity, id, False)
+            if config['fulltext_enabled']:
+                remove_from_index(entity, id)
+            if config['rserv_graph'] == 'indexed':
+                update_graph_index(entity, id, None, 'delete')
+                remove_from_graph(entity, id)
+        except Exception as e:
+            logger.error(f"Error rolling back {entity} with id {id}: {str(e)}")
+    if config['rserv_graph'] == 'indexed':
+        schedule_graph_flush()
+    invalidate_cache(entity)
+
 @app.route('/api/v1/<entity>/<int:id>', methods=['GET'])
 def get_entity(entity: str, id: int) -> Tuple[Response, int]:
     try:
@@ -220,27 +530,25 @@ def get_entity(entity: str, id: int) -> Tuple[Response, int]:
         
         # Check if entity is in cache
         cache_key = f"{entity}:{id}"
-        if cache_key in cache:
+        cached = cache_get(cache_key)
+        if cached is not None:
             logger.info(f"Retrieved resource of entity {entity} with id {id} from cache")
-            return jsonify(cache[cache_key]), 200
+            return json_response(cached), 200
         
-        file_path = get_entity_file(entity, id)
-        if not os.path.exists(file_path):
+        data = get_entity_data(entity, id)
+        if data is None:
             raise RServError(f"Resource of entity {entity} with id {id} not found", status_code=404)
         
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        
         lookup = request.args.get('lookup')
         if lookup:
             embed_depth = request.args.get('embed_depth', config['ref_embed_depth'], type=int)
             data = populate_document(entity, data, lookup.split(','), max_depth=embed_depth)
         
         # Cache the retrieved entity
-        cache[cache_key] = data
+        cache_set(cache_key, data)
         
         logger.info(f"Retrieved resource of entity {entity} with id {id}")
-        return jsonify(data), 200
+        return json_response(data), 200
     except RServError as e:
         raise e
     except Exception as e:
@@ -257,7 +565,7 @@ def update_entity(entity: str, id: int) -> Tuple[Response, int]:
         if not os.path.exists(file_path):
             raise RServError(f"Resource of entity {entity} with id {id} not found", status_code=404)
         
-        data = request.json
+        data = get_request_data()
         if not data:
             raise RServError("No input data provided", status_code=400)
         
@@ -266,10 +574,11 @@ def update_entity(entity: str, id: int) -> Tuple[Response, int]:
         # Validate foreign keys before updating
         is_valid, errors = validator.validate(entity, data)
         if not is_valid:
-            return jsonify({"error": "Validation failed", "details": errors}), 400
+            return json_response({"error": "Validation failed", "details": errors}), 400
 
-        with open(file_path, 'w') as f:
-            json.dump(data, f)
+        write_doc(file_path, data)
+        update_sort_indexes(entity, id, data)
+        update_unique_indexes(entity, id, data)
         
         if config['fulltext_enabled']:
             index_document(entity, id, data)
@@ -277,14 +586,13 @@ def update_entity(entity: str, id: int) -> Tuple[Response, int]:
         if config['rserv_graph'] == 'indexed':
             update_graph_index(entity, id, data, 'update')
             update_graph(entity, id, data)
-            save_graph_index(config['adjacency_index_file'])
-            save_graph_to_file(config['adjacency_list_file'])
+            schedule_graph_flush()
         
         # Invalidate cache for this entity after update
-        invalidate_cache(entity)
+        invalidate_cache(entity, (id,))
         
         logger.info(f"Updated resource of entity {entity} with id {id}")
-        return jsonify({"message": f"Resource of entity {entity} with id {id} updated successfully"}), 200
+        return json_response({"message": f"Resource of entity {entity} with id {id} updated successfully"}), 200
     except RServError as e:
         raise e
     except Exception as e:
@@ -301,10 +609,9 @@ def patch_entity(entity: str, id: int) -> Tuple[Response, int]:
         if not os.path.exists(file_path):
             raise RServError(f"Resource of entity {entity} with id {id} not found", status_code=404)
         
-        with open(file_path, 'r') as f:
-            existing_data = json.load(f)
+        existing_data = read_doc(file_path)
         
-        patch_data = request.json
+        patch_data = get_request_data()
         if not patch_data:
             raise RServError("No input data provided", status_code=400)
         
@@ -312,7 +619,7 @@ def patch_entity(entity: str, id: int) -> Tuple[Response, int]:
         merged_data = {**existing_data, **patch_data}
         is_valid, errors = validator.validate(entity, merged_data)
         if not is_valid:
-            return jsonify({"error": "Validation failed", "details": errors}), 400
+            return json_response({"error": "Validation failed", "details": errors}), 400
 
         for key, value in patch_data.items():
             if key != 'id':
@@ -321,8 +628,9 @@ def patch_entity(entity: str, id: int) -> Tuple[Response, int]:
                 else:
                     existing_data[key] = value
         
-        with open(file_path, 'w') as f:
-            json.dump(existing_data, f)
+        write_doc(file_path, existing_data)
+        update_sort_indexes(entity, id, existing_data)
+        update_unique_indexes(entity, id, existing_data)
         
         if config['fulltext_enabled']:
             index_document(entity, id, existing_data)
@@ -330,14 +638,13 @@ def patch_entity(entity: str, id: int) -> Tuple[Response, int]:
         if config['rserv_graph'] == 'indexed':
             update_graph_index(entity, id, existing_data, 'update')
             update_graph(entity, id, existing_data)
-            save_graph_index(config['adjacency_index_file'])
-            save_graph_to_file(config['adjacency_list_file'])
+            schedule_graph_flush()
         
         # Invalidate cache for this entity after patch
-        invalidate_cache(entity)
+        invalidate_cache(entity, (id,))
         
         logger.info(f"Patched {entity} with id {id}")
-        return jsonify({
+        return json_response({
             "message": f"{entity} with id {id} patched successfully",
             "updated_fields": list(patch_data.keys())
         }), 200
@@ -360,35 +667,67 @@ def delete_entity(entity: str, id: int) -> Tuple[Response, int]:
         if config['cascading_delete']:
             deleted = cascade_delete(entity, id)
         else:
-            os.remove(file_path)
-            deleted = [f"{entity}:{id}"]
+            remove_doc(file_path)
+            deleted = [(entity, id)]
         
         if config['fulltext_enabled']:
-            for item in deleted:
-                e, i = item.split(':')
-                remove_from_index(e, int(i))
+            for e, i in deleted:
+                remove_from_index(e, i)
         
         if config['rserv_graph'] == 'indexed':
-            for item in deleted:
-                e, i = item.split(':')
-                data = get_entity_data(e, int(i))
-                update_graph_index(e, int(i), data, 'delete')
-                remove_from_graph(e, int(i))
-            save_graph_index(config['adjacency_index_file'])
-            save_graph_to_file(config['adjacency_list_file'])
-        
-        # Invalidate cache for this entity after deletion
-        invalidate_cache(entity)
+            for e, i in deleted:
+                # The files are already gone; the node's keys come from node_index_keys
+                update_graph_index(e, i, None, 'delete')
+                remove_from_graph(e, i)
+            schedule_graph_flush()
+        
+        # Invalidate cache for every deleted resource, cascaded ones included
+        deleted_ids = defaultdict(list)
+        for e, i in deleted:
+            deleted_ids[e].append(i)
+        for e, i in deleted_ids.items():
+            invalidate_cache(e, tuple(i))
+            for deleted_id in i:
+                update_sort_indexes(e, deleted_id, None)
+                update_unique_indexes(e, deleted_id, None)
+                track_existing_id(e, deleted_id, False)
         
         logger.info(f"Deleted {entity} with id {id}")
-        return jsonify({"message": f"{entity} with id {id} deleted successfully", "cascaded_deletes": deleted}), 200
+        return json_response({"message": f"{entity} with id {id} deleted successfully", "cascaded_deletes": [format_node_id(node) for node in deleted]}), 200
     except RServError as e:
         raise e
     except Exception as e:
         logger.error(f"Unexpected error in delete_entity: {str(e)}")
         raise RServError("An unexpected error occurred", status_code=500)
 
-def cascade_delete(entity: str, id: int) -> List[str]:
+def cascade_delete(entity: str, id: int) -> List[Tuple[str, int]]:
+    # The graph holds every incoming REF of a node as a reverse_ edge, so
+    # dependents are found without scanning the data directory. It is only
+    # kept up to date in indexed mode with the graph enabled
+    if config['rserv_graph'] != 'indexed' or not config['graph_enabled']:
+        return cascade_delete_scan(entity, id)
+
+    root = (entity, id)
+    deleted = []
+    seen = {root}
+    to_delete = deque([root])
+    while to_delete:
+        node_id = to_delete.popleft()
+        file_path = get_entity_file(*node_id)
+        if not os.path.exists(file_path):
+            continue
+
+        remove_doc(file_path)
+        deleted.append(node_id)
+
+        for neighbor, label in graph.get(node_id, {}).items():
+            if label.startswith('reverse_') and neighbor not in seen:
+                seen.add(neighbor)
+                to_delete.append(neighbor)
+
+    return deleted
+
+def cascade_delete_scan(entity: str, id: int) -> List[Tuple[str, int]]:
     deleted = []
     to_delete = [(entity, id)]
     
@@ -397,24 +736,20 @@ def cascade_delete(entity: str, id: int) -> List[str]:
         file_path = get_entity_file(current_entity, current_id)
         
         if os.path.exists(file_path):
-            with open(file_path, 'r') as f:
-                data = json.load(f)
+            data = read_doc(file_path)
             
-            os.remove(file_path)
-            deleted.append(f"{current_entity}:{current_id}")
+            remove_doc(file_path)
+            deleted.append((current_entity, current_id))
             
             # Find references to this entity in other entities
-            for e in os.listdir(os.path.join(BASE_DIR, config['schema_name'])):
-                entity_dir = get_entity_dir(e)
-                for filename in os.listdir(entity_dir):
-                    if filename.endswith('.json'):
-                        with open(os.path.join(entity_dir, filename), 'r') as f:
-                            other_data = json.load(f)
-                        
-                        for key, value in other_data.items():
-                            if isinstance(value, dict) and value.get('type') == 'REF':
-                                if value.get('entity') == current_entity and value.get('id') == current_id:
-                                    to_delete.append((e, other_data['id']))
+            with os.scandir(os.path.join(BASE_DIR, config['schema_name'])) as entries:
+                entities = [entry.name for entry in entries if entry.is_dir()]
+            for e in entities:
+                for other_data in get_all_entities(e):
+                    for key, value in other_data.items():
+                        if isinstance(value, dict) and value.get('type') == 'REF':
+                            if value.get('entity') == current_entity and value.get('id') == current_id:
+                                to_delete.append((e, other_data['id']))
     
     return deleted
 
@@ -428,7 +763,7 @@ def save_entity(entity: str, id: int) -> Tuple[Response, int]:
         if os.path.exists(file_path):
             raise RServError(f"Resource of entity {entity} with id {id} already exists", status_code=409)
         
-        data = request.json
+        data = get_request_data()
         if not data:
             raise RServError("No input data provided", status_code=400)
         
@@ -437,10 +772,12 @@ def save_entity(entity: str, id: int) -> Tuple[Response, int]:
         # Validate foreign keys before saving
         is_valid, errors = validator.validate(entity, data)
         if not is_valid:
-            return jsonify({"error": "Validation failed", "details": errors}), 400
+            return json_response({"error": "Validation failed", "details": errors}), 400
 
-        with open(file_path, 'w') as f:
-            json.dump(data, f)
+        write_doc(file_path, data)
+        update_sort_indexes(entity, id, data)
+        update_unique_indexes(entity, id, data)
+        track_existing_id(entity, id, True)
         
         if config['fulltext_enabled']:
             index_document(entity, id, data)
@@ -448,14 +785,13 @@ def save_entity(entity: str, id: int) -> Tuple[Response, int]:
         if config['rserv_graph'] == 'indexed':
             update_graph_index(entity, id, data, 'create')
             update_graph(entity, id, data)
-            save_graph_index(config['adjacency_index_file'])
-            save_graph_to_file(config['adjacency_list_file'])
+            schedule_graph_flush()
         
         # Invalidate cache for this entity after saving
-        invalidate_cache(entity)
+        invalidate_cache(entity, (id,))
         
         logger.info(f"Saved resource of entity {entity} with id {id}")
-        return jsonify({"message": f"Resource of entity {entity} saved successfully with id {id}"}), 201
+        return json_response({"message": f"Resource of entity {entity} saved successfully with id {id}"}), 201
     except RServError as e:
         raise e
     except Exception as e:
@@ -472,33 +808,169 @@ def get_sorting_params() -> List[Tuple[str, str]]:
     sort_params = request.args.get('sort', 'id:asc')
     return [tuple(param.split(':')) for param in sort_params.split(',')]
 
+class Reversor:
+    """Inverts the ordering of a wrapped value, for descending fields in a sort key."""
+    __slots__ = ('value',)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __eq__(self, other: 'Reversor') -> bool:
+        return self.value == other.value
+
+    def __lt__(self, other: 'Reversor') -> bool:
+        return other.value < self.value
+
 def sort_entities(entities: List[Dict[str, Any]], sort_params: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
-    def multi_field_comparator(a: Dict[str, Any], b: Dict[str, Any]) -> int:
-        for field, order in sort_params:
-            a_val = a.get(field)
-            b_val = b.get(field)
-            if a_val != b_val:
-                if order == 'asc':
-                    return (a_val > b_val) - (a_val < b_val)
-                else:
-                    return (a_val < b_val) - (a_val > b_val)
-        return 0
+    fields = [(field, order == 'asc') for field, order in sort_params]
+
+    def multi_field_key(entity: Dict[str, Any]) -> Tuple[Any, ...]:
+        key = []
+        for field, ascending in fields:
+            value = entity.get(field)
+            # Missing fields sort last in either direction, as in the sort indexes
+            key.append((value is None, value if ascending else Reversor(value)))
+        return tuple(key)
     
-    return sorted(entities, key=functools.cmp_to_key(multi_field_comparator))
-
-def paginate_results(results: List[Dict[str, Any]], page: int, per_page: int) -> Dict[str, Any]:
-    total = len(results)
+    return sorted(entities, key=multi_field_key)
+
+def paginate_results(results: List[Dict[str, Any]], page: int, per_page: int, total: Optional[int] = None) -> Dict[str, Any]:
+    # When total is given, results already holds just the requested page
+    if total is None:
+        total = len(results)
+        start = (page - 1) * per_page
+        results = results[start:start + per_page]
     total_pages = max(1, (total + per_page - 1) // per_page)
-    start = (page - 1) * per_page
-    end = start + per_page
     return {
-        "items": results[start:end],
+        "items": results,
         "total": total,
         "page": page,
         "per_page": per_page,
         "total_pages": total_pages
     }
 
+# Single-field sort indexes: entity -> field -> (sorted [(key, id)], {id: key}).
+# Built on the first listing sorted by the field and kept in step with writes,
+# so a page is a slice of ids and only per_page documents are read.
+sort_indexes = defaultdict(dict)
+sort_index_lock = threading.Lock()
+
+def sort_index_key(value: Any) -> Tuple[bool, Any]:
+    # Documents without the field sort after all others, ascending or descending
+    return (value is None, value)
+
+def get_sorted_page(entity: str, field: str, descending: bool, start: int, count: int) -> Optional[Tuple[List[int], int]]:
+    """Returns the ids of one page sorted by field, and the total, or None if the field can't be indexed."""
+    with sort_index_lock:
+        field_index = sort_indexes[entity].get(field)
+        if field_index is None:
+            keys = {doc['id']: sort_index_key(doc.get(field)) for doc in get_all_entities(entity)}
+            try:
+                entries = sorted((key, id) for id, key in keys.items())
+            except TypeError:
+                # Mixed value types have no order of their own
+                return None
+            field_index = sort_indexes[entity][field] = (entries, keys)
+        entries = field_index[0]
+        total = len(entries)
+        if descending:
+            # Reverse only the documents that have the field; the rest stay at the end
+            present = bisect_left(entries, ((True,),))
+            end = max(0, present - start)
+            page = entries[max(0, end - count):end][::-1]
+            page += entries[present + max(0, start - present):max(present, start + count)]
+        else:
+            page = entries[start:start + count]
+        return [id for _, id in page], total
+
+def update_sort_indexes(entity: str, id: int, data: Optional[Dict[str, Any]]) -> None:
+    """Moves a document within the entity's sort indexes; data is None when it was deleted."""
+    with sort_index_lock:
+        field_indexes = sort_indexes.get(entity)
+        if not field_indexes:
+            return
+        for field, (entries, keys) in list(field_indexes.items()):
+            try:
+                old_key = keys.pop(id, None)
+                if old_key is not None:
+                    del entries[bisect_left(entries, (old_key, id))]
+                if data is not None:
+                    keys[id] = sort_index_key(data.get(field))
+                    insort(entries, (keys[id], id))
+            except TypeError:
+                # The new value can't be ordered against the rest; rebuild on next use
+                del field_indexes[field]
+
+# Unique field indexes: (entity, field) -> ({value key: set of ids}, {id: value key}).
+# Built on the first validation of a unique field and kept in step with
+# writes, so a uniqueness check is a dict lookup instead of a directory scan.
+unique_indexes = {}
+unique_index_lock = threading.Lock()
+
+def unique_value_key(value: Any) -> Any:
+    # Lists and objects are compared by their serialized form
+    return _dumps(value) if isinstance(value, (dict, list)) else value
+
+def unique_conflict(entity: str, field: str, value: Any, id: Optional[int]) -> bool:
+    """Returns whether a document other than id already holds value in field."""
+    with unique_index_lock:
+        field_index = unique_indexes.get((entity, field))
+        if field_index is None:
+            holders, keys = defaultdict(set), {}
+            for doc in get_all_entities(entity):
+                if field in doc:
+                    keys[doc['id']] = key = unique_value_key(doc[field])
+                    holders[key].add(doc['id'])
+            field_index = unique_indexes[(entity, field)] = (holders, keys)
+        ids = field_index[0].get(unique_value_key(value), ())
+        return any(other != id for other in ids)
+
+def update_unique_indexes(entity: str, id: int, data: Optional[Dict[str, Any]]) -> None:
+    """Moves a document within the entity's unique indexes; data is None when it was deleted."""
+    with unique_index_lock:
+        for (index_entity, field), (holders, keys) in unique_indexes.items():
+            if index_entity != entity:
+                continue
+            if id in keys:
+                old_key = keys.pop(id)
+                holders[old_key].discard(id)
+                if not holders[old_key]:
+                    del holders[old_key]
+            if data is not None and field in data:
+                keys[id] = key = unique_value_key(data[field])
+                holders[key].add(id)
+
+# Ids of the documents stored for each entity, as file name stems, loaded on
+# the first foreign key check against the entity and kept in step with
+# creates and deletes
+existing_ids = {}
+existing_ids_lock = threading.Lock()
+
+def document_exists(entity: str, id: Any) -> bool:
+    """Returns whether entity has a document with the given id, without a stat per call."""
+    stem = str(id)
+    with existing_ids_lock:
+        ids = existing_ids.get(entity)
+        if ids is None:
+            with os.scandir(get_entity_dir(entity)) as it:
+                ids = existing_ids[entity] = {e.name[:-5] for e in it if e.name.endswith('.json') and e.name[:-5].isdigit()}
+        if stem in ids:
+            return True
+    # Another process may have created it since the set was loaded
+    if stem.isdigit() and os.path.exists(get_entity_file(entity, stem)):
+        track_existing_id(entity, stem, True)
+        return True
+    return False
+
+def track_existing_id(entity: str, id: Any, exists: bool) -> None:
+    with existing_ids_lock:
+        ids = existing_ids.get(entity)
+        if ids is not None:
+            if exists:
+                ids.add(str(id))
+            else:
+                ids.discard(str(id))
+
 @app.route('/api/v1/<entity>/list', methods=['GET'])
 def list_entities(entity: str) -> Tuple[Response, int]:
     try:
@@ -509,19 +981,31 @@ def list_entities(entity: str) -> Tuple[Response, int]:
         
         # Check if paginated list is in cache
         cache_key = f"{entity}:list:{page}:{per_page}:{sort_params}"
-        if cache_key in cache:
+        cached = cache_get(cache_key)
+        if cached is not None:
             logger.info(f"Retrieved paginated list of {entity} from cache")
-            return jsonify(cache[cache_key]), 200
+            return json_response(cached), 200
         
-        entities = get_all_entities(entity)
-        sorted_entities = sort_entities(entities, sort_params)
-        paginated_results = paginate_results(sorted_entities, page, per_page)
+        sorted_page = None
+        if len(sort_params) == 1 and len(sort_params[0]) == 2:
+            field, order = sort_params[0]
+            sorted_page = get_sorted_page(entity, field, order != 'asc', (page - 1) * per_page, per_page)
+        
+        if sorted_page is not None:
+            ids, total = sorted_page
+            items = [read_doc(get_entity_file(entity, id)) for id in ids]
+            paginated_results = paginate_results(items, page, per_page, total)
+        else:
+            entities = get_all_entities(entity)
+            sorted_entities = sort_entities(entities, sort_params)
+            paginated_results = paginate_results(sorted_entities, page, per_page)
         
         # Cache the paginated results
-        cache[cache_key] = paginated_results
+        cache_set(cache_key, paginated_results)
+        remember_list_key(entity, cache_key)
         
         logger.info(f"Listed {entity} (page {page}, {per_page} per page)")
-        return jsonify(paginated_results), 200
+        return json_response(paginated_results), 200
     except RServError as e:
         raise e
     except Exception as e:
@@ -529,35 +1013,42 @@ def list_entities(entity: str) -> Tuple[Response, int]:
         raise RServError("An unexpected error occurred", status_code=500)
 
 def get_all_entities(entity: str) -> List[Dict[str, Any]]:
-    entity_dir = get_entity_dir(entity)
-    entities = []
-    for filename in os.listdir(entity_dir):
-        if filename.endswith('.json'):
-            with open(os.path.join(entity_dir, filename), 'r') as f:
-                entities.append(json.load(f))
-    return entities
+    # Document files are named <id>.json; skip the id file kept alongside them
+    with os.scandir(get_entity_dir(entity)) as it:
+        paths = [e.path for e in it if e.name.endswith('.json') and e.name[:-5].isdigit()]
+    return list(scan_pool.map(read_doc, paths))
 
 # Full-text search
+TOKEN_RE = re.compile(r'\w+')
+
 def tokenize(text: str) -> List[str]:
-    return re.findall(r'\w+', text.lower())
+    return TOKEN_RE.findall(text.lower())
 
 def index_document(entity: str, doc_id: int, content: Dict[str, Any]) -> None:
-    tokens = set(tokenize(json.dumps(content)))
-    for token in tokens:
-        fulltext_index[token].add(f"{entity}:{doc_id}")
+    tokens = set(tokenize(_dumps(content).decode('utf-8')))
+    old_tokens = doc_tokens.get((entity, doc_id), set())
+    discard_postings(entity, doc_id, old_tokens - tokens)
+    for token in tokens - old_tokens:
+        fulltext_index[token].setdefault(entity, set()).add(doc_id)
+    doc_tokens[(entity, doc_id)] = tokens
 
 def remove_from_index(entity: str, doc_id: int) -> None:
-    for token_set in fulltext_index.values():
-        token_set.discard(f"{entity}:{doc_id}")
+    discard_postings(entity, doc_id, doc_tokens.pop((entity, doc_id), ()))
 
-def search_fulltext(query: str, limit: int = 10) -> List[str]:
+def discard_postings(entity: str, doc_id: int, tokens: Iterable[str]) -> None:
+    for token in tokens:
+        doc_ids = fulltext_index.get(token, {}).get(entity)
+        if doc_ids:
+            doc_ids.discard(doc_id)
+
+def search_fulltext(query: str, limit: int = 10) -> List[Tuple[str, int]]:
     query_tokens = tokenize(query)
-    results = defaultdict(int)
+    results = Counter()
     for token in query_tokens:
-        for doc_ref in fulltext_index.get(token, []):
-            results[doc_ref] += 1
+        for entity, doc_ids in fulltext_index.get(token, {}).items():
+            results.update((entity, doc_id) for doc_id in doc_ids)
     
-    return sorted(results, key=results.get, reverse=True)[:limit]
+    return [doc_ref for doc_ref, _ in results.most_common(limit)]
 
 @app.route('/api/v1/search', methods=['POST'])
 def fulltext_search() -> Tuple[Response, int]:
@@ -565,7 +1056,7 @@ def fulltext_search() -> Tuple[Response, int]:
         if not config['fulltext_enabled']:
             raise RServError("Full-text search is not enabled", status_code=400)
         
-        data = request.json
+        data = get_request_data()
         if not data:
             raise RServError("No input data provided", status_code=400)
         
@@ -578,13 +1069,12 @@ def fulltext_search() -> Tuple[Response, int]:
         results = search_fulltext(query, limit)
         
         documents = []
-        for doc_ref in results:
-            entity, doc_id = doc_ref.split(':')
-            doc = get_entity(entity, int(doc_id))
-            if doc:
+        for entity, doc_id in results:
+            doc = get_entity_data(entity, doc_id)
+            if doc is not None:
                 documents.append(doc)
         
-        return jsonify({"results": documents}), 200
+        return json_response({"results": documents}), 200
     except RServError as e:
         raise e
     except Exception as e:
@@ -596,86 +1086,225 @@ def update_graph(entity: str, id: int, data: Dict[str, Any]) -> None:
     if not config['graph_enabled']:
         return
 
-    node_id = f"{entity}:{id}"
+    global graph_version
+    node_id = (sys.intern(entity), id)
     
-    # Remove existing edges for this node
-    remove_from_graph(entity, id)
+    # Replace only the node's own REFs; the reverse_ edges of the documents
+    # pointing at it stay, since those documents have not changed
+    edges = graph.get(node_id)
+    if edges:
+        for target, label in list(edges.items()):
+            if not label.startswith('reverse_'):
+                del edges[target]
+                target_edges = graph.get(target)
+                if target_edges is not None and target_edges.get(node_id) == f"reverse_{label}":
+                    del target_edges[node_id]
+    graph_version += 1
     
-    # Add new edges based on current data
+    # Add new edges based on current data. Labels and entity names repeat on
+    # every edge, so they are interned and shared instead of stored per edge
     for key, value in data.items():
         if isinstance(value, dict) and value.get('type') == 'REF':
             ref_entity = value.get('entity')
             ref_id = value.get('id')
             if ref_entity and ref_id:
-                target_node = f"{ref_entity}:{ref_id}"
-                graph[node_id][target_node] = key
+                target_node = (sys.intern(ref_entity), int(ref_id))
+                graph[node_id][target_node] = sys.intern(key)
                 # Add reverse edge
-                graph[target_node][node_id] = f"reverse_{key}"
+                graph[target_node][node_id] = sys.intern(f"reverse_{key}")
 
 def remove_from_graph(entity: str, id: int) -> None:
+    global graph_version
     if not config['graph_enabled']:
         return
 
-    node_id = f"{entity}:{id}"
-    
-    # Remove all edges where this node is the target
-    for source_node in list(graph.keys()):
-        if node_id in graph[source_node]:
-            del graph[source_node][node_id]
+    node_id = (entity, id)
+    graph_version += 1
     
-    # Remove the node itself
-    if node_id in graph:
-        del graph[node_id]
+    # Every edge is stored in both directions, so the nodes pointing at this
+    # one are exactly its own neighbors
+    edges = graph.pop(node_id, None)
+    if edges:
+        for neighbor in edges:
+            neighbor_edges = graph.get(neighbor)
+            if neighbor_edges is not None:
+                neighbor_edges.pop(node_id, None)
+
+def intern_node(node_id: Tuple[str, int]) -> Tuple[str, int]:
+    """Returns the node with its entity name interned, so equal nodes share the string."""
+    return (sys.intern(node_id[0]), node_id[1])
+
+def format_node_id(node_id: Tuple[str, int]) -> str:
+    """Formats a (entity, id) graph node as the 'entity:id' string used in files and responses."""
+    return f"{node_id[0]}:{node_id[1]}"
+
+class CSRView:
+    """Read-only compressed sparse row copy of the graph used by traversals.
+
+    Nodes are numbered 0..N-1; the neighbors of node u are
+    neighbors[indptr[u]:indptr[u + 1]], with the matching edge labels in
+    edge_label as indexes into labels. node_type holds each node's entity as
+    an index into types, so traversals compare small ints instead of strings.
+    """
+    def __init__(self, graph: Dict[Tuple[str, int], Dict[Tuple[str, int], str]], version: int):
+        self.graph = graph
+        self.version = version
+        self.nodes = list(graph)
+        self.node_index = {node: i for i, node in enumerate(self.nodes)}
+        self.types = []
+        self.type_ids = {}
+        self.node_type = array('i')
+        for entity, _ in self.nodes:
+            type_id = self.type_ids.get(entity)
+            if type_id is None:
+                type_id = self.type_ids[entity] = len(self.types)
+                self.types.append(entity)
+            self.node_type.append(type_id)
+        self.labels = []
+        self.label_ids = label_ids = {}
+        self.indptr = array('i', [0])
+        self.neighbors = array('i')
+        self.edge_label = array('i')
+        for node in self.nodes:
+            for neighbor, label in graph[node].items():
+                v = self.node_index.get(neighbor)
+                if v is None:
+                    continue
+                label_id = label_ids.get(label)
+                if label_id is None:
+                    label_id = label_ids[label] = len(self.labels)
+                    self.labels.append(label)
+                self.neighbors.append(v)
+                self.edge_label.append(label_id)
+            self.indptr.append(len(self.neighbors))
+        self._type_nodes = {}
+
+    def nodes_of_type(self, entity: str) -> List[Tuple[str, int]]:
+        """Returns the nodes of an entity; each list is built on first use and kept with the view."""
+        nodes = self._type_nodes.get(entity)
+        if nodes is None:
+            type_id = self.type_ids.get(entity)
+            nodes = [] if type_id is None else [self.nodes[i] for i, t in enumerate(self.node_type) if t == type_id]
+            self._type_nodes[entity] = nodes
+        return nodes
+
+    def step_filter(self, node_pattern: Dict[str, Any], rel_pattern: Dict[str, Any]) -> Tuple[int, int, bool]:
+        """Encodes a path step as (type id, label id, needs full match); -1 matches anything."""
+        type_id = -1 if node_pattern['type'] is None else self.type_ids.get(node_pattern['type'], -2)
+        label_id = -1 if rel_pattern['type'] is None else self.label_ids.get(rel_pattern['type'], -2)
+        return type_id, label_id, bool(node_pattern['props'] or rel_pattern['props'])
+
+def get_csr_view() -> CSRView:
+    """Returns the CSR view of the current graph, rebuilding it if the graph changed."""
+    global csr_view
+    with csr_lock:
+        if csr_view is None or csr_view.graph is not graph or csr_view.version != graph_version:
+            csr_view = CSRView(graph, graph_version)
+        return csr_view
 
 def populate_document(entity: str, doc: Dict[str, Any], lookup_fields: List[str], depth: int = 0, max_depth: Optional[int] = None) -> Dict[str, Any]:
     if max_depth is None:
         max_depth = config['ref_embed_depth']
     
-    if depth >= max_depth:
-        return doc
-    
-    for field in lookup_fields:
-        if field in doc and isinstance(doc[field], dict) and doc[field].get('type') == 'REF':
-            ref = doc[field]
-            ref_entity, ref_id = ref['entity'], ref['id']
-            ref_doc = get_entity(ref_entity, ref_id)
+    # Resolve references one level at a time, loading each distinct
+    # referenced document once per level however many places point at it
+    level = [doc]
+    while level and depth < max_depth:
+        placements = defaultdict(list)
+        for parent in level:
+            for field in lookup_fields:
+                ref = parent.get(field)
+                if isinstance(ref, dict) and ref.get('type') == 'REF':
+                    placements[(ref['entity'], ref['id'])].append((parent, field))
+        
+        level = []
+        for (ref_entity, ref_id), sites in placements.items():
+            ref_doc = get_entity_data(ref_entity, ref_id)
             if ref_doc:
                 # Replace the REF with the actual document
-                doc[field] = populate_document(ref_entity, ref_doc, lookup_fields, depth + 1, max_depth)
+                for parent, field in sites:
+                    parent[field] = ref_doc
+                level.append(ref_doc)
+        depth += 1
     
     return doc
 
 
+# Sulpher query grammar, compiled once
+SULPHER_RE = re.compile(r'((?:BFS|DFS) )?MATCH ((?:\([^\)]+\)(?:-\[[^\]]+\]->)?)+)(?: WHERE (.+))? RETURN (.+)')
+PATH_RE = re.compile(r'\(([^\)]+)\)(?:-\[([^\]]+)\]->)?')
+PROPS_RE = re.compile(r'{([^}]+)}')
+WHERE_RE = re.compile(r'(?:(\w+)\.(\w+)|id\((\w+)\))\s*([=<>!]+)\s*(.+)')
+PARAM_RE = re.compile(r'\$(\w+)')
+NAME_RE = re.compile(r'\w+')
+INT_RE = re.compile(r'-?\d+')
+FLOAT_RE = re.compile(r'-?(?:\d+\.\d*|\.\d+|\d+(?=[eE]))(?:[eE][-+]?\d+)?')
+WHERE_OPS = {'=': operator.eq, '!=': operator.ne, '>': operator.gt, '<': operator.lt, '>=': operator.ge, '<=': operator.le}
+AGGREGATES = ('COUNT', 'SUM', 'AVG', 'MIN', 'MAX')
+CYCLE_ERROR, CYCLE_DISABLE, CYCLE_WARN, CYCLE_IGNORE = range(4)
+CYCLE_MODES = {'error': CYCLE_ERROR, 'disable': CYCLE_DISABLE, 'warn': CYCLE_WARN, 'ignore': CYCLE_IGNORE}
+
+class QueryParam:
+    """A $name placeholder in a Sulpher query, filled in from the query's params when it runs."""
+    __slots__ = ('name',)
+
+    def __init__(self, name: str):
+        self.name = name
+
 class SulpherQuery:
-    def __init__(self, query_string: str, max_depth: int = config['max_query_depth']):
+    def __init__(self, query_string: str, max_depth: int = config['max_query_depth'], params: Optional[Dict[str, Any]] = None):
         self.query_string = query_string
+        self.params = params or {}
         self.query_id = str(uuid.uuid4())
         self.status = 'pending'
+        self.columns = None
         self.result = None
         self.stats = {'nodes_traversed': 0, 'start_time': None, 'end_time': None}
         self.parsed_query = None
         self.max_depth = max_depth
 
     def parse(self):
-        pattern = r'((?:BFS|DFS) )?MATCH ((?:\([^\)]+\)(?:-\[[^\]]+\]->)?)+)(?: WHERE (.+))? RETURN (.+)'
-        match = re.match(pattern, self.query_string)
+        plan = compile_sulpher(self.query_string)
+        self.parsed_query = self.bind(plan) if plan['has_params'] else plan
+
+    def bind(self, plan: Dict[str, Any]) -> Dict[str, Any]:
+        """Returns a copy of a shared plan with its $name placeholders replaced by self.params."""
+        def value(v: Any) -> Any:
+            if not isinstance(v, QueryParam):
+                return v
+            if v.name not in self.params:
+                raise ValueError(f"Missing query parameter: {v.name}")
+            return self.params[v.name]
+
+        path = [{
+            'node': {**step['node'], 'props': {k: value(v) for k, v in step['node']['props'].items()}},
+            'relationship': {**step['relationship'], 'props': {k: value(v) for k, v in step['relationship']['props'].items()}}
+        } for step in plan['path']]
+        where = [{**condition, 'value': value(condition['value'])} for condition in plan['where']] if plan['where'] else plan['where']
+        return self.finish_plan(plan['algorithm'], path, where, plan['return'])
+
+    @classmethod
+    def compile(cls, query_string: str) -> Dict[str, Any]:
+        """Parses a query string into its plan; plans are shared, so they must not be mutated."""
+        match = SULPHER_RE.match(query_string)
         if not match:
             raise ValueError("Invalid Sulpher query format")
         
         algorithm, path_pattern, where_clause, return_clause = match.groups()
         
         # Parse path pattern
-        path_parts = re.findall(r'\(([^\)]+)\)(?:-\[([^\]]+)\]->)?', path_pattern)
+        path_parts = PATH_RE.findall(path_pattern)
         parsed_path = []
         for node, relationship in path_parts:
             node_parts = node.split(':')
-            node_var = node_parts[0]
-            node_type = node_parts[1] if len(node_parts) > 1 else None
-            node_props = self._parse_properties(node)
+            node_var = sys.intern(node_parts[0])
+            node_type = sys.intern(node_parts[1]) if len(node_parts) > 1 else None
+            node_props = cls._parse_properties(node)
             
             rel_parts = relationship.split(':') if relationship else [None, None]
             rel_type = rel_parts[1] if len(rel_parts) > 1 else rel_parts[0]
-            rel_props = self._parse_properties(relationship) if relationship else {}
+            rel_type = sys.intern(rel_type) if rel_type else rel_type
+            rel_props = cls._parse_properties(relationship) if relationship else {}
             
             parsed_path.append({
                 'node': {'var': node_var, 'type': node_type, 'props': node_props},
@@ -683,52 +1312,85 @@ class SulpherQuery:
             })
         
         # Parse WHERE clause
-        where_conditions = self._parse_where_clause(where_clause) if where_clause else None
+        where_conditions = cls._parse_where_clause(where_clause) if where_clause else None
         
         # Parse RETURN clause
         return_items = [item.strip() for item in return_clause.split(',')]
         
-        self.parsed_query = {
-            'algorithm': algorithm.strip() if algorithm else 'BFS',
+        return cls.finish_plan(algorithm.strip() if algorithm else 'BFS', parsed_path, where_conditions, return_items)
+
+    @classmethod
+    def finish_plan(cls, algorithm: str, parsed_path: List[Dict[str, Any]],
+                    where_conditions: Optional[List[Dict[str, Any]]], return_items: List[str]) -> Dict[str, Any]:
+        values = [v for step in parsed_path for part in ('node', 'relationship') for v in step[part]['props'].values()]
+        values += [condition['value'] for condition in where_conditions or ()]
+        return {
+            'algorithm': algorithm,
             'path': parsed_path,
+            'has_params': any(isinstance(v, QueryParam) for v in values),
+            # Per depth: the variable bound there, and the (node pattern,
+            # pattern of the relationship leading into it) a match must meet
+            'vars': [step['node']['var'] for step in parsed_path],
+            'steps': [None] + [(parsed_path[depth]['node'], parsed_path[depth - 1]['relationship'])
+                               for depth in range(1, len(parsed_path))],
             'where': where_conditions,
-            'return': return_items
+            'return': return_items,
+            'return_plan': [cls._plan_return_item(item) for item in return_items]
         }
 
-    def _parse_properties(self, string: str) -> Dict[str, Any]:
-        props_match = re.search(r'{([^}]+)}', string)
+    @staticmethod
+    def _plan_return_item(item: str) -> Tuple[str, str, str, Optional[str]]:
+        """Resolves a RETURN item once into (kind, item, variable, property or aggregate)."""
+        if '.' in item:
+            var, prop = item.split('.')
+            return 'prop', item, var, prop
+        if item.endswith(')') and '(' in item:
+            function = item[:item.index('(')]
+            if function in AGGREGATES:
+                return 'agg', item, item[item.index('(')+1:-1], function
+        return 'var', item, item, None
+
+    @classmethod
+    def _parse_properties(cls, string: str) -> Dict[str, Any]:
+        props_match = PROPS_RE.search(string)
         if not props_match:
             return {}
         props_str = props_match.group(1)
-        return {k.strip(): self._parse_value(v.strip()) for k, v in [prop.split(':') for prop in props_str.split(',')]}
+        return {sys.intern(k.strip()): cls._parse_value(v.strip()) for k, v in [prop.split(':') for prop in props_str.split(',')]}
 
-    def _parse_where_clause(self, where_clause: str) -> List[Dict[str, Any]]:
+    @classmethod
+    def _parse_where_clause(cls, where_clause: str) -> List[Dict[str, Any]]:
         conditions = where_clause.split('AND')
         parsed_conditions = []
         for condition in conditions:
-            match = re.match(r'(\w+)\.(\w+)\s*([=<>]+)\s*(.+)', condition.strip())
+            match = WHERE_RE.match(condition.strip())
             if match:
-                var, prop, op, value = match.groups()
+                var, prop, id_var, op, value = match.groups()
+                # id(n) compares the node's 'entity:id' and has no property
                 parsed_conditions.append({
-                    'variable': var,
-                    'property': prop,
+                    'variable': sys.intern(var or id_var),
+                    'property': sys.intern(prop) if prop else None,
                     'operator': op,
-                    'value': self._parse_value(value)
+                    'compare': WHERE_OPS.get(op),
+                    'value': cls._parse_value(value)
                 })
         return parsed_conditions
 
-    def _parse_value(self, value: str) -> Any:
-        try:
-            if value.isdigit():
-                return int(value)
-            elif value.replace('.', '').isdigit():
-                return float(value)
-            elif value.lower() in ('true', 'false'):
-                return value.lower() == 'true'
-            else:
-                return value.strip('"\'')  # Return string if it doesn't match any type
-        except ValueError:
-            raise ValueError(f"Invalid value type: {value}")
+    @staticmethod
+    def _parse_value(value: str) -> Any:
+        param = PARAM_RE.fullmatch(value)
+        if param:
+            return QueryParam(param.group(1))
+        elif INT_RE.fullmatch(value):
+            return int(value)
+        elif FLOAT_RE.fullmatch(value):
+            return float(value)
+        elif value in ('true', 'True'):
+            return True
+        elif value in ('false', 'False'):
+            return False
+        else:
+            return value.strip('"\'')  # Return string if it doesn't match any type
 
     def execute(self, graph: Dict[str, Dict[str, Any]]):
         self.stats['start_time'] = time.time()
@@ -743,6 +1405,7 @@ class SulpherQuery:
         # Process RETURN clause
         final_results = self._process_return_clause(results, graph)
         
+        self.columns = self.parsed_query['return']
         self.result = final_results
         self.status = 'completed'
         self.stats['end_time'] = time.time()
@@ -750,159 +1413,247 @@ class SulpherQuery:
         # Cache the query result if it is successful
         if self.status == 'completed':
             cache_key = f"query:{self.query_id}"
-            cache[cache_key] = (self.result, self.stats)
+            cache_set(cache_key, (self.columns, self.result, self.stats), config['graph_result_ttl'])
 
     def _traverse_graph(self, graph: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
         path = self.parsed_query['path']
         start_nodes = self._find_matching_nodes(graph, path[0]['node'])
         
         results = []
+        # Both traversals walk the CSR arrays rather than the dict of dicts
+        csr = get_csr_view()
+        self._step_filters = [None] + [csr.step_filter(*step) for step in self.parsed_query['steps'][1:]]
+        dfs = self.parsed_query['algorithm'] == 'DFS'
+        if dfs:
+            # One flag per CSR node; DFS clears what it sets while backtracking,
+            # so the same buffer serves every start node
+            visited = bytearray(len(csr.nodes))
+            # The cycle strategy is resolved once per query, not per node
+            if config['graph_cycle_detection'] not in CYCLE_MODES:
+                raise ValueError(f"Invalid graph_cycle_detection setting: {config['graph_cycle_detection']}")
+            self._cycle_mode = CYCLE_MODES[config['graph_cycle_detection']]
         for start_node in start_nodes:
-            if self.parsed_query['algorithm'] == 'BFS':
-                self._bfs(graph, start_node, path, results)
+            if start_node not in csr.node_index:
+                continue
+            if dfs:
+                self._dfs(csr, csr.node_index[start_node], path, results, visited)
             else:
-                self._dfs(graph, start_node, path, 1, {path[0]['node']['var']: start_node}, results, set())
+                self._bfs(csr, csr.node_index[start_node], path, results)
         
         return results
 
             
 
-    def _bfs(self, graph: Dict[str, Dict[str, Any]], start_node: str, path: List[Dict[str, Any]], results: List[Dict[str, Any]]):
-        queue = [(start_node, 1, {path[0]['node']['var']: start_node})]
+    def _bfs(self, csr: CSRView, start_node: int, path: List[Dict[str, Any]], results: List[Dict[str, Any]]):
+        # Each queue entry carries its breadcrumbs as a linked (node, parent)
+        # chain shared with its siblings; bindings are built only for results
+        indptr, neighbors, edge_label, node_type = csr.indptr, csr.neighbors, csr.edge_label, csr.node_type
+        path_vars, steps = self.parsed_query['vars'], self.parsed_query['steps']
+        queue = deque([(start_node, 1, (start_node, None))])
         while queue:
-            current_node, depth, path_so_far = queue.pop(0)
+            current_node, depth, breadcrumbs = queue.popleft()
             
             if depth == len(path):
-                results.append(path_so_far.copy())
+                nodes = []
+                while breadcrumbs is not None:
+                    node, breadcrumbs = breadcrumbs
+                    nodes.append(csr.nodes[node])
+                nodes.reverse()
+                results.append(dict(zip(path_vars, nodes)))
                 continue
             
             if depth > self.max_depth:
                 continue
             
             self.stats['nodes_traversed'] += 1
-            current_pattern = path[depth]
-            
-            for neighbor, edge_data in graph[current_node].items():
-                if self._match_pattern(graph, neighbor, edge_data, current_pattern):
-                    new_path = path_so_far.copy()
-                    new_path[current_pattern['node']['var']] = neighbor
-                    queue.append((neighbor, depth + 1, new_path))
-
-    def _dfs(self, graph: Dict[str, Dict[str, Any]], current_node: str, path: List[Dict[str, Any]], 
-             depth: int, path_so_far: Dict[str, str], results: List[Dict[str, Any]], visited: set):
-        if depth == len(path):
-            results.append(path_so_far.copy())
-            return
-        
-        if depth > self.max_depth:
-            return
-        
-        self.stats['nodes_traversed'] += 1
-        current_pattern = path[depth]
-
-        # Cycle Detection Implementation
-        if config['graph_cycle_detection'] == 'error' and current_node in visited:
-            raise ValueError(f"Cycle detected at node: {current_node} during DFS traversal.")
-        elif config['graph_cycle_detection'] == 'disable':
-            # Do nothing (cycles are ignored)
-            pass
-        elif config['graph_cycle_detection'] == 'warn':
-            logger.warning(f"Cycle detected at node: {current_node} during DFS traversal.")
-        elif config['graph_cycle_detection'] == 'ignore':
-            # Do nothing (cycles are ignored)
-            pass 
-        else:
-            raise ValueError(f"Invalid graph_cycle_detection setting: {config['graph_cycle_detection']}")
-
-        for neighbor, edge_data in graph[current_node].items():
-            if neighbor in visited:
-                continue  # Skip already visited nodes to prevent cycles
+            want_type, want_label, full_match = self._step_filters[depth]
             
-            if self._match_pattern(graph, neighbor, edge_data, current_pattern):
-                path_so_far[current_pattern['node']['var']] = neighbor
-                visited.add(neighbor)
-                self._dfs(graph, neighbor, path, depth + 1, path_so_far, results, visited)
-                visited.remove(neighbor)
-                path_so_far.pop(current_pattern['node']['var'])
-
-    def _match_pattern(self, graph: Dict[str, Dict[str, Any]], node: str, edge_data: Dict[str, Any], pattern: Dict[str, Any]) -> bool:
-        node_data = graph[node]
-        return (pattern['node']['type'] is None or node_data['type'] == pattern['node']['type']) and \
-               all(node_data.get(k) == v for k, v in pattern['node']['props'].items()) and \
-               (pattern['relationship']['type'] is None or edge_data['type'] == pattern['relationship']['type']) and \
-               all(edge_data.get(k) == v for k, v in pattern['relationship']['props'].items())
+            for k in range(indptr[current_node], indptr[current_node + 1]):
+                v = neighbors[k]
+                if (want_label != -1 and edge_label[k] != want_label) or (want_type != -1 and node_type[v] != want_type):
+                    continue
+                if full_match and not self._match_pattern(csr.graph, csr.nodes[v], csr.labels[edge_label[k]], *steps[depth]):
+                    continue
+                queue.append((v, depth + 1, (v, breadcrumbs)))
+
+    def _dfs(self, csr: CSRView, start_node: int, path: List[Dict[str, Any]],
+             results: List[Dict[str, Any]], visited: bytearray):
+        # Iterative DFS: each stack frame is [node, depth, cursor into the
+        # node's neighbor slice], and bound[d] is the node matched for path[d]
+        indptr, neighbors, edge_label, node_type = csr.indptr, csr.neighbors, csr.edge_label, csr.node_type
+        bound = [start_node] * len(path)
+        path_vars, steps = self.parsed_query['vars'], self.parsed_query['steps']
+        cycle_mode = self._cycle_mode
+        warn_cycles = cycle_mode == CYCLE_WARN and logger.isEnabledFor(logging.WARNING)
+        stack = []
+        current_node, depth = start_node, 1
+        while True:
+            # Enter current_node at depth
+            if depth == len(path):
+                results.append(dict(zip(path_vars, [csr.nodes[v] for v in bound])))
+                visited[current_node] = 0
+            elif depth > self.max_depth:
+                visited[current_node] = 0
+            else:
+                self.stats['nodes_traversed'] += 1
+                stack.append([current_node, depth, indptr[current_node]])
+
+            # Advance the innermost frame to its next matching neighbor and
+            # descend into it; frames with no neighbors left are popped
+            while stack:
+                frame = stack[-1]
+                u, d, k = frame
+                # Type and label checks are int compares against the step's
+                # encoded filter; only property patterns fall back to _match_pattern
+                want_type, want_label, full_match = self._step_filters[d]
+                end = indptr[u + 1]
+                while k < end:
+                    v = neighbors[k]
+                    k += 1
+                    if visited[v]:
+                        # An edge back into the current path is a cycle; it is
+                        # never followed, and only reported when configured to
+                        if cycle_mode == CYCLE_ERROR:
+                            raise ValueError(f"Cycle detected at node: {format_node_id(csr.nodes[v])} during DFS traversal.")
+                        if warn_cycles:
+                            logger.warning(f"Cycle detected at node: {format_node_id(csr.nodes[v])} during DFS traversal.")
+                        continue
+                    if (want_label != -1 and edge_label[k - 1] != want_label) or (want_type != -1 and node_type[v] != want_type):
+                        continue
+                    if full_match and not self._match_pattern(csr.graph, csr.nodes[v], csr.labels[edge_label[k - 1]], *steps[d]):
+                        continue
+                    break
+                else:
+                    stack.pop()
+                    visited[u] = 0
+                    continue
+                frame[2] = k
+                visited[v] = 1
+                bound[d] = v
+                current_node, depth = v, d + 1
+                break
+            else:
+                return
+
+    def _match_pattern(self, graph: Dict[str, Dict[str, Any]], node: Tuple[str, int], label: str,
+                       node_pattern: Dict[str, Any], rel_pattern: Dict[str, Any]) -> bool:
+        # Nodes are (entity, id) pairs and edges carry only their label, so
+        # the node type is the entity and the relationship type is the label.
+        # rel_pattern is the relationship of the previous path step, i.e. the
+        # edge leading into this node
+        node_data = graph.get(node, {})
+        return (node_pattern['type'] is None or node[0] == node_pattern['type']) and \
+               all(node_data.get(k) == v for k, v in node_pattern['props'].items()) and \
+               (rel_pattern['type'] is None or label == rel_pattern['type']) and \
+               not rel_pattern['props']
 
     def _find_matching_nodes(self, graph: Dict[str, Dict[str, Any]], node_pattern: Dict[str, Any]) -> List[str]:
-        matching_nodes = []
+        candidate_sets = []
         if config['rserv_graph'] == 'indexed':
-            # Index-based lookup
-            matching_nodes = set(index.get(node_pattern['type'], set()))
+            if node_pattern['type'] is not None:
+                candidate_sets.append(index.get(node_pattern['type'], set()))
             for prop, value in node_pattern['props'].items():
-                matching_nodes &= set(index.get(f"{prop}:{value}", set()))
+                candidate_sets.append(index.get(f"{prop}:{value}", set()))
+        if candidate_sets:
+            # Index-based lookup, intersecting from the most selective set
+            candidate_sets.sort(key=len)
+            matching_nodes = set(candidate_sets[0])
+            for candidates in candidate_sets[1:]:
+                if not matching_nodes:
+                    break
+                matching_nodes &= candidates
+            return list(matching_nodes)
+        # Nothing to look up (no index, or an untyped pattern without
+        # properties): take the type's nodes from the CSR view, which keeps
+        # them per graph version, and check properties on those alone
+        if node_pattern['type'] is None:
+            candidates = graph
         else:
-            # Default behavior: Iterate through all nodes
-            for node, data in graph.items():
-                if (node_pattern['type'] is None or data['type'] == node_pattern['type']) and \
-                   all(data.get(k) == v for k, v in node_pattern['props'].items()):
-                    matching_nodes.append(node)
-        return list(matching_nodes)  # Return a list of matching node IDs
+            csr = get_csr_view()
+            if csr.graph is graph:
+                candidates = csr.nodes_of_type(node_pattern['type'])
+            else:
+                candidates = [node for node in graph if node[0] == node_pattern['type']]
+        props = node_pattern['props'].items()
+        if not props:
+            return list(candidates)
+        return [node for node in candidates if all(graph[node].get(k) == v for k, v in props)]
 
     def _apply_where_conditions(self, results: List[Dict[str, Any]], graph: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
-        filtered_results = []
-        for result in results:
-            if all(self._evaluate_condition(condition, result, graph) for condition in self.parsed_query['where']):
-                filtered_results.append(result)
-        return filtered_results
-
-    def _evaluate_condition(self, condition: Dict[str, Any], result: Dict[str, str], graph: Dict[str, Dict[str, Any]]) -> bool:
-        node_id = result[condition['variable']]
-        node_data = graph[node_id]
-        actual_value = node_data.get(condition['property'])
-        expected_value = condition['value']
-        
-        if condition['operator'] == '=':
-            return actual_value == expected_value
-        elif condition['operator'] == '>':
-            return actual_value > expected_value
-        elif condition['operator'] == '<':
-            return actual_value < expected_value
-        elif condition['operator'] == '>=':
-            return actual_value >= expected_value
-        elif condition['operator'] == '<=':
-            return actual_value <= expected_value
-        elif condition['operator'] == '!=':
-            return actual_value != expected_value
-        
-        return False
-
-    def _process_return_clause(self, results: List[Dict[str, Any]], graph: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
-        processed_results = []
-        for result in results:
-            processed_result = {}
-            for item in self.parsed_query['return']:
-                if '.' in item:
-                    var, prop = item.split('.')
-                    node_id = result[var]
-                    node_data = graph[node_id]
-                    processed_result[item] = node_data.get(prop)
-                elif item.startswith(('COUNT(', 'SUM(', 'AVG(', 'MIN(', 'MAX(')):
-                    var = item[item.index('(')+1:-1]  # Extract variable name from aggregation function
-                    if item.startswith('COUNT('):
-                        processed_result[item] = len([r.get(var) for r in results if r.get(var) is not None])
-                    elif item.startswith('SUM('):
-                        processed_result[item] = sum([r.get(var) for r in results if r.get(var) is not None])
-                    elif item.startswith('AVG('):
-                        values = [r.get(var) for r in results if r.get(var) is not None]
-                        processed_result[item] = sum(values) / len(values) if len(values) > 0 else None
-                    elif item.startswith('MIN('):
-                        processed_result[item] = min([r.get(var) for r in results if r.get(var) is not None])
-                    elif item.startswith('MAX('):
-                        processed_result[item] = max([r.get(var) for r in results if r.get(var) is not None])
-                else:
-                    processed_result[item] = result[item]
-            processed_results.append(processed_result)
+        # Conditions are applied one column at a time over the surviving rows.
+        # Many rows bind the same node, so each distinct node is evaluated
+        # once per condition and the rows are filtered by the outcome
+        for condition in self.parsed_query['where']:
+            var = condition['variable']
+            outcome = {node_id: self._evaluate_condition(condition, node_id, graph)
+                       for node_id in {result[var] for result in results}}
+            results = [result for result in results if outcome[result[var]]]
+            if not results:
+                break
+        return results
 
-        return processed_results
+    def _evaluate_condition(self, condition: Dict[str, Any], node_id: Tuple[str, int], graph: Dict[str, Dict[str, Any]]) -> bool:
+        if condition['property'] is None:
+            actual_value = format_node_id(node_id)
+        else:
+            actual_value = graph.get(node_id, {}).get(condition['property'])
+        compare = condition['compare']
+        return compare is not None and compare(actual_value, condition['value'])
+
+    def _process_return_clause(self, results: List[Dict[str, Any]], graph: Dict[str, Dict[str, Any]]) -> List[Tuple[Any, ...]]:
+        # Rows are tuples in the order of the RETURN items; the column names
+        # are kept once in self.columns instead of repeated in every row
+        plan = self.parsed_query['return_plan']
+        # Aggregates are the same for every row, so each is computed once
+        aggregates = {item: self._aggregate(function, var, results)
+                      for kind, item, var, function in plan if kind == 'agg'}
+
+        return [
+            tuple(graph.get(result[var], {}).get(prop) if kind == 'prop'
+                  else aggregates[item] if kind == 'agg'
+                  else result[item]
+                  for kind, item, var, prop in plan)
+            for result in results
+        ]
+
+    def _aggregate(self, function: str, var: str, results: List[Dict[str, Any]]) -> Any:
+        values = [value for value in (r.get(var) for r in results) if value is not None]
+        if function == 'COUNT':
+            return len(values)
+        elif function == 'SUM':
+            return sum(values)
+        elif function == 'AVG':
+            return sum(values) / len(values) if values else None
+        elif function == 'MIN':
+            return min(values)
+        else:
+            return max(values)
+
+@lru_cache(maxsize=1024)
+def compile_sulpher(query_string: str) -> Dict[str, Any]:
+    """Returns the cached plan of a query string, parsing it on first use."""
+    return SulpherQuery.compile(query_string)
+
+# Query templates used by the graph endpoints; values are bound to the $name
+# placeholders, and only validated integers and names are formatted in
+Q_NODE_BY_ID = "MATCH (n) WHERE id(n) = $id RETURN n"
+Q_SHORTEST_PATH = "MATCH p = shortestPath((a)-[*1..{max_depth}]-(b)) WHERE id(a) = $start AND id(b) = $end RETURN p"
+Q_RELATIONSHIP_TYPES = {
+    'in': "MATCH (n)<-[r]-() WHERE id(n) = $id RETURN DISTINCT type(r) as type",
+    'out': "MATCH (n)-[r]->() WHERE id(n) = $id RETURN DISTINCT type(r) as type",
+    'all': "MATCH (n)-[r]-() WHERE id(n) = $id RETURN DISTINCT type(r) as type"
+}
+Q_COMMON_NEIGHBORS = "MATCH (a)-[]-(c)-[]-(b) WHERE id(a) = $a AND id(b) = $b RETURN DISTINCT c"
+Q_NODE_DEGREE = {
+    'in': "MATCH (n)<-[r]-() WHERE id(n) = $id RETURN count(r) as degree",
+    'out': "MATCH (n)-[r]->() WHERE id(n) = $id RETURN count(r) as degree",
+    'all': "MATCH (n)-[r]-() WHERE id(n) = $id RETURN count(r) as degree"
+}
+Q_PATH_EXISTS = "MATCH p = (a)-[*1..{max_depth}]-(b) WHERE id(a) = $start AND id(b) = $end RETURN exists(p) as path_exists"
+Q_NEIGHBORHOOD_AGGREGATE = "MATCH (n)-[*1..{depth}]-(m) WHERE id(n) = $id RETURN {aggregation}(m.{property}) as result"
+Q_INCOMING_EDGES = "MATCH (n)<-[r]-(m) WHERE id(n) = $id RETURN m, type(r) as relationship_type, properties(r) as relationship_properties"
+Q_OUTGOING_EDGES = "MATCH (n)-[r]->(m) WHERE id(n) = $id RETURN m, type(r) as relationship_type, properties(r) as relationship_properties"
+Q_SUBGRAPH = "MATCH (n)-[r*1..{depth}]-(m) WHERE id(n) = $id RETURN n, r, m"
 
 # API Endpoints
 
@@ -912,30 +1663,33 @@ def create_graph_query() -> Tuple[Response, int]:
         if not config['graph_enabled']:
             return create_error_response("Graph querying is not enabled", 400)
         
-        query_string = request.json.get('query')
-        max_depth = request.json.get('max_depth', config['max_query_depth'])
+        data = get_request_data()
+        query_string = data.get('query')
+        max_depth = data.get('max_depth', config['max_query_depth'])
         
         if not query_string:
             return create_error_response("Query string is required", 400)
         
         query = SulpherQuery(query_string, max_depth)
-        query_storage[query.query_id] = query
+        with query_storage_lock:
+            query_storage[query.query_id] = query
         
-        # Execute query asynchronously
-        asyncio.create_task(execute_graph_query(query))
+        # Execute query in the background
+        query_pool.submit(execute_graph_query, query)
         
         # Check if the query result is in cache
         cache_key = f"query:{query.query_id}"
-        if cache_key in cache:
+        cached = cache_get(cache_key)
+        if cached is not None:
             query.status = 'completed'
-            query.result, query.stats = cache[cache_key]
+            query.columns, query.result, query.stats = cached
             response = create_resource_response("query", {
                 "query_id": query.query_id,
                 "status": query.status
             }, {
                 "result": {"href": url_for('get_graph_query_result', query_id=query.query_id)}
             })
-            return jsonify(response), 200
+            return json_response(response), 200
         
         response = create_resource_response("query", {
             "query_id": query.query_id,
@@ -943,17 +1697,21 @@ def create_graph_query() -> Tuple[Response, int]:
         }, {
             "result": {"href": url_for('get_graph_query_result', query_id=query.query_id)}
         })
-        return jsonify(response), 202
+        return json_response(response), 202
     except Exception as e:
         logger.error(f"Unexpected error in create_graph_query: {str(e)}")
         return create_error_response("An unexpected error occurred", 500)
 
-async def execute_graph_query(query: SulpherQuery) -> None:
+def execute_graph_query(query: SulpherQuery) -> None:
     try:
         query.execute(graph)  # Assuming 'graph' is your graph data structure
     except Exception as e:
         query.status = 'failed'
         query.result = str(e)
+    finally:
+        # Failed queries may have no end time; they expire from now
+        with query_expiry_lock:
+            heapq.heappush(query_expiry_heap, (query.stats['end_time'] or time.time(), query.query_id))
 
 @app.route('/api/v1/graph/query/<query_id>', methods=['GET'])
 def get_graph_query_status(query_id: str) -> Tuple[Response, int]:
@@ -968,7 +1726,7 @@ def get_graph_query_status(query_id: str) -> Tuple[Response, int]:
         }, {
             "result": {"href": url_for('get_graph_query_result', query_id=query.query_id)}
         })
-        return jsonify(response), 200
+        return json_response(response), 200
     except Exception as e:
         logger.error(f"Unexpected error in get_graph_query_status: {str(e)}")
         return create_error_response("An unexpected error occurred", 500)
@@ -983,22 +1741,55 @@ def get_graph_query_result(query_id: str) -> Tuple[Response, int]:
         if query.status != 'completed':
             return create_error_response("Query has not completed yet", 400)
         
+        if wants_ndjson():
+            return Response(stream_query_result(query), mimetype='application/x-ndjson'), 200
+        
         response = create_resource_response("query_result", {
-            "result": query.result,
+            "columns": query.columns,
+            "rows": query.result,
             "stats": query.stats
         }, {
             "query": {"href": url_for('get_graph_query_status', query_id=query.query_id)}
         })
-        return jsonify(response), 200
+        return json_response(response), 200
     except Exception as e:
         logger.error(f"Unexpected error in get_graph_query_result: {str(e)}")
         return create_error_response("An unexpected error occurred", 500)
 
+def wants_ndjson() -> bool:
+    """True when the client asked for NDJSON, with ?format=ndjson or its Accept header."""
+    return request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == 'application/x-ndjson'
+
+def stream_ndjson(items: Iterable[Any]) -> Iterable[bytes]:
+    """Returns items as NDJSON lines, encoded as they are sent.
+
+    The first item is built before returning, so an error producing the items
+    still surfaces in the caller as an error response rather than mid-stream.
+    """
+    items = iter(items)
+    first = next(items, None)
+
+    def lines() -> Iterable[bytes]:
+        if first is None:
+            return
+        yield _dumps(first) + b"\n"
+        try:
+            for item in items:
+                yield _dumps(item) + b"\n"
+        except Exception as e:
+            # The status line is already out; all that is left is to end the stream
+            logger.error(f"Error while streaming NDJSON: {str(e)}")
+    return lines()
+
+def stream_query_result(query: SulpherQuery) -> Iterable[bytes]:
+    """Yields a query result as NDJSON: a header line with the columns and stats, then one line per row."""
+    yield _dumps({"columns": query.columns, "stats": query.stats}) + b"\n"
+    yield from stream_ndjson(query.result)
+
 @app.route('/api/v1/graph/nodes/<node_id>', methods=['GET'])
 def get_node_properties(node_id: str) -> Tuple[Response, int]:
     try:
-        query = f"MATCH (n) WHERE id(n) = '{node_id}' RETURN n"
-        result = execute_sulpher_query(query)
+        result = execute_sulpher_query(Q_NODE_BY_ID, id=node_id)
         if result:
             node_data = result[0]['n']
             links = {
@@ -1007,7 +1798,7 @@ def get_node_properties(node_id: str) -> Tuple[Response, int]:
                 "neighborhood": {"href": url_for('get_neighborhood_aggregate')}
             }
             response = create_resource_response("node", node_data, links)
-            return jsonify(response), 200
+            return json_response(response), 200
         return create_error_response("Node not found", 404)
     except Exception as e:
         logger.error(f"Unexpected error in get_node_properties: {str(e)}")
@@ -1016,20 +1807,18 @@ def get_node_properties(node_id: str) -> Tuple[Response, int]:
 @app.route('/api/v1/graph/shortestPath', methods=['POST'])
 def find_shortest_path() -> Tuple[Response, int]:
     try:
-        data = request.json
+        data = get_request_data()
         start_node_id = data.get('start_node_id')
         end_node_id = data.get('end_node_id')
         max_depth = data.get('max_depth', config['max_query_depth'])
 
         if not start_node_id or not end_node_id:
             return create_error_response("Start and end node IDs are required", 400)
+        if not isinstance(max_depth, int):
+            return create_error_response("max_depth must be an integer", 400)
 
-        query = f"""
-        MATCH p = shortestPath((a)-[*1..{max_depth}]-(b))
-        WHERE id(a) = '{start_node_id}' AND id(b) = '{end_node_id}'
-        RETURN p
-        """
-        result = execute_sulpher_query(query)
+        query = Q_SHORTEST_PATH.format(max_depth=max_depth)
+        result = execute_sulpher_query(query, start=start_node_id, end=end_node_id)
         if result:
             path_data = result[0]['p']
             links = {
@@ -1037,7 +1826,7 @@ def find_shortest_path() -> Tuple[Response, int]:
                 "end_node": {"href": url_for('get_node_properties', node_id=end_node_id)}
             }
             response = create_resource_response("shortest_path", path_data, links)
-            return jsonify(response), 200
+            return json_response(response), 200
         return create_error_response("No path found", 404)
     except Exception as e:
         logger.error(f"Unexpected error in find_shortest_path: {str(e)}")
@@ -1046,20 +1835,24 @@ def find_shortest_path() -> Tuple[Response, int]:
 @app.route('/api/v1/graph/nodes/search', methods=['POST'])
 def search_nodes() -> Tuple[Response, int]:
     try:
-        search_criteria = request.json
+        search_criteria = get_request_data()
         conditions = []
-        for key, value in search_criteria.items():
-            conditions.append(f"n.{key} = '{value}'")
+        params = {}
+        for i, (key, value) in enumerate(search_criteria.items()):
+            if not NAME_RE.fullmatch(key):
+                return create_error_response(f"Invalid property name: {key}", 400)
+            conditions.append(f"n.{key} = $p{i}")
+            params[f"p{i}"] = value
         where_clause = " AND ".join(conditions)
         query = f"MATCH (n) WHERE {where_clause} RETURN n"
-        result = execute_sulpher_query(query)
+        result = execute_sulpher_query(query, **params)
         
         nodes = [node['n'] for node in result]
         links = {
             "create_node": {"href": url_for('create_node')}  # Assuming you have a create_node endpoint
         }
         response = create_collection_response("nodes", nodes, links)
-        return jsonify(response), 200
+        return json_response(response), 200
     except Exception as e:
         logger.error(f"Unexpected error in search_nodes: {str(e)}")
         return create_error_response("An unexpected error occurred", 500)
@@ -1069,14 +1862,8 @@ def search_nodes() -> Tuple[Response, int]:
 def get_relationship_types(node_id: str) -> Tuple[Response, int]:
     try:
         direction = request.args.get('direction', default='all')
-        if direction == 'in':
-            query = f"MATCH (n)<-[r]-() WHERE id(n) = '{node_id}' RETURN DISTINCT type(r) as type"
-        elif direction == 'out':
-            query = f"MATCH (n)-[r]->() WHERE id(n) = '{node_id}' RETURN DISTINCT type(r) as type"
-        else:
-            query = f"MATCH (n)-[r]-() WHERE id(n) = '{node_id}' RETURN DISTINCT type(r) as type"
-        
-        result = execute_sulpher_query(query)
+        query = Q_RELATIONSHIP_TYPES.get(direction, Q_RELATIONSHIP_TYPES['all'])
+        result = execute_sulpher_query(query, id=node_id)
         relationship_types = [r['type'] for r in result]
         links = {
             "node": {"href": url_for('get_node_properties', node_id=node_id)},
@@ -1084,7 +1871,7 @@ def get_relationship_types(node_id: str) -> Tuple[Response, int]:
             "outgoing": {"href": url_for('get_outgoing_edges', node_ref=node_id)}
         }
         response = create_collection_response("relationship_types", relationship_types, links)
-        return jsonify(response), 200
+        return json_response(response), 200
     except Exception as e:
         logger.error(f"Unexpected error in get_relationship_types: {str(e)}")
         return create_error_response("An unexpected error occurred", 500)
@@ -1092,26 +1879,21 @@ def get_relationship_types(node_id: str) -> Tuple[Response, int]:
 @app.route('/api/v1/graph/commonNeighbors', methods=['POST'])
 def get_common_neighbors() -> Tuple[Response, int]:
     try:
-        data = request.json
+        data = get_request_data()
         node_id1 = data.get('node_id1')
         node_id2 = data.get('node_id2')
 
         if not node_id1 or not node_id2:
             return create_error_response("Both node IDs are required", 400)
 
-        query = f"""
-        MATCH (a)-[]-(c)-[]-(b)
-        WHERE id(a) = '{node_id1}' AND id(b) = '{node_id2}'
-        RETURN DISTINCT c
-        """
-        result = execute_sulpher_query(query)
+        result = execute_sulpher_query(Q_COMMON_NEIGHBORS, a=node_id1, b=node_id2)
         common_neighbors = [r['c'] for r in result]
         links = {
             "node1": {"href": url_for('get_node_properties', node_id=node_id1)},
             "node2": {"href": url_for('get_node_properties', node_id=node_id2)}
         }
         response = create_collection_response("common_neighbors", common_neighbors, links)
-        return jsonify(response), 200
+        return json_response(response), 200
     except Exception as e:
         logger.error(f"Unexpected error in get_common_neighbors: {str(e)}")
         return create_error_response("An unexpected error occurred", 500)
@@ -1120,20 +1902,15 @@ def get_common_neighbors() -> Tuple[Response, int]:
 def get_node_degree(node_id: str) -> Tuple[Response, int]:
     try:
         direction = request.args.get('direction', default='all')
-        if direction == 'in':
-            query = f"MATCH (n)<-[r]-() WHERE id(n) = '{node_id}' RETURN count(r) as degree"
-        elif direction == 'out':
-            query = f"MATCH (n)-[r]->() WHERE id(n) = '{node_id}' RETURN count(r) as degree"
-        else:
-            query = f"MATCH (n)-[r]-() WHERE id(n) = '{node_id}' RETURN count(r) as degree"
-        result = execute_sulpher_query(query)
+        query = Q_NODE_DEGREE.get(direction, Q_NODE_DEGREE['all'])
+        result = execute_sulpher_query(query, id=node_id)
         degree = result[0]['degree']
         links = {
             "node": {"href": url_for('get_node_properties', node_id=node_id)},
             "relationships": {"href": url_for('get_relationship_types', node_id=node_id)}
         }
         response = create_resource_response("node_degree", {"node_id": node_id, "degree": degree, "direction": direction}, links)
-        return jsonify(response), 200
+        return json_response(response), 200
     except Exception as e:
         logger.error(f"Unexpected error in get_node_degree: {str(e)}")
         return create_error_response("An unexpected error occurred", 500)
@@ -1141,20 +1918,18 @@ def get_node_degree(node_id: str) -> Tuple[Response, int]:
 @app.route('/api/v1/graph/pathExists', methods=['POST'])
 def check_path_existence() -> Tuple[Response, int]:
     try:
-        data = request.json
+        data = get_request_data()
         start_node_id = data.get('start_node_id')
         end_node_id = data.get('end_node_id')
         max_depth = data.get('max_depth', config['max_query_depth'])
 
         if not start_node_id or not end_node_id:
             return create_error_response("Start and end node IDs are required", 400)
+        if not isinstance(max_depth, int):
+            return create_error_response("max_depth must be an integer", 400)
 
-        query = f"""
-        MATCH p = (a)-[*1..{max_depth}]-(b)
-        WHERE id(a) = '{start_node_id}' AND id(b) = '{end_node_id}'
-        RETURN exists(p) as path_exists
-        """
-        result = execute_sulpher_query(query)
+        query = Q_PATH_EXISTS.format(max_depth=max_depth)
+        result = execute_sulpher_query(query, start=start_node_id, end=end_node_id)
         path_exists = result[0]['path_exists']
         links = {
             "start_node": {"href": url_for('get_node_properties', node_id=start_node_id)},
@@ -1167,7 +1942,7 @@ def check_path_existence() -> Tuple[Response, int]:
             "path_exists": path_exists,
             "max_depth": max_depth
         }, links)
-        return jsonify(response), 200
+        return json_response(response), 200
     except Exception as e:
         logger.error(f"Unexpected error in check_path_existence: {str(e)}")
         return create_error_response("An unexpected error occurred", 500)
@@ -1175,7 +1950,7 @@ def check_path_existence() -> Tuple[Response, int]:
 @app.route('/api/v1/graph/nodes/neighborhoodAggregate', methods=['POST'])
 def get_neighborhood_aggregate() -> Tuple[Response, int]:
     try:
-        data = request.json
+        data = get_request_data()
         node_id = data.get('node_id')
         depth = data.get('depth', 1)
         agg_property = data.get('property', 'id')
@@ -1186,13 +1961,13 @@ def get_neighborhood_aggregate() -> Tuple[Response, int]:
 
         if agg_function not in ['count', 'sum', 'avg']:
             return create_error_response("Invalid aggregation function", 400)
+        if not isinstance(agg_property, str) or not NAME_RE.fullmatch(agg_property):
+            return create_error_response("Invalid property name", 400)
+        if not isinstance(depth, int):
+            return create_error_response("depth must be an integer", 400)
         
-        query = f"""
-        MATCH (n)-[*1..{depth}]-(m)
-        WHERE id(n) = '{node_id}'
-        RETURN {agg_function}(m.{agg_property}) as result
-        """
-        result = execute_sulpher_query(query)
+        query = Q_NEIGHBORHOOD_AGGREGATE.format(depth=depth, aggregation=agg_function, property=agg_property)
+        result = execute_sulpher_query(query, id=node_id)
         aggregation_result = result[0]['result']
         links = {
             "node": {"href": url_for('get_node_properties', node_id=node_id)},
@@ -1205,7 +1980,7 @@ def get_neighborhood_aggregate() -> Tuple[Response, int]:
             "aggregation": agg_function,
             "result": aggregation_result
         }, links)
-        return jsonify(response), 200
+        return json_response(response), 200
     except Exception as e:
         logger.error(f"Unexpected error in get_neighborhood_aggregate: {str(e)}")
         return create_error_response("An unexpected error occurred", 500)
@@ -1213,22 +1988,25 @@ def get_neighborhood_aggregate() -> Tuple[Response, int]:
 @app.route('/api/v1/graph/statistics', methods=['GET'])
 def get_graph_statistics() -> Tuple[Response, int]:
     try:
-        queries = [
-            "MATCH (n) RETURN count(n) as node_count",
-            "MATCH ()-[r]->() RETURN count(r) as edge_count",
-            "MATCH (n) RETURN avg(size((n)-[]->())) as avg_out_degree"
-        ]
-        stats = {}
-        for query in queries:
-            result = execute_sulpher_query(query)
-            stats.update(result[0])
+        # Read straight off the CSR arrays rather than scanning the graph once
+        # per figure; every REF is stored twice, with its reverse_ twin not
+        # counted as an outgoing edge
+        csr = get_csr_view()
+        forward = [not label.startswith('reverse_') for label in csr.labels]
+        node_count = len(csr.nodes)
+        edge_count = sum(1 for label_id in csr.edge_label if forward[label_id])
+        stats = {
+            "node_count": node_count,
+            "edge_count": edge_count,
+            "avg_out_degree": edge_count / node_count if node_count else 0
+        }
         
         links = {
             "nodes": {"href": url_for('search_nodes')},
             "query": {"href": url_for('create_graph_query')}
         }
         response = create_resource_response("graph_statistics", stats, links)
-        return jsonify(response), 200
+        return json_response(response), 200
     except Exception as e:
         logger.error(f"Unexpected error in get_graph_statistics: {str(e)}")
         return create_error_response("An unexpected error occurred", 500)
@@ -1236,13 +2014,11 @@ def get_graph_statistics() -> Tuple[Response, int]:
 @app.route('/api/v1/graph/<node_ref>/in', methods=['GET'])
 def get_incoming_edges(node_ref: str) -> Tuple[Response, int]:
     try:
-        query = f"""
-        MATCH (n)<-[r]-(m)
-        WHERE id(n) = '{node_ref}'
-        RETURN m, type(r) as relationship_type, properties(r) as relationship_properties
-        """
-        result = execute_sulpher_query(query)
-        incoming = [
+        result = execute_sulpher_query(Q_INCOMING_EDGES, id=node_ref)
+        if isinstance(result, str):
+            logger.error(f"Edge query failed for {node_ref}: {result}")
+            return create_error_response("An unexpected error occurred", 500)
+        incoming = (
             {
                 "source": {
                     "id": r['m']['id'],
@@ -1255,26 +2031,40 @@ def get_incoming_edges(node_ref: str) -> Tuple[Response, int]:
                 "target": node_ref
             }
             for r in result
-        ]
+        )
+        if wants_ndjson():
+            return Response(stream_ndjson(incoming), mimetype='application/x-ndjson'), 200
         links = {
             "node": {"href": url_for('get_node_properties', node_id=node_ref)},
             "outgoing": {"href": url_for('get_outgoing_edges', node_ref=node_ref)}
         }
-        response = create_collection_response("incoming_edges", incoming, links)
-        return jsonify(response), 200
+        response = create_collection_response("incoming_edges", list(incoming), links)
+        return json_response(response), 200
     except Exception as e:
         logger.error(f"Unexpected error in get_incoming_edges: {str(e)}")
         return create_error_response("An unexpected error occurred", 500)
 
 
-def execute_sulpher_query(query: str) -> List[Dict[str, Any]]:
-    sulpher_query = SulpherQuery(query)
-    asyncio.run(execute_graph_query(sulpher_query))
-    return sulpher_query.result
+def execute_sulpher_query(query: str, **params: Any) -> List[Dict[str, Any]]:
+    # The query does no I/O, so it runs inline rather than on a fresh event loop.
+    # Values are passed as params for the query's $name placeholders, never
+    # spliced into its text, so they can't alter the query and the plan is shared
+    sulpher_query = SulpherQuery(query, params=params)
+    try:
+        sulpher_query.execute(graph)
+    except Exception as e:
+        sulpher_query.status = 'failed'
+        sulpher_query.result = str(e)
+        return sulpher_query.result
+    columns = sulpher_query.columns
+    return [dict(zip(columns, row)) for row in sulpher_query.result]
 
 # Validation helpers
+ENTITY_NAME_RE = re.compile(r'[a-zA-Z0-9_]+')
+QUERY_FORMAT_RE = re.compile(r'(BFS|DFS)?\s*MATCH\s*\(.*\).*')
+
 def validate_entity_name(entity: str) -> None:
-    if not re.match(r'^[a-zA-Z0-9_]+$', entity):
+    if not ENTITY_NAME_RE.fullmatch(entity):
         raise RServError("Invalid entity name", status_code=400)
 
 def validate_id(id: Any) -> None:
@@ -1282,7 +2072,7 @@ def validate_id(id: Any) -> None:
         raise RServError("Invalid ID", status_code=400)
 
 def validate_query(query: str) -> None:
-    if not re.match(r'^(BFS|DFS)?\s*MATCH\s*\(.*\).*$', query):
+    if not QUERY_FORMAT_RE.fullmatch(query):
         raise RServError("Invalid query format", status_code=400)
 
 # Dynamic schema validator
@@ -1290,6 +2080,14 @@ class DynamicValidator:
     def __init__(self, schemas: Dict[str, Any], schema_name: str):
         self.schemas = schemas
         self.schema_name = schema_name
+        # Schema regexes are compiled once here rather than looked up in the
+        # re module's cache on every validated field
+        self.patterns = {
+            (entity, field): re.compile(rules["regex"])
+            for entity, schema in schemas.items()
+            for field, rules in schema.items()
+            if "regex" in rules
+        }
 
     def validate(self, entity: str, data: Dict[str, Any]) -> Tuple[bool, List[str]]:
         if entity not in self.schemas:
@@ -1310,7 +2108,7 @@ class DynamicValidator:
                         errors.append(f"Field {field} must be a string")
                     elif "max_length" in rules and len(value) > rules["max_length"]:
                         errors.append(f"Field {field} exceeds maximum length of {rules['max_length']}")
-                    elif "regex" in rules and not re.match(rules["regex"], value):
+                    elif "regex" in rules and not self.patterns[(entity, field)].match(value):
                         errors.append(f"Field {field} does not match the required pattern: {rules['regex']}")
                 elif field_type == "integer":
                     if not isinstance(value, int):
@@ -1346,205 +2144,158 @@ class DynamicValidator:
                 if "foreign_key" in rules:
                     fk_entity = rules["foreign_key"]["entity"]
                     fk_field = rules["foreign_key"]["field"]
-                    fk_file = os.path.join(BASE_DIR, self.schema_name, fk_entity, f"{value}.json")
-                    if not os.path.exists(fk_file):
+                    if not document_exists(fk_entity, value):
                         errors.append(f"Foreign key constraint failed: {fk_entity} with {fk_field}={value} does not exist")
 
                 if "unique" in rules and rules["unique"] and field in data:
-                    entity_dir = get_entity_dir(entity)
-                    for filename in os.listdir(entity_dir):
-                        if filename.endswith(".json") and filename != f"{value}.json":
-                            file_path = os.path.join(entity_dir, filename)
-                            with open(file_path, "r") as f:
-                                existing_data = json.load(f)
-                            if existing_data.get(field) == value:
-                                errors.append(f"Field {field} must be unique")
-                                break
+                    if unique_conflict(entity, field, value, data.get('id')):
+                        errors.append(f"Field {field} must be unique")
 
         return len(errors) == 0, errors
 
 validator = DynamicValidator(schemas, config['schema_name'])
 
 # Cache management
-def invalidate_cache(entity: str) -> None:
-    """Invalidate cache entries related to the given entity."""
-    for key in list(cache.keys()):
-        if entity in key:
-            del cache[key]
-
-async def cleanup_expired_data() -> None:
-    """Cleanup expired queries and cache entries."""
-    while True:
+def invalidate_cache(entity: str, ids: Tuple[int, ...] = ()) -> None:
+    """Invalidate the cached list pages of the entity and the cached copies of the given ids."""
+    id_keys = [f"{entity}:{id}" for id in ids]
+    if not isinstance(cache, TTLCache):
+        # Redis: take the entity's page set and drop it in one transaction,
+        # then unlink the pages without blocking the server on their memory
+        list_keys_key = f"{entity}:list_keys"
+        page_keys, _ = cache.pipeline().smembers(list_keys_key).unlink(list_keys_key).execute()
+        keys = id_keys + list(page_keys)
+        if keys:
+            cache.unlink(*keys)
+        return
+    with cache_lock:
+        for key in list_cache_keys.pop(entity, ()):
+            cache.pop(key, None)
+        for key in id_keys:
+            cache.pop(key, None)
+
+# Sets the cache TTL on the keys of one SCAN page that have no expiry, inside
+# Redis; ARGV is the cursor, the MATCH pattern, the page size and the TTL.
+# Returns the next cursor and the number of keys updated
+EXPIRE_PERSISTENT_LUA = """
+local page = redis.call('SCAN', ARGV[1], 'MATCH', ARGV[2], 'COUNT', ARGV[3])
+local updated = 0
+for _, key in ipairs(page[2]) do
+    if redis.call('TTL', key) == -1 then
+        redis.call('EXPIRE', key, ARGV[4])
+        updated = updated + 1
+    end
+end
+return {page[1], updated}
+"""
+
+def cache_key_patterns() -> List[str]:
+    """Returns SCAN patterns covering the Redis keys rserv writes: query results and per-entity keys."""
+    patterns = ['query:*']
+    data_dir = os.path.join(BASE_DIR, config['schema_name'])
+    if os.path.isdir(data_dir):
+        with os.scandir(data_dir) as entries:
+            patterns += [f"{entry.name}:*" for entry in entries if entry.is_dir() and ENTITY_NAME_RE.fullmatch(entry.name)]
+    return patterns
+
+def expire_persistent_cache_keys() -> int:
+    """Gives rserv's Redis keys left without an expiry (e.g. by older releases) the cache TTL.
+
+    Only keys matching cache_key_patterns() are looked at, so other data in
+    the same Redis database is left alone. Each SCAN page is checked and
+    updated by a server-side script, so the sweep costs one round trip per
+    page and no key crosses the wire. Returns the number of keys updated.
+    """
+    script = cache.register_script(EXPIRE_PERSISTENT_LUA)
+    updated = 0
+    for pattern in cache_key_patterns():
+        cursor = 0
+        while True:
+            cursor, page_updated = script(args=[cursor, pattern, config['redis_scan_count'], config['cache_ttl']])
+            updated += page_updated
+            cursor = int(cursor)
+            if cursor == 0:
+                break
+    return updated
+
+def sweep_persistent_cache_keys() -> None:
+    """Runs expire_persistent_cache_keys once; a one-off migration done at startup."""
+    try:
+        updated = expire_persistent_cache_keys()
+        if updated:
+            logger.info(f"Set an expiry on {updated} persistent Redis cache keys")
+    except Exception as e:
+        logger.error(f"Error expiring persistent cache keys: {str(e)}")
+
+def cleanup_expired_data() -> None:
+    """Cleanup expired queries. Cache entries expire on their own: TTLCache
+    evicts them and Redis keys are written with an expiry."""
+    global query_storage
+    while not cleanup_stop.is_set():
         try:
-            now = time.time()
             # Clean up expired queries
-            expired_queries = [qid for qid, query in query_storage.items() 
-                               if query.stats['end_time'] and now - query.stats['end_time'] > config['graph_query_ttl']]
-            for qid in expired_queries:
-                del query_storage[qid]
-            
-            # Clean up expired cache entries
-            if isinstance(cache, TTLCache):
-                # TTLCache automatically handles expiration
-                pass
-            elif isinstance(cache, redis.Redis):
-                # Redis requires explicit key deletion
-                expired_cache = [key for key in cache.keys() if now - cache.ttl(key) > config['cache_ttl']]
-                for key in expired_cache:
-                    cache.delete(key)
+            cutoff = time.time() - config['graph_query_ttl']
+            expired_queries = set()
+            with query_expiry_lock:
+                while query_expiry_heap and query_expiry_heap[0][0] < cutoff:
+                    expired_queries.add(heapq.heappop(query_expiry_heap)[1])
+            with query_storage_lock:
+                if len(expired_queries) * 2 > len(query_storage):
+                    # Dicts don't shrink on delete; when most entries go,
+                    # copy the survivors into a right-sized one instead
+                    query_storage = {qid: query for qid, query in query_storage.items() if qid not in expired_queries}
+                else:
+                    for qid in expired_queries:
+                        query_storage.pop(qid, None)
             
-            await asyncio.sleep(3600)  # Run cleanup every hour
+            cleanup_stop.wait(3600)  # Run cleanup every hour
         except Exception as e:
             logger.error(f"Error in cleanup task: {str(e)}")
-            await asyncio.sleep(60)  # Wait a minute before retrying if there's an error
-
-
-async def execute_graph_query(query: SulpherQuery) -> None:
-    try:
-        query.execute(graph)  # Assuming 'graph' is your graph data structure
-    except Exception as e:
-        query.status = 'failed'
-        query.result = str(e)
-
-
-
-
-
+            cleanup_stop.wait(60)  # Wait a minute before retrying if there's an error
 
 
 @app.route('/api/v1/graph/subgraph', methods=['POST'])
 def get_subgraph() -> Tuple[Response, int]:
     try:
-        data = request.json
+        data = get_request_data()
         node_id = data.get('node_id')
         depth = data.get('depth', 1)
 
         if not node_id:
             return create_error_response("Node ID is required", 400)
-
-        query = f"""
-        MATCH (n)-[r*1..{depth}]-(m)
-        WHERE id(n) = '{node_id}'
-        RETURN n, r, m
-        """
-        result = execute_sulpher_query(query)
+        if not isinstance(depth, int):
+            return create_error_response("depth must be an integer", 400)
+
+        result = execute_sulpher_query(Q_SUBGRAPH.format(depth=depth), id=node_id)
+        # Nodes recur across paths; keep each once, in first-seen order
+        nodes = {}
+        relationships = []
+        for r in result:
+            for node in (r['n'], r['m']):
+                nodes[node['id'] if isinstance(node, dict) else node] = node
+            relationships.extend(r['r'])
         subgraph_data = {
-            "nodes": [r['n'] for r in result] + [r['m'] for r in result],
-            "relationships": [rel for r in result for rel in r['r']]
+            "nodes": list(nodes.values()),
+            "relationships": relationships
         }
         links = {
             "center_node": {"href": url_for('get_node_properties', node_id=node_id)}
         }
         response = create_resource_response("subgraph", subgraph_data, links)
-        return jsonify(response), 200
+        return json_response(response), 200
     except Exception as e:
         logger.error(f"Unexpected error in get_subgraph: {str(e)}")
         return create_error_response("An unexpected error occurred", 500)
 
 
-
-
-
-# Cache management
-def invalidate_cache(entity: str) -> None:
-    """Invalidate cache entries related to the given entity."""
-    for key in list(cache.keys()):
-        if entity in key:
-            del cache[key]
-
-async def cleanup_expired_data() -> None:
-    """Cleanup expired queries and cache entries."""
-    while True:
-        try:
-            now = time.time()
-            # Clean up expired queries
-            expired_queries = [qid for qid, query in query_storage.items() 
-                               if query.stats['end_time'] and now - query.stats['end_time'] > config['graph_query_ttl']]
-            for qid in expired_queries:
-                del query_storage[qid]
-            
-            # Clean up expired cache entries
-            if isinstance(cache, TTLCache):
-                # TTLCache automatically handles expiration
-                pass
-            elif isinstance(cache, redis.Redis):
-                # Redis requires explicit key deletion
-                expired_cache = [key for key in cache.keys() if now - cache.ttl(key) > config['cache_ttl']]
-                for key in expired_cache:
-                    cache.delete(key)
-            
-            await asyncio.sleep(3600)  # Run cleanup every hour
-        except Exception as e:
-            logger.error(f"Error in cleanup task: {str(e)}")
-            await asyncio.sleep(60)  # Wait a minute before retrying if there's an error
-
-
-
-async def execute_graph_query(query: SulpherQuery) -> None:
-    try:
-        query.execute(graph)  # Assuming 'graph' is your graph data structure
-    except Exception as e:
-        query.status = 'failed'
-        query.result = str(e)
-
-
-# Cache management
-def invalidate_cache(entity: str) -> None:
-    """Invalidate cache entries related to the given entity."""
-    for key in list(cache.keys()):
-        if entity in key:
-            del cache[key]
-
-
-
-async def cleanup_expired_data() -> None:
-    """Cleanup expired queries and cache entries."""
-    while True:
-        try:
-            now = time.time()
-            # Clean up expired queries
-            expired_queries = [qid for qid, query in query_storage.items() 
-                               if query.stats['end_time'] and now - query.stats['end_time'] > config['graph_query_ttl']]
-            for qid in expired_queries:
-                del query_storage[qid]
-            
-            # Clean up expired cache entries
-            if isinstance(cache, TTLCache):
-                # TTLCache automatically handles expiration
-                pass
-            elif isinstance(cache, redis.Redis):
-                # Redis requires explicit key deletion
-                expired_cache = [key for key in cache.keys() if now - cache.ttl(key) > config['cache_ttl']]
-                for key in expired_cache:
-                    cache.delete(key)
-            
-            await asyncio.sleep(3600)  # Run cleanup every hour
-        except Exception as e:
-            logger.error(f"Error in cleanup task: {str(e)}")
-            await asyncio.sleep(60)  # Wait a minute before retrying if there's an error
-
-
-
-async def execute_graph_query(query: SulpherQuery) -> None:
-    try:
-        query.execute(graph)  # Assuming 'graph' is your graph data structure
-    except Exception as e:
-        query.status = 'failed'
-        query.result = str(e)
-
-
-
-
 @app.route('/api/v1/graph/<node_ref>/out', methods=['GET'])
 def get_outgoing_edges(node_ref: str) -> Tuple[Response, int]:
     try:
-        query = f"""
-        MATCH (n)-[r]->(m)
-        WHERE id(n) = '{node_ref}'
-        RETURN m, type(r) as relationship_type, properties(r) as relationship_properties
-        """
-        result = execute_sulpher_query(query)
-        outgoing = [
+        result = execute_sulpher_query(Q_OUTGOING_EDGES, id=node_ref)
+        if isinstance(result, str):
+            logger.error(f"Edge query failed for {node_ref}: {result}")
+            return create_error_response("An unexpected error occurred", 500)
+        outgoing = (
             {
                 "source": node_ref,
                 "relationship": {
@@ -1557,131 +2308,205 @@ def get_outgoing_edges(node_ref: str) -> Tuple[Response, int]:
                 }
             }
             for r in result
-        ]
+        )
+        if wants_ndjson():
+            return Response(stream_ndjson(outgoing), mimetype='application/x-ndjson'), 200
         links = {
             "node": {"href": url_for('get_node_properties', node_id=node_ref)},
             "incoming": {"href": url_for('get_incoming_edges', node_ref=node_ref)}
         }
-        response = create_collection_response("outgoing_edges", outgoing, links)
-        return jsonify(response), 200
+        response = create_collection_response("outgoing_edges", list(outgoing), links)
+        return json_response(response), 200
     except Exception as e:
         logger.error(f"Unexpected error in get_outgoing_edges: {str(e)}")
         return create_error_response("An unexpected error occurred", 500)
 
 
-# Cache management
-def invalidate_cache(entity: str) -> None:
-    """Invalidate cache entries related to the given entity."""
-    for key in list(cache.keys()):
-        if entity in key:
-            del cache[key]
-
-async def cleanup_expired_data() -> None:
-    """Cleanup expired queries and cache entries."""
-    while True:
-        try:
-            now = time.time()
-            # Clean up expired queries
-            expired_queries = [qid for qid, query in query_storage.items() 
-                               if query.stats['end_time'] and now - query.stats['end_time'] > config['graph_query_ttl']]
-            for qid in expired_queries:
-                del query_storage[qid]
-            
-            # Clean up expired cache entries
-            if isinstance(cache, TTLCache):
-                # TTLCache automatically handles expiration
-                pass
-            elif isinstance(cache, redis.Redis):
-                # Redis requires explicit key deletion
-                expired_cache = [key for key in cache.keys() if now - cache.ttl(key) > config['cache_ttl']]
-                for key in expired_cache:
-                    cache.delete(key)
-            
-            await asyncio.sleep(3600)  # Run cleanup every hour
-        except Exception as e:
-            logger.error(f"Error in cleanup task: {str(e)}")
-            await asyncio.sleep(60)  # Wait a minute before retrying if there's an error
 
-# Start the cleanup task
-asyncio.create_task(cleanup_expired_data())
+
+# Start the cleanup task; it runs for the life of the process and wakes
+# early to exit once cleanup_stop is set at shutdown
+cleanup_stop = threading.Event()
+cleanup_thread = threading.Thread(target=cleanup_expired_data, daemon=True)
+cleanup_thread.start()
+
+def stop_cleanup() -> None:
+    cleanup_stop.set()
+    cleanup_thread.join(timeout=5)
+
+atexit.register(stop_cleanup)
 
 # Graph indexing functions (using graph.data and graph.index)
-def load_graph_from_file(file_path: str) -> Dict[str, Dict[str, Any]]:
+def load_graph_from_file(file_path: str) -> Dict[Tuple[str, int], Dict[Tuple[str, int], str]]:
     """Loads the adjacency list from a file."""
-    graph = defaultdict(lambda: {'type': None, 'neighbors': []})
-    with open(file_path, 'r') as f:
-        for line in f:
-            parts = line.strip().split(':')
-            node_id = parts[0].strip()
-            neighbors = [n.strip() for n in parts[1].split()]
-            graph[node_id] = {'type': node_id.split(':')[0], 'neighbors': neighbors}
-    return graph
-
-def load_index_from_file(file_path: str) -> Dict[str, int]:
-    """Loads the adjacency index from a file."""
-    index = {}
-    with open(file_path, 'r') as f:
-        for line in f:
-            parts = line.strip().split(':')
-            node_id = parts[0].strip()
-            offset = int(parts[1].strip())
-            index[node_id] = offset
-    return index
-
-async def save_graph_to_file(file_path: str) -> None:
+    msgpack_path = f"{file_path}.msgpack"
+    if msgpack is not None and os.path.exists(msgpack_path):
+        with open(msgpack_path, 'rb') as f:
+            loaded = msgpack.unpackb(f.read(), use_list=False, strict_map_key=False)
+        return defaultdict(dict, {intern_node(node_id): {intern_node(neighbor): sys.intern(label) for neighbor, label in edges.items()}
+                                  for node_id, edges in loaded.items()})
+
+    # Lines are 'entity:id<TAB>entity:id=label<TAB>...'; they are split as
+    # bytes straight off the mapped file and only the pieces kept are decoded
+    loaded = defaultdict(dict)
+    if not os.path.exists(file_path):
+        return loaded
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return loaded
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for line in iter(mm.readline, b''):
+                node, *edges = line.rstrip(b'\r\n').split(b'\t')
+                if not node:
+                    continue
+                neighbors = loaded[_parse_node_bytes(node)]
+                for edge in edges:
+                    neighbor, _, label = edge.partition(b'=')
+                    neighbors[_parse_node_bytes(neighbor)] = sys.intern(label.decode())
+    return loaded
+
+def _parse_node_bytes(node: bytes) -> Tuple[str, int]:
+    entity, _, id_part = node.rpartition(b':')
+    return (sys.intern(entity.decode()), int(id_part))
+
+def save_graph_to_file(file_path: str) -> None:
     """Saves the adjacency list to disk."""
-    with open(file_path, 'w') as f:
-        for node_id, data in graph.items():
-            neighbors = ' '.join(data['neighbors'])
-            f.write(f"{node_id}:{neighbors}\n")
-
-async def save_index_to_file(file_path: str) -> None:
-    """Saves the adjacency index to disk."""
-    with open(file_path, 'w') as f:
-        for node_id, offset in index.items():
-            f.write(f"{node_id}:{offset}\n")
-
-def build_graph_index(graph: Dict[str, Dict[str, Any]]) -> None:
-    """Builds the inverted index from the graph."""
-    global index
+    if msgpack is not None:
+        snapshot = {node_id: dict(edges) for node_id, edges in list(graph.items())}
+        atomic_write(f"{file_path}.msgpack", msgpack.packb(snapshot, use_bin_type=True))
+        return
 
-    for node_id, data in graph.items():
-        index[data['type']].add(node_id)
-        for key, value in data.items():
-            if isinstance(value, dict) and value.get('type') == 'REF':
-                index[value['entity']].add(node_id)
-                index[f"relationship:{key}"].add(node_id)
+    # Built in memory and written at once rather than one write per node
+    payload = ''.join('\t'.join([format_node_id(node_id)] + [f"{format_node_id(neighbor)}={label}" for neighbor, label in list(edges.items())]) + '\n'
+                      for node_id, edges in list(graph.items()))
+    atomic_write(file_path, payload.encode())
 
-def update_graph_index(entity: str, id: int, data: Dict[str, Any], operation: str) -> None:
-    """Updates the index based on graph modifications."""
-    global index
+def graph_index_keys(entity: str, data: Dict[str, Any]) -> set:
+    """Returns the index keys a document is filed under: its entity and those of its REFs."""
+    keys = {entity}
+    for key, value in data.items():
+        if isinstance(value, dict) and value.get('type') == 'REF':
+            keys.add(value['entity'])
+            keys.add(f"relationship:{key}")
+    return keys
+
+def update_graph_index(entity: str, id: int, data: Optional[Dict[str, Any]], operation: str) -> None:
+    """Updates the index based on graph modifications; data is None for a delete.
+
+    Only the keys that changed since the node was last indexed are touched.
+    """
+    node_id = (entity, id)
+    previous = node_index_keys.pop(node_id, set())
+    if operation == 'delete':
+        # What the node was filed under is known from node_index_keys
+        current = set()
+    else:
+        current = graph_index_keys(entity, data)
+        node_index_keys[node_id] = current
+    for key in previous - current:
+        node_ids = index.get(key)
+        if node_ids is not None:
+            node_ids.discard(node_id)
+    for key in current - previous:
+        index.setdefault(key, set()).add(node_id)
 
-    node_id = f"{entity}:{id}"
-    if operation == 'create' or operation == 'update':
-        index[data['type']].add(node_id)
-        for key, value in data.items():
-            if isinstance(value, dict) and value.get('type') == 'REF':
-                index[value['entity']].add(node_id)
-                index[f"relationship:{key}"].add(node_id)
-    elif operation == 'delete':
-        index[data['type']].discard(node_id)
-        for key, value in data.items():
-            if isinstance(value, dict) and value.get('type') == 'REF':
-                index[value['entity']].discard(node_id)
-                index[f"relationship:{key}"].discard(node_id)
+INDEX_FORMAT_VERSION = 2
 
 def save_graph_index(index_file: str) -> None:
     """Saves the index to disk."""
-    with open(index_file, 'w') as f:
-        json.dump(index, f)
+    snapshot = [(key, list(node_ids)) for key, node_ids in list(index.items())]
+    if msgpack is None:
+        atomic_write(index_file, _dumps(dict(snapshot)))
+        return
+    # Binary layout: a node shows up under several keys, so each is written
+    # once to a node table and the keys hold packed uint32 positions into it
+    positions = {}
+    nodes = []
+    keys = {}
+    for key, node_ids in snapshot:
+        packed = array('I')
+        for node_id in node_ids:
+            i = positions.get(node_id)
+            if i is None:
+                i = positions[node_id] = len(nodes)
+                nodes.append(node_id)
+            packed.append(i)
+        keys[key] = packed.tobytes()
+    atomic_write(f"{index_file}.msgpack", msgpack.packb([INDEX_FORMAT_VERSION, nodes, keys], use_bin_type=True))
+
+# Graph persistence is debounced: mutations mark the graph dirty and arm a
+# short timer, so a burst of writes costs a single flush
+GRAPH_FLUSH_DELAY = 0.25
+graph_flush_lock = threading.Lock()
+graph_flush_timer = None
+graph_dirty = False
+
+def schedule_graph_flush() -> None:
+    """Marks the graph dirty and arms the flush timer if it is not already running."""
+    global graph_flush_timer, graph_dirty
+    with graph_flush_lock:
+        graph_dirty = True
+        if graph_flush_timer is None:
+            graph_flush_timer = threading.Timer(GRAPH_FLUSH_DELAY, flush_graph)
+            graph_flush_timer.daemon = True
+            graph_flush_timer.start()
+
+def flush_graph() -> None:
+    """Writes the graph index and adjacency list to disk if they changed."""
+    global graph_flush_timer, graph_dirty
+    with graph_flush_lock:
+        graph_flush_timer = None
+        if not graph_dirty:
+            return
+        try:
+            save_graph_index(config['adjacency_index_file'])
+            save_graph_to_file(config['adjacency_list_file'])
+        except Exception as e:
+            # Leave the graph dirty and try again after another delay
+            logger.error(f"Error flushing graph to disk: {str(e)}")
+            graph_flush_timer = threading.Timer(GRAPH_FLUSH_DELAY, flush_graph)
+            graph_flush_timer.daemon = True
+            graph_flush_timer.start()
+            return
+        graph_dirty = False
+
+atexit.register(flush_graph)
 
 def load_graph_index(index_file: str) -> None:
     """Loads the index from disk."""
     global index
 
-    if os.path.exists(index_file):
-        with open(index_file, 'r') as f:
-            index = json.load(f)
+    msgpack_path = f"{index_file}.msgpack"
+    if msgpack is not None and os.path.exists(msgpack_path):
+        with open(msgpack_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            snapshot = msgpack.unpackb(mm, use_list=False)
+        if isinstance(snapshot, tuple):
+            # Node table plus packed positions (see save_graph_index)
+            _, nodes, keys = snapshot
+            nodes = [intern_node(node_id) for node_id in nodes]
+            index = defaultdict(set)
+            for key, packed in keys.items():
+                positions = array('I')
+                positions.frombytes(packed)
+                index[key] = {nodes[i] for i in positions}
+            _rebuild_node_index_keys()
+            return
+    elif os.path.exists(index_file):
+        # JSON index written without msgpack (or by an older version)
+        with open(index_file, 'rb') as f:
+            snapshot = _loads(f.read())
+    else:
+        return
+    index = defaultdict(set, {key: {tuple(node_id) if isinstance(node_id, (list, tuple)) else node_id
+                                    for node_id in node_ids}
+                              for key, node_ids in snapshot.items()})
+    _rebuild_node_index_keys()
+
+def _rebuild_node_index_keys() -> None:
+    node_index_keys.clear()
+    for key, node_ids in index.items():
+        for node_id in node_ids:
+            node_index_keys.setdefault(node_id, set()).add(key)
 
 def _find_matching_nodes(self, graph: Dict[str, Dict[str, Any]], node_pattern: Dict[str, Any]) -> List[str]:
     matching_nodes = []
@@ -1698,6 +2523,40 @@ def _find_matching_nodes(self, graph: Dict[str, Dict[str, Any]], node_pattern: D
                 matching_nodes.append(node)
     return list(matching_nodes)  # Return a list of matching node IDs
 
+def build_startup_indexes() -> None:
+    """Builds the full-text index and graph from the stored documents, or loads the persisted graph."""
+    global graph
+    graph_rebuilt = config['rserv_graph'] == 'indexed' and (config['fulltext_enabled'] or config['graph_enabled'])
+    if config['fulltext_enabled'] or config['graph_enabled']:
+        # Files are read and decoded on scan_pool, one entity at a time; the
+        # indexes are only updated from this thread
+        with os.scandir(os.path.join(BASE_DIR, config['schema_name'])) as entries:
+            entities = [entry.name for entry in entries if entry.is_dir()]
+        for entity in entities:
+            for data in get_all_entities(entity):
+                if config['fulltext_enabled']:
+                    index_document(entity, data['id'], data)
+                if config['rserv_graph'] == 'indexed':
+                    update_graph_index(entity, data['id'], data, 'create')
+                    update_graph(entity, data['id'], data)
+    if config['rserv_graph'] == 'indexed' and not graph_rebuilt:
+        # Nothing was rebuilt from the documents, so start from what was
+        # persisted by the last run
+        load_graph_index(config['adjacency_index_file'])
+        graph = load_graph_from_file(config['adjacency_list_file'])
+
+def run_server() -> None:
+    """Serves the app; waitress handles requests on a pool of threads when selected."""
+    if config['server'] == 'waitress':
+        try:
+            from waitress import serve
+        except ImportError:
+            logger.warning("waitress is not installed. Falling back to the Flask development server.")
+        else:
+            serve(app, host=config['host'], port=config['port'], threads=config['server_threads'])
+            return
+    app.run(host=config['host'], port=config['port'], debug=True, threaded=True)
+
     
 if __name__ == '__main__':
 
@@ -1707,6 +2566,7 @@ if __name__ == '__main__':
     print(f"  Host: {config['host']}")
     print(f"  Port: {config['port']}")
     print(f"  Schema: {config['schema_name']}")
+    print(f"  Server: {config['server']}")
 
     print("\nGraph Configuration:")
     print(f"  Mode: {'Enabled' if config['graph_enabled'] else 'Disabled'}")
@@ -1724,22 +2584,11 @@ if __name__ == '__main__':
     print(f"  Patch null handling: {config['patch_null']}")
     print(f"  Max query depth: {config['max_query_depth']}")
         
-    # Build initial full-text index and graph
-    if config['fulltext_enabled'] or config['graph_enabled']:
-        for entity in os.listdir(os.path.join(BASE_DIR, config['schema_name'])):
-            entity_dir = get_entity_dir(entity)
-            for filename in os.listdir(entity_dir):
-                if filename.endswith('.json'):
-                    with open(os.path.join(entity_dir, filename), 'r') as f:
-                        data = json.load(f)
-                        if config['fulltext_enabled']:
-                            index_document(entity, data['id'], data)
-                        if config['rserv_graph'] == 'indexed':
-                            update_graph_index(entity, data['id'], data, 'create')
-                            update_graph(entity, data['id'], data)
-    if config['rserv_graph'] == 'indexed':
-        load_graph_index(config['adjacency_index_file'])
-        graph = load_graph_from_file(config['adjacency_list_file'])
-    app.run(host=config['host'], port=config['port'], debug=True)
+    build_startup_indexes()
+    if not isinstance(cache, TTLCache):
+        # Keys only lack an expiry if an older release wrote them, so one
+        # sweep per start is enough; it runs in the background
+        scan_pool.submit(sweep_persistent_cache_keys)
+    run_server()
 
 
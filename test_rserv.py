@@ -1,174 +1,149 @@
 import unittest
 import os
 import json
-from rserv import *
 
-class TestRServSupportFunctions(unittest.TestCase):
+from test_rserv_0_3_9 import ServerTestCase
+
+
+class TestRServSupportFunctions(ServerTestCase):
 
     def test_get_entity_dir(self):
-        self.assertEqual(get_entity_dir("person"), os.path.join(BASE_DIR, "schema", "person"))
-        self.assertEqual(get_entity_dir("location"), os.path.join(BASE_DIR, "schema", "location"))
+        base_dir = self.rserv.BASE_DIR
+        self.assertEqual(self.rserv.get_entity_dir("person"), os.path.join(base_dir, "default", "person"))
+        self.assertEqual(self.rserv.get_entity_dir("location"), os.path.join(base_dir, "default", "location"))
+        self.assertTrue(os.path.isdir(os.path.join(base_dir, "default", "person")))
 
     def test_get_entity_file(self):
-        self.assertEqual(get_entity_file("person", 1), os.path.join(BASE_DIR, "schema", "person", "1.json"))
-        self.assertEqual(get_entity_file("location", 2), os.path.join(BASE_DIR, "schema", "location", "2.json"))
-
-    def test_load_json_from_file(self):
-        file_path = os.path.join(BASE_DIR, "schema", "person", "1.json")
-        data = load_json_from_file(file_path)
-        self.assertIsInstance(data, dict)
-        self.assertTrue("id" in data)
-        self.assertTrue("name" in data)
-
-        file_path = os.path.join(BASE_DIR, "schema", "location", "2.json")
-        data = load_json_from_file(file_path)
-        self.assertIsInstance(data, dict)
-        self.assertTrue("id" in data)
-        self.assertTrue("name" in data)
-        self.assertTrue("address" in data)
-
-    def test_save_json_to_file(self):
+        base_dir = self.rserv.BASE_DIR
+        self.assertEqual(self.rserv.get_entity_file("person", 1), os.path.join(base_dir, "default", "person", "1.json"))
+        self.assertEqual(self.rserv.get_entity_file("location", 2), os.path.join(base_dir, "default", "location", "2.json"))
+
+    def test_read_doc(self):
+        file_path = self.rserv.get_entity_file("person", 1)
+        with open(file_path, "w") as f:
+            json.dump({"id": 1, "name": "John Doe"}, f)
+        data = self.rserv.read_doc(file_path)
+        self.assertEqual(data, {"id": 1, "name": "John Doe"})
+
+        # Callers get their own copy, never the cached document
+        data["name"] = "changed"
+        self.assertEqual(self.rserv.read_doc(file_path)["name"], "John Doe")
+
+    def test_write_doc(self):
         data = {"id": 1, "name": "John Doe"}
-        file_path = os.path.join(BASE_DIR, "schema", "person", "1.json")
-        save_json_to_file(file_path, data)
+        file_path = self.rserv.get_entity_file("person", 1)
+        self.rserv.write_doc(file_path, data)
         self.assertTrue(os.path.exists(file_path))
         with open(file_path, "r") as f:
             loaded_data = json.load(f)
         self.assertEqual(loaded_data, data)
 
+        self.rserv.write_doc(file_path, {"id": 1, "name": "Jane Doe"})
+        self.assertEqual(self.rserv.read_doc(file_path)["name"], "Jane Doe")
+
     def test_validate_entity_name(self):
-        self.assertTrue(validate_entity_name("person"))
-        self.assertTrue(validate_entity_name("person_1"))
-        self.assertTrue(validate_entity_name("person_123"))
-
-        with self.assertRaises(RServError):
-            validate_entity_name("person-1")
-        with self.assertRaises(RServError):
-            validate_entity_name("person.1")
-        with self.assertRaises(RServError):
-            validate_entity_name("person 1")
-        with self.assertRaises(RServError):
-            validate_entity_name("person123!")
-        with self.assertRaises(RServError):
-            validate_entity_name("person-123")
+        self.rserv.validate_entity_name("person")
+        self.rserv.validate_entity_name("person_1")
+        self.rserv.validate_entity_name("person_123")
+
+        for name in ("person-1", "person.1", "person 1", "person123!", "person-123", ""):
+            with self.assertRaises(self.rserv.RServError):
+                self.rserv.validate_entity_name(name)
 
     def test_validate_id(self):
-        self.assertTrue(validate_id(1))
-        self.assertTrue(validate_id(123))
-        self.assertTrue(validate_id(1234567890))
-
-        with self.assertRaises(RServError):
-            validate_id(-1)
-        with self.assertRaises(RServError):
-            validate_id(0)
-        with self.assertRaises(RServError):
-            validate_id("1")
-        with self.assertRaises(RServError):
-            validate_id(1.0)
+        self.rserv.validate_id(1)
+        self.rserv.validate_id(123)
+        self.rserv.validate_id(1234567890)
+
+        for id in (-1, 0, "1", 1.0):
+            with self.assertRaises(self.rserv.RServError):
+                self.rserv.validate_id(id)
 
     def test_validate_query(self):
-        self.assertTrue(validate_query("MATCH (a) RETURN a"))
-        self.assertTrue(validate_query("BFS MATCH (a) RETURN a"))
-        self.assertTrue(validate_query("DFS MATCH (a) RETURN a"))
-        self.assertTrue(validate_query("MATCH (a)-[:KNOWS]->(b) RETURN a, b"))
-
-        with self.assertRaises(RServError):
-            validate_query("MATCH a RETURN a")
-        with self.assertRaises(RServError):
-            validate_query("MATCH (a) RETURN")
-        with self.assertRaises(RServError):
-            validate_query("MATCH (a) RETURN b")
-        with self.assertRaises(RServError):
-            validate_query("MATCH (a)-[:KNOWS] RETURN a")
-        with self.assertRaises(RServError):
-            validate_query("MATCH (a)-[:KNOWS]-> RETURN a")
-        with self.assertRaises(RServError):
-            validate_query("MATCH (a)-[:KNOWS]->(b) RETURN a")
+        self.rserv.validate_query("MATCH (a) RETURN a")
+        self.rserv.validate_query("BFS MATCH (a) RETURN a")
+        self.rserv.validate_query("DFS MATCH (a) RETURN a")
+        self.rserv.validate_query("MATCH (a)-[:KNOWS]->(b) RETURN a, b")
+
+        for query in ("MATCH a RETURN a", "MATCH (a", "RETURN a", "SELECT * FROM a"):
+            with self.assertRaises(self.rserv.RServError):
+                self.rserv.validate_query(query)
 
     def test_create_collection_response(self):
-        data = [{"id": 1, "name": "John Doe"}, {"id": 2, "name": "Jane Doe"}]
-        links = {"self": {"href": "/people"}}
-        response = create_collection_response("people", data, links)
-        self.assertIsInstance(response, dict)
-        self.assertEqual(response["data"], data)
-        self.assertEqual(response["links"], links)
-        self.assertEqual(response["type"], "collection")
+        items = [{"id": 1, "name": "John Doe"}, {"id": 2, "name": "Jane Doe"}]
+        links = {"next": {"href": "/people?page=2"}}
+        with self.rserv.app.test_request_context("/people"):
+            response = self.rserv.create_collection_response("people", items, links)
+        self.assertEqual(response["resource_type"], "people_collection")
+        self.assertEqual(response["items"], items)
+        self.assertEqual(response["_links"]["self"], {"href": "http://localhost/people"})
+        self.assertEqual(response["_links"]["next"], links["next"])
 
     def test_create_resource_response(self):
         data = {"id": 1, "name": "John Doe"}
-        links = {"self": {"href": "/people/1"}}
-        response = create_resource_response("person", data, links)
-        self.assertIsInstance(response, dict)
+        with self.rserv.app.test_request_context("/people/1"):
+            response = self.rserv.create_resource_response("person", data)
+        self.assertEqual(response["resource_type"], "person")
         self.assertEqual(response["data"], data)
-        self.assertEqual(response["links"], links)
-        self.assertEqual(response["type"], "resource")
+        self.assertEqual(response["_links"], {"self": {"href": "http://localhost/people/1"}})
 
     def test_create_error_response(self):
-        response = create_error_response("Invalid request", 400)
-        self.assertIsInstance(response, dict)
-        self.assertEqual(response["error"], "Invalid request")
-        self.assertEqual(response["status"], 400)
+        with self.rserv.app.test_request_context("/people"):
+            response, status = self.rserv.create_error_response("Invalid request", 400)
+        self.assertEqual(status, 400)
+        self.assertEqual(response.get_json()["error"], {"message": "Invalid request", "status_code": 400})
 
     def test_load_graph_from_file(self):
-        graph = load_graph_from_file(os.path.join(BASE_DIR, "schema", "graph.txt"))
-        self.assertIsInstance(graph, dict)
-        self.assertEqual(len(graph), 6)
-        self.assertEqual(graph["1"], {'type': 'person', 'neighbors': ['2', '3']})
-        self.assertEqual(graph["2"], {'type': 'location', 'neighbors': ['1']})
-        self.assertEqual(graph["3"], {'type': 'person', 'neighbors': ['1', '4']})
-        self.assertEqual(graph["4"], {'type': 'location', 'neighbors': ['3']})
-        self.assertEqual(graph["5"], {'type': 'person', 'neighbors': []})
-        self.assertEqual(graph["6"], {'type': 'location', 'neighbors': []})
-
-    def test_load_index_from_file(self):
-        index = load_index_from_file(os.path.join(BASE_DIR, "schema", "index.txt"))
-        self.assertIsInstance(index, dict)
-        self.assertEqual(len(index), 3)
-        self.assertEqual(index["person"], {'1', '3'})
-        self.assertEqual(index["location"], {'2', '4'})
-        self.assertEqual(index["relationship:LIVES_IN"], {'1', '3'})
-
-    def test_build_graph_index(self):
-        graph = load_graph_from_file(os.path.join(BASE_DIR, "schema", "graph.txt"))
-        build_graph_index(graph)
-        self.assertEqual(len(index), 3)
-        self.assertEqual(index["person"], {'1', '3', '5'})
-        self.assertEqual(index["location"], {'2', '4', '6'})
-        self.assertEqual(index["relationship:LIVES_IN"], {'1', '3'})
-        self.assertEqual(index["relationship:WORKS_AT"], {'3'})
-        self.assertEqual(index["relationship:KNOWS"], {'1', '3'})
+        graph_file = os.path.join(self.tmp, "graph.data")
+        with open(graph_file, "w") as f:
+            f.write("person:1\tlocation:2=LIVES_IN\tperson:3=KNOWS\n"
+                    "location:2\tperson:1=reverse_LIVES_IN\n"
+                    "person:3\tperson:1=reverse_KNOWS\n"
+                    "person:5\n")
+        graph = self.rserv.load_graph_from_file(graph_file)
+        self.assertEqual(len(graph), 4)
+        self.assertEqual(graph[("person", 1)], {("location", 2): "LIVES_IN", ("person", 3): "KNOWS"})
+        self.assertEqual(graph[("location", 2)], {("person", 1): "reverse_LIVES_IN"})
+        self.assertEqual(graph[("person", 5)], {})
+        self.assertEqual(self.rserv.load_graph_from_file(os.path.join(self.tmp, "missing")), {})
+
+    def test_graph_index_keys(self):
+        data = {"id": 1, "home": {"type": "REF", "entity": "location", "id": 2}, "name": "John Doe"}
+        self.assertEqual(self.rserv.graph_index_keys("person", data), {"person", "location", "relationship:home"})
 
     def test_update_graph_index(self):
-        graph = load_graph_from_file(os.path.join(BASE_DIR, "schema", "graph.txt"))
-        build_graph_index(graph)
-        self.assertEqual(len(index), 3)
-        self.assertEqual(index["person"], {'1', '3', '5'})
-        self.assertEqual(index["location"], {'2', '4', '6'})
-        self.assertEqual(index["relationship:LIVES_IN"], {'1', '3'})
-
-        # Add a new relationship
-        data = {"id": 1, "type": "person", "neighbors": ['2', '3', '7']}
-        update_graph_index("person", 1, data, "update")
-        self.assertEqual(len(index), 3)
-        self.assertEqual(index["person"], {'1', '3', '5', '7'})
-        self.assertEqual(index["location"], {'2', '4', '6'})
-        self.assertEqual(index["relationship:LIVES_IN"], {'1', '3'})
-
-        # Remove an existing relationship
-        data = {"id": 1, "type": "person", "neighbors": ['2', '3']}
-        update_graph_index("person", 1, data, "delete")
-        self.assertEqual(len(index), 3)
-        self.assertEqual(index["person"], {'3', '5', '7'})
-        self.assertEqual(index["location"], {'2', '4', '6'})
-        self.assertEqual(index["relationship:LIVES_IN"], {'3'})
+        index = self.rserv.index
+        lives = {"id": 1, "home": {"type": "REF", "entity": "location", "id": 2}}
+        self.rserv.update_graph_index("person", 1, lives, "create")
+        self.rserv.update_graph_index("person", 3, lives, "create")
+        self.assertEqual(index["person"], {("person", 1), ("person", 3)})
+        self.assertEqual(index["relationship:home"], {("person", 1), ("person", 3)})
+
+        # Moving person 1 to another relationship only touches the keys that changed
+        works = {"id": 1, "work": {"type": "REF", "entity": "company", "id": 4}}
+        self.rserv.update_graph_index("person", 1, works, "update")
+        self.assertEqual(index["relationship:home"], {("person", 3)})
+        self.assertEqual(index["relationship:work"], {("person", 1)})
+        self.assertEqual(index["location"], {("person", 3)})
+
+        self.rserv.update_graph_index("person", 1, None, "delete")
+        self.assertEqual(index["person"], {("person", 3)})
+        self.assertEqual(index["relationship:work"], set())
+        self.assertNotIn(("person", 1), self.rserv.node_index_keys)
 
     def test_save_graph_index(self):
-        index = {"person": {'1', '3', '5'}, "location": {'2', '4', '6'}, "relationship:LIVES_IN": {'1', '3'}}
-        index_file = os.path.join(BASE_DIR, "schema", "index.txt")
-        save_graph_index(index_file)
-        self.assertTrue(os.path.exists(index_file))
-        with open(index_file, "r") as f:
-            loaded_index = json.load(f)
-        self.assertEqual(loaded_index, index)
+        for id in (1, 3):
+            self.rserv.update_graph_index("person", id, {"id": id, "home": {"type": "REF", "entity": "location", "id": 2}}, "create")
+        saved = {key: set(node_ids) for key, node_ids in self.rserv.index.items()}
+        index_file = os.path.join(self.tmp, "graph.index")
+        self.rserv.save_graph_index(index_file)
+
+        self.rserv.index.clear()
+        self.rserv.node_index_keys.clear()
+        self.rserv.load_graph_index(index_file)
+        self.assertEqual({key: set(node_ids) for key, node_ids in self.rserv.index.items()}, saved)
+        self.assertEqual(self.rserv.node_index_keys[("person", 1)], {"person", "location", "relationship:home"})
 
 
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,431 @@
+import importlib.util
+import json
+import logging
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+SERVER_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rserv_0.3.9-buggy-preliminar-release.py')
+
+logging.disable(logging.CRITICAL)
+
+
+def load_server():
+    # The server keeps its state in module globals and paths relative to the
+    # working directory, so each test loads a fresh copy inside a temp dir
+    spec = importlib.util.spec_from_file_location('rserv_0_3_9', SERVER_FILE)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# PUT, PATCH and /save validate against a schema, so the entities used by the
+# tests have loose ones: every field optional, REFs stored as JSON objects
+OPTIONAL_REF = {'type': 'json', 'required': False}
+OPTIONAL_STRING = {'type': 'string', 'required': False}
+SCHEMAS = {
+    'author': {'name': OPTIONAL_STRING},
+    'city': {'name': OPTIONAL_STRING},
+    'book': {'title': OPTIONAL_STRING, 'author': OPTIONAL_REF, 'city': OPTIONAL_REF},
+}
+
+
+class ServerTestCase(unittest.TestCase):
+    config = {}
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.mkdtemp()
+        os.chdir(self.tmp)
+        os.makedirs(os.path.join('schema', 'default'))
+        for entity, schema in SCHEMAS.items():
+            with open(os.path.join('schema', 'default', f'{entity}.json'), 'w') as f:
+                json.dump(schema, f)
+        self.rserv = load_server()
+        self.rserv.config.update(self.config)
+        self.client = self.rserv.app.test_client()
+
+    def tearDown(self):
+        # Run the exit hooks now, while still inside the temp dir
+        self.rserv.stop_cleanup()
+        self.rserv.flush_graph()
+        self.rserv.release_id_blocks()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp)
+
+    def create(self, entity, data):
+        response = self.client.post(f'/api/v1/{entity}', json=data)
+        self.assertEqual(response.status_code, 201, response.get_data(as_text=True))
+        return response.get_json()['id']
+
+    def ref(self, entity, id):
+        return {'type': 'REF', 'entity': entity, 'id': id}
+
+
+class GraphIndexTest(ServerTestCase):
+    config = {'graph_enabled': True}
+
+    def test_delete_removes_node_from_graph_and_index(self):
+        author = self.create('author', {'name': 'Ann'})
+        book = self.create('book', {'title': 'T', 'author': self.ref('author', author)})
+
+        response = self.client.delete(f'/api/v1/book/{book}')
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+        self.assertNotIn(('book', book), self.rserv.graph)
+        self.assertNotIn(('book', book), self.rserv.node_index_keys)
+        for node_ids in self.rserv.index.values():
+            self.assertNotIn(('book', book), node_ids)
+
+    def test_update_moves_node_between_index_keys(self):
+        self.create('author', {'name': 'Ann'})
+        self.create('city', {'name': 'Oslo'})
+        book = self.create('book', {'author': self.ref('author', 1)})
+
+        response = self.client.put(f'/api/v1/book/{book}', json={'city': self.ref('city', 1)})
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+        self.assertNotIn(('book', book), self.rserv.index['relationship:author'])
+        self.assertIn(('book', book), self.rserv.index['relationship:city'])
+
+    def test_persisted_graph_round_trips(self):
+        author = self.create('author', {'name': 'Ann'})
+        self.create('book', {'title': 'T', 'author': self.ref('author', author)})
+        self.rserv.flush_graph()
+
+        loaded = self.rserv.load_graph_from_file(self.rserv.config['adjacency_list_file'])
+        self.assertEqual(dict(loaded), dict(self.rserv.graph))
+        self.assertEqual(loaded[('book', 1)], {('author', 1): 'author'})
+        self.assertEqual(loaded[('author', 1)], {('book', 1): 'reverse_author'})
+        csr = self.rserv.CSRView(loaded, 0)
+        self.assertEqual(len(csr.nodes), 2)
+
+    def test_failed_flush_is_retried(self):
+        self.create('author', {'name': 'Ann'})
+        self.rserv.graph_flush_timer.cancel()
+        with mock.patch.object(self.rserv, 'save_graph_to_file', side_effect=OSError('disk full')):
+            self.rserv.flush_graph()
+        self.assertTrue(self.rserv.graph_dirty)
+        retry = self.rserv.graph_flush_timer
+        self.assertIsNotNone(retry)
+
+        retry.cancel()
+        self.rserv.flush_graph()
+        self.assertFalse(self.rserv.graph_dirty)
+        self.assertTrue(os.path.exists(self.rserv.config['adjacency_list_file']))
+
+    def test_startup_rebuild_skips_id_files(self):
+        author = self.create('author', {'name': 'Ann'})
+        book = self.create('book', {'title': 'T', 'author': self.ref('author', author)})
+        self.rserv.release_id_blocks()
+        self.rserv.graph.clear()
+        self.rserv.index.clear()
+        self.rserv.node_index_keys.clear()
+
+        self.rserv.build_startup_indexes()
+        self.assertEqual(self.rserv.graph[('book', book)], {('author', author): 'author'})
+        self.assertIn(('book', book), self.rserv.index['relationship:author'])
+
+
+class EdgeListingTest(ServerTestCase):
+    config = {'graph_enabled': True}
+
+    def test_failed_query_is_an_error_response(self):
+        # The Sulpher parser has no <-[r]- patterns yet, so the incoming edge
+        # query fails and comes back as a string rather than rows
+        self.create('author', {'name': 'Ann'})
+        response = self.client.get('/api/v1/graph/author:1/in?format=ndjson')
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.mimetype, 'application/json')
+
+    def test_stream_ndjson_builds_first_item_eagerly(self):
+        def items():
+            raise KeyError('m')
+            yield
+
+        with self.assertRaises(KeyError):
+            self.rserv.stream_ndjson(items())
+        lines = self.rserv.stream_ndjson(iter([{'a': 1}, {'b': 2}]))
+        self.assertEqual(b''.join(lines), b'{"a":1}\n{"b":2}\n')
+
+
+class CascadeDeleteTest(ServerTestCase):
+    config = {'graph_enabled': True, 'cascading_delete': True}
+
+    def assert_cascades_after_update(self):
+        author = self.create('author', {'name': 'Ann'})
+        book = self.create('book', {'title': 'T', 'author': self.ref('author', author)})
+        response = self.client.put(f'/api/v1/author/{author}', json={'name': 'Anne'})
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+
+        response = self.client.delete(f'/api/v1/author/{author}')
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+        self.assertIn(f'book:{book}', response.get_json()['cascaded_deletes'])
+        self.assertEqual(self.client.get(f'/api/v1/book/{book}').status_code, 404)
+
+    def test_update_keeps_incoming_edges(self):
+        self.assert_cascades_after_update()
+
+    def test_scan_without_graph(self):
+        self.rserv.config['graph_enabled'] = False
+        self.assert_cascades_after_update()
+
+
+class BulkCreateTest(ServerTestCase):
+
+    def test_bulk_create_with_default_config(self):
+        response = self.client.post('/api/v1/author/bulk', json=[{'name': 'Ann'}, {'name': 'Bob'}])
+        self.assertEqual(response.status_code, 201, response.get_data(as_text=True))
+        self.assertEqual(response.get_json()['ids'], [1, 2])
+        self.assertEqual(self.client.get('/api/v1/author/2').get_json()['name'], 'Bob')
+
+    def test_failed_batch_leaves_nothing_behind(self):
+        write_doc = self.rserv.write_doc
+        calls = []
+
+        def failing_write(file_path, data):
+            calls.append(file_path)
+            if len(calls) == 2:
+                raise OSError('disk full')
+            write_doc(file_path, data)
+
+        with mock.patch.object(self.rserv, 'write_doc', failing_write):
+            response = self.client.post('/api/v1/author/bulk', json=[{'name': 'Ann'}, {'name': 'Bob'}])
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(self.client.get('/api/v1/author/1').status_code, 404)
+        self.assertEqual(self.client.get('/api/v1/author/list').get_json()['total'], 0)
+
+    def test_bad_batches_are_rejected(self):
+        for body in ([], {'name': 'Ann'}, [{'name': 'Ann'}, {}], [{'name': 'Ann'}, 'Bob']):
+            response = self.client.post('/api/v1/author/bulk', json=body)
+            self.assertEqual(response.status_code, 400, body)
+        self.assertEqual(self.create('author', {'name': 'Ann'}), 1)
+
+
+class AtomicWriteTest(ServerTestCase):
+
+    def test_new_files_follow_umask(self):
+        path = os.path.join(self.tmp, 'doc.json')
+        self.rserv.atomic_write(path, b'{}')
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), self.rserv.DEFAULT_FILE_MODE)
+
+    def test_replaced_files_keep_their_mode(self):
+        path = os.path.join(self.tmp, 'doc.json')
+        self.rserv.atomic_write(path, b'{}')
+        os.chmod(path, 0o640)
+        self.rserv.atomic_write(path, b'{"a": 1}')
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o640)
+
+
+class DocCacheTest(ServerTestCase):
+
+    def test_concurrent_reads_through_a_full_cache(self):
+        # A small cache keeps every thread evicting while others read
+        self.rserv.doc_cache = self.rserv.LRUCache(maxsize=4)
+        ids = [self.create('author', {'name': f'a{n}'}) for n in range(32)]
+        paths = [self.rserv.get_entity_file('author', id) for id in ids]
+        errors = []
+
+        def read():
+            try:
+                for _ in range(20):
+                    for id, path in zip(ids, paths):
+                        self.assertEqual(self.rserv.read_doc(path)['id'], id)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(self.rserv.doc_cache), 4)
+
+
+class ListCacheKeysTest(ServerTestCase):
+
+    def test_evicted_pages_leave_the_key_sets(self):
+        self.rserv.cache = self.rserv.ResultCache(maxsize=4, ttl=300)
+        self.create('author', {'name': 'Ann'})
+        for page in range(1, 11):
+            self.assertEqual(self.client.get(f'/api/v1/author/list?page={page}').status_code, 200)
+        self.assertEqual(len(self.rserv.list_cache_keys['author']), 4)
+        self.assertEqual(set(self.rserv.list_cache_keys['author']), set(self.rserv.cache))
+
+    def test_expired_pages_leave_the_key_sets(self):
+        now = [0]
+        self.rserv.cache = self.rserv.ResultCache(maxsize=100, ttl=10, timer=lambda: now[0])
+        self.create('author', {'name': 'Ann'})
+        self.client.get('/api/v1/author/list')
+        now[0] = 20
+        self.rserv.cache_set('author:1', {'id': 1})
+        self.assertNotIn('author', self.rserv.list_cache_keys)
+
+
+class SortIndexPagingTest(ServerTestCase):
+
+    def names(self, query):
+        response = self.client.get(f'/api/v1/author/list?{query}')
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+        return [item.get('name') for item in response.get_json()['items']], response.get_json()
+
+    def test_pages_follow_the_sort_index(self):
+        for name in ('dora', 'bob', 'eve', 'ann', 'carl'):
+            self.create('author', {'name': name})
+
+        page, body = self.names('sort=name:asc&per_page=2&page=2')
+        self.assertEqual(page, ['carl', 'dora'])
+        self.assertEqual((body['total'], body['total_pages']), (5, 3))
+        self.assertEqual(self.names('sort=name:desc&per_page=2&page=1')[0], ['eve', 'dora'])
+        self.assertEqual(self.names('sort=name:desc&per_page=2&page=3')[0], ['ann'])
+        self.assertEqual(self.names('sort=name:asc&per_page=2&page=4')[0], [])
+
+    def test_writes_move_documents_within_the_index(self):
+        for name in ('bob', 'ann', 'carl'):
+            self.create('author', {'name': name})
+        self.assertEqual(self.names('sort=name:asc')[0], ['ann', 'bob', 'carl'])
+
+        self.client.put('/api/v1/author/2', json={'name': 'zed'})
+        self.client.delete('/api/v1/author/1')
+        self.create('author', {'bio': 'no name'})
+        self.create('author', {'name': 'abe'})
+        # Documents without the field sort after all the others, in either direction
+        self.assertEqual(self.names('sort=name:asc')[0], ['abe', 'carl', 'zed', None])
+        self.assertEqual(self.names('sort=name:desc')[0], ['zed', 'carl', 'abe', None])
+        self.assertEqual(self.names('sort=name:desc&per_page=3&page=2')[0], [None])
+        self.assertEqual(self.names('sort=name:desc&per_page=2&page=2')[0], ['abe', None])
+
+    def test_multi_field_sort_puts_missing_fields_last(self):
+        self.create('author', {'name': 'bob'})
+        self.create('author', {'bio': 'no name'})
+        self.create('author', {'name': 'ann'})
+        self.assertEqual(self.names('sort=name:asc,id:asc')[0], ['ann', 'bob', None])
+        self.assertEqual(self.names('sort=name:desc,id:asc')[0], ['bob', 'ann', None])
+
+    def test_unorderable_values_are_not_indexed(self):
+        self.create('author', {'name': 'ann'})
+        self.create('author', {'name': 7})
+        self.assertIsNone(self.rserv.get_sorted_page('author', 'name', False, 0, 10))
+        self.assertNotIn('name', self.rserv.sort_indexes['author'])
+
+        # An index that can no longer order a new value is dropped, not corrupted
+        self.assertEqual(self.rserv.get_sorted_page('author', 'id', False, 0, 10), ([1, 2], 2))
+        self.rserv.update_sort_indexes('author', 3, {'id': 'three'})
+        self.assertNotIn('id', self.rserv.sort_indexes['author'])
+
+
+class IdBlockTest(ServerTestCase):
+
+    def test_ids_continue_across_blocks_and_restarts(self):
+        block = self.rserv.ID_BLOCK_SIZE
+        ids = [self.create('author', {'name': str(n)}) for n in range(block + 2)]
+        self.assertEqual(ids, list(range(1, block + 3)))
+
+        # A clean shutdown hands the unused tail of the block back
+        self.rserv.release_id_blocks()
+        with open(self.rserv.get_id_file('author'), 'rb') as f:
+            self.assertEqual(json.loads(f.read()), block + 2)
+        self.assertEqual(self.create('author', {'name': 'next'}), block + 3)
+
+    def test_processes_get_disjoint_blocks(self):
+        first = self.create('author', {'name': 'a'})
+        other = load_server()
+        try:
+            other_id = other.get_next_id('author')
+            # The tail of this process' block is still reserved, so it can't be handed back
+            self.rserv.release_id_blocks()
+            self.assertEqual(self.create('author', {'name': 'b'}), first + self.rserv.ID_BLOCK_SIZE * 2)
+        finally:
+            other.stop_cleanup()
+            other.release_id_blocks()
+        self.assertEqual(other_id, self.rserv.ID_BLOCK_SIZE + 1)
+
+
+class GraphTestCase(ServerTestCase):
+    config = {'graph_enabled': True}
+
+    def setUp(self):
+        super().setUp()
+        self.create('author', {'name': 'Ann'})
+        self.create('author', {'name': 'Bob'})
+        self.create('city', {'name': 'Oslo'})
+        self.create('book', {'title': 'A', 'author': self.ref('author', 1), 'city': self.ref('city', 1)})
+        self.create('book', {'title': 'B', 'author': self.ref('author', 2)})
+        self.create('book', {'title': 'C', 'author': self.ref('author', 1)})
+
+    def pairs(self, query, **params):
+        result = self.rserv.execute_sulpher_query(query, **params)
+        self.assertIsInstance(result, list, result)
+        return sorted(tuple(row.values()) for row in result)
+
+
+class CSRTraversalTest(GraphTestCase):
+
+    def test_bfs_and_dfs_agree(self):
+        expected = [(('book', 1), ('author', 1)), (('book', 2), ('author', 2)), (('book', 3), ('author', 1))]
+        self.assertEqual(self.pairs('MATCH (b:book)-[:author]->(a:author) RETURN b, a'), expected)
+        self.assertEqual(self.pairs('DFS MATCH (b:book)-[:author]->(a:author) RETURN b, a'), expected)
+
+    def test_multi_hop_through_reverse_edges(self):
+        co_written = self.pairs('MATCH (b:book)-[:author]->(a:author)-[:reverse_author]->(c:book) RETURN b, c')
+        self.assertEqual(co_written, [(('book', 1), ('book', 1)), (('book', 1), ('book', 3)), (('book', 2), ('book', 2)),
+                                      (('book', 3), ('book', 1)), (('book', 3), ('book', 3))])
+        self.assertEqual(self.pairs('MATCH (b:book)-[:city]->(c:city) RETURN b'), [(('book', 1),)])
+
+    def test_traversals_see_later_writes(self):
+        query = 'MATCH (b:book)-[:city]->(c:city) RETURN b'
+        self.assertEqual(self.pairs(query), [(('book', 1),)])
+        view = self.rserv.get_csr_view()
+        self.client.put('/api/v1/book/2', json={'title': 'B', 'author': self.ref('author', 2), 'city': self.ref('city', 1)})
+        self.client.delete('/api/v1/book/1')
+        self.assertEqual(self.pairs(query), [(('book', 2),)])
+        self.assertIsNot(self.rserv.get_csr_view(), view)
+
+    def test_nodes_of_type(self):
+        csr = self.rserv.get_csr_view()
+        self.assertEqual(sorted(csr.nodes_of_type('book')), [('book', 1), ('book', 2), ('book', 3)])
+        self.assertEqual(csr.nodes_of_type('nothing'), [])
+
+
+class ParamBindingTest(GraphTestCase):
+
+    def test_params_bind_into_where(self):
+        query = 'MATCH (b:book)-[:author]->(a:author) WHERE id(a) = $id RETURN b'
+        self.assertEqual(self.pairs(query, id='author:1'), [(('book', 1),), (('book', 3),)])
+        self.assertEqual(self.pairs(query, id='author:2'), [(('book', 2),)])
+        # The plan is shared between both runs and was not altered by them
+        plan = self.rserv.compile_sulpher(query)
+        self.assertTrue(plan['has_params'])
+        self.assertIsInstance(plan['where'][0]['value'], self.rserv.QueryParam)
+
+    def test_missing_param_fails_the_query(self):
+        result = self.rserv.execute_sulpher_query('MATCH (a:author) WHERE id(a) = $id RETURN a')
+        self.assertEqual(result, 'Missing query parameter: id')
+
+    def test_values_cannot_change_the_query(self):
+        response = self.client.get("/api/v1/graph/nodes/author:1' RETURN b")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get('/api/v1/graph/nodes/author:1').get_json()['data'], ['author', 1])
+
+    def test_endpoint_templates_validate_their_numbers(self):
+        body = {'start_node_id': 'book:1', 'end_node_id': 'author:1', 'max_depth': '2]-(x'}
+        response = self.client.post('/api/v1/graph/pathExists', json=body)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['error']['message'], 'max_depth must be an integer')
+
+
+class CacheKeyPatternTest(ServerTestCase):
+
+    def test_patterns_cover_only_rserv_keys(self):
+        self.assertEqual(self.rserv.cache_key_patterns(), ['query:*'])
+        self.create('author', {'name': 'Ann'})
+        self.create('book', {'title': 'T'})
+        patterns = self.rserv.cache_key_patterns()
+        self.assertEqual(sorted(patterns), ['author:*', 'book:*', 'query:*'])
+
+
+if __name__ == '__main__':
+    unittest.main()